@@ -1,14 +1,24 @@
 from decimal import Decimal
 from PyQt6.QtWidgets import *
-from PyQt6.QtCore import Qt, QDate
+from PyQt6.QtCore import Qt, QDate, pyqtSignal
 from PyQt6.QtGui import QFont, QColor
 from database import Database
 from models import Product, Customer, StaffManagement, Transaction
 from datetime import datetime
 from models import ReportGenerator
+from catalog_store import get_catalog_store
+from auth import get_authenticator
+from product_import import ProductImporter
+from bulk_refunds import BulkRefundEngine
+from query_log import query_log
+from inventory_alerts import get_alert_monitor
+from forecasting import ReorderForecaster
+from data_lifecycle import SoftDeleteArchiver, TransactionArchiver, RETENTION_DAYS, ARCHIVE_AFTER_MONTHS
 from PyQt6.QtWidgets import QHeaderView
 
 class AdminWindow(QMainWindow):
+    HISTORY_PAGE_SIZE = 50
+    
     def __init__(self, db: Database, user):
         super().__init__()
         self.db = db
@@ -17,11 +27,17 @@ class AdminWindow(QMainWindow):
         self.customer_model = Customer(db)
         self.staff_model = StaffManagement(db)
         self.transaction_model = Transaction(db)
+        self.catalog = get_catalog_store(db)
+        self.alert_monitor = get_alert_monitor(db)
         
         self.setWindowTitle(f"TechHaven - Admin Dashboard ({user['full_name']})")
         self.setMinimumSize(1280, 650)
         self.setup_ui()
         self.apply_styles()
+        self.catalog.products_changed.connect(self.on_catalog_changed)
+        self.catalog.products_reset.connect(self.on_catalog_changed)
+        self.alert_monitor.alerts_raised.connect(self.on_alerts_raised)
+        self.alert_monitor.alerts_resolved.connect(self.refresh_alerts)
     
     def setup_ui(self):
         central_widget = QWidget()
@@ -113,9 +129,9 @@ class AdminWindow(QMainWindow):
         
         # Get statistics
         daily_sales = self.transaction_model.get_daily_sales()
-        products = self.product_model.get_all_products()
+        products = self.catalog.products()
         customers = self.customer_model.get_all_customers()
-        low_stock = self.product_model.get_low_stock_products()
+        low_stock = self.catalog.low_stock_products()
         
         stats = [
             ("💰 Today's Sales", f"${daily_sales[1] or 0:.2f}", f"{daily_sales[0] or 0} transactions", "#4CAF50"),
@@ -129,31 +145,45 @@ class AdminWindow(QMainWindow):
         
         layout.addLayout(stats_layout)
         
-        # Low stock alerts
-        if low_stock:
-            alert_label = QLabel("⚠️ Low Stock Alerts")
-            alert_label.setFont(QFont("Arial", 16, QFont.Weight.Bold))
-            alert_label.setStyleSheet("color: #f44336;")
-            layout.addWidget(alert_label)
-            
-            alert_table = QTableWidget()
-            alert_table.setColumnCount(4)
-            alert_table.setHorizontalHeaderLabels(["Product", "Current Stock", "Threshold", "Action Needed"])
-            alert_table.setRowCount(len(low_stock))
-            
-            for row, product in enumerate(low_stock):
-                alert_table.setItem(row, 0, QTableWidgetItem(product[1]))
-                alert_table.setItem(row, 1, QTableWidgetItem(str(product[4])))
-                alert_table.setItem(row, 2, QTableWidgetItem(str(product[6])))
-                alert_table.setItem(row, 3, QTableWidgetItem("⚠️ Restock Required"))
-            
-            alert_table.horizontalHeader().setStretchLastSection(True)
-            alert_table.setMaximumHeight(300)
-            layout.addWidget(alert_table)
+        # Low stock alerts (open rows of inventory_alerts, pushed by the alert monitor)
+        self.alert_label = QLabel("⚠️ Low Stock Alerts")
+        self.alert_label.setFont(QFont("Arial", 16, QFont.Weight.Bold))
+        self.alert_label.setStyleSheet("color: #f44336;")
+        layout.addWidget(self.alert_label)
+        
+        self.alert_table = QTableWidget()
+        self.alert_table.setColumnCount(5)
+        self.alert_table.setHorizontalHeaderLabels(["Product", "Stock", "Threshold", "Since", "Action Needed"])
+        self.alert_table.horizontalHeader().setStretchLastSection(True)
+        self.alert_table.setMaximumHeight(300)
+        layout.addWidget(self.alert_table)
+        self.refresh_alerts()
         
         layout.addStretch()
         return page
     
+    def refresh_alerts(self, product_ids=None):
+        alerts = self.alert_monitor.open_alerts()
+        self.alert_table.setRowCount(len(alerts))
+        for row, alert in enumerate(alerts):
+            action = "⛔ Out of Stock" if alert.alert_type == "out_of_stock" else "⚠️ Restock Required"
+            if alert.acknowledged_at:
+                action += " (acknowledged)"
+            self.alert_table.setItem(row, 0, QTableWidgetItem(alert.product_name))
+            self.alert_table.setItem(row, 1, QTableWidgetItem(str(alert.stock_level)))
+            self.alert_table.setItem(row, 2, QTableWidgetItem(str(alert.threshold)))
+            self.alert_table.setItem(row, 3, QTableWidgetItem(alert.created_at.strftime("%Y-%m-%d %H:%M")))
+            self.alert_table.setItem(row, 4, QTableWidgetItem(action))
+        self.alert_label.setVisible(bool(alerts))
+        self.alert_table.setVisible(bool(alerts))
+    
+    def on_alerts_raised(self, alerts):
+        names = ", ".join(alert.product_name or f"#{alert.product_id}" for alert in alerts[:3])
+        if len(alerts) > 3:
+            names += f" and {len(alerts) - 3} more"
+        self.statusBar().showMessage(f"⚠️ Stock alert: {names}", 10000)
+        self.refresh_alerts()
+    
     def refresh_dashboard(self):
         new_dashboard = self.create_dashboard_page()
         self.stack.removeWidget(self.stack.widget(0))  # Remove old dashboard
@@ -210,10 +240,22 @@ class AdminWindow(QMainWindow):
         add_btn.clicked.connect(self.add_product)
         header_layout.addWidget(add_btn)
         
+        import_btn = QPushButton("📥 Import")
+        import_btn.setFont(QFont("Arial", 11, QFont.Weight.Bold))
+        import_btn.setCursor(Qt.CursorShape.PointingHandCursor)
+        import_btn.clicked.connect(self.import_products)
+        header_layout.addWidget(import_btn)
+        
+        recall_btn = QPushButton("⚠️ Recall")
+        recall_btn.setFont(QFont("Arial", 11, QFont.Weight.Bold))
+        recall_btn.setCursor(Qt.CursorShape.PointingHandCursor)
+        recall_btn.clicked.connect(self.recall_product)
+        header_layout.addWidget(recall_btn)
+        
         refresh_btn = QPushButton("🔄 Refresh")
         refresh_btn.setFont(QFont("Arial", 11, QFont.Weight.Bold))
         refresh_btn.setCursor(Qt.CursorShape.PointingHandCursor)
-        refresh_btn.clicked.connect(self.refresh_products)
+        refresh_btn.clicked.connect(self.reload_products)
         header_layout.addWidget(refresh_btn)
 
         view_deleted_btn = QPushButton("🗑️ View Deleted")
@@ -240,8 +282,26 @@ class AdminWindow(QMainWindow):
         self.refresh_products()
         return page
     
+    def reload_products(self):
+        """Force a full re-read of the shared catalog (Refresh button)"""
+        self.catalog.reload()
+
+    def on_catalog_changed(self, product_ids=None):
+        self.refresh_products()
+
+    def closeEvent(self, event):
+        # Stop listening to the shared catalog once this window is gone
+        try:
+            self.catalog.products_changed.disconnect(self.on_catalog_changed)
+            self.catalog.products_reset.disconnect(self.on_catalog_changed)
+            self.alert_monitor.alerts_raised.disconnect(self.on_alerts_raised)
+            self.alert_monitor.alerts_resolved.disconnect(self.refresh_alerts)
+        except TypeError:
+            pass
+        super().closeEvent(event)
+
     def refresh_products(self):
-        products = self.product_model.get_all_products()
+        products = self.catalog.products()
         self.products_table.setRowCount(len(products))
         
         # Set row height to accommodate larger buttons
@@ -321,8 +381,111 @@ class AdminWindow(QMainWindow):
     
     def add_product(self):
         dialog = ProductDialog(self.db, self)
-        if dialog.exec():
-            self.refresh_products()
+        dialog.exec()
+
+    def import_products(self):
+        """Bulk add/update products from a supplier CSV or JSONL file (matched by SKU)"""
+        path, _ = QFileDialog.getOpenFileName(
+            self, "Import Products", "",
+            "Product files (*.csv *.jsonl *.ndjson);;All Files (*)"
+        )
+        if not path:
+            return
+        
+        progress_dialog = QProgressDialog("Importing products...", "Cancel", 0, 100, self)
+        progress_dialog.setWindowTitle("Import Products")
+        progress_dialog.setWindowModality(Qt.WindowModality.WindowModal)
+        progress_dialog.setMinimumDuration(0)
+        
+        def on_progress(done, total):
+            progress_dialog.setMaximum(total)
+            progress_dialog.setValue(done)
+            QApplication.processEvents()
+            return not progress_dialog.wasCanceled()
+        
+        try:
+            report = ProductImporter(self.db).import_file(path, progress=on_progress)
+        except (OSError, UnicodeDecodeError) as e:
+            progress_dialog.close()
+            QMessageBox.critical(self, "Import Failed", f"Could not read file:\n{e}")
+            return
+        progress_dialog.close()
+        
+        message = report.summary()
+        if report.errors:
+            shown = "\n".join(f"Line {err.line} ({err.sku or '-'}): {err.message}"
+                              for err in report.errors[:20])
+            more = f"\n... and {len(report.errors) - 20} more" if len(report.errors) > 20 else ""
+            message += f"\n\nErrors:\n{shown}{more}"
+            QMessageBox.warning(self, "Import Finished With Errors", message)
+        else:
+            QMessageBox.information(self, "Import Complete", message)
+        self.refresh_dashboard()
+
+    def recall_product(self):
+        """Refund every outstanding sale of one product (resumes interrupted recalls first)"""
+        engine = BulkRefundEngine(self.db)
+        
+        unfinished = engine.get_unfinished_jobs()
+        if unfinished:
+            job = unfinished[0]
+            reply = QMessageBox.question(
+                self, "Resume Recall",
+                f"Recall job #{job.job_id} for product #{job.product_id} was interrupted "
+                f"after {job.refunded_transactions} transactions.\n\nResume it now?",
+                QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No
+            )
+            if reply == QMessageBox.StandardButton.Yes:
+                self.run_recall_job(engine, job.job_id)
+                return
+        
+        product_id, ok = QInputDialog.getInt(self, "Product Recall", "Product ID to recall:", 1, 1)
+        if not ok:
+            return
+        product = self.product_model.get_product(product_id)
+        if not product:
+            QMessageBox.warning(self, "Not Found", "Product not found.")
+            return
+        
+        transactions, units, subtotal = engine.preview(product_id)
+        if not transactions:
+            QMessageBox.information(self, "Product Recall", f"No refundable sales of '{product[1]}'.")
+            return
+        
+        reason, ok = QInputDialog.getText(
+            self, "Product Recall",
+            f"Refund {units} units of '{product[1]}' across {transactions} transactions "
+            f"(${subtotal:,.2f} + tax).\n\nRecall reason:"
+        )
+        if not ok or not reason.strip():
+            return
+        
+        job_id = engine.start_recall(product_id, reason.strip(), self.user['user_id'])
+        self.run_recall_job(engine, job_id, transactions)
+    
+    def run_recall_job(self, engine, job_id, expected=0):
+        progress_dialog = QProgressDialog("Processing recall refunds...", "Pause", 0, expected or 0, self)
+        progress_dialog.setWindowTitle("Product Recall")
+        progress_dialog.setWindowModality(Qt.WindowModality.WindowModal)
+        progress_dialog.setMinimumDuration(0)
+        
+        def on_progress(report):
+            if expected:
+                progress_dialog.setValue(min(report.transactions, expected))
+            progress_dialog.setLabelText(report.summary())
+            QApplication.processEvents()
+            return not progress_dialog.wasCanceled()
+        
+        try:
+            report = engine.run(job_id, progress=on_progress)
+        except Exception as e:
+            progress_dialog.close()
+            QMessageBox.critical(self, "Recall Failed",
+                                 f"Recall stopped: {e}\n\nCompleted chunks were saved; it can be resumed.")
+            return
+        progress_dialog.close()
+        QMessageBox.information(self, "Product Recall", report.summary())
+        self.refresh_dashboard()
 
     def view_deleted_products(self):
         dialog = DeletedRecordsDialog(
@@ -331,13 +494,11 @@ class AdminWindow(QMainWindow):
             record_type="products",
             title="Deleted Products"
         )
-        if dialog.exec():
-            self.refresh_products()
+        dialog.exec()
     
     def edit_product(self, product):
         dialog = ProductDialog(self.db, self, product)
-        if dialog.exec():
-            self.refresh_products()
+        dialog.exec()
     
     def delete_product(self, product_id):
         reply = QMessageBox.question(
@@ -352,7 +513,6 @@ class AdminWindow(QMainWindow):
         if reply == QMessageBox.StandardButton.Yes:
             success, message = self.product_model.delete_product(product_id)
             if success:
-                self.refresh_products()
                 QMessageBox.information(self, "Success", message)
             else:
                 QMessageBox.critical(self, "Error", message)
@@ -546,17 +706,23 @@ class AdminWindow(QMainWindow):
             self.refresh_customers()
     
     def view_customer_history(self, customer_id):
-        history = self.customer_model.get_customer_history(customer_id)
+        stats = self.customer_model.get_order_stats(customer_id)
         dialog = QDialog(self)
         dialog.setWindowTitle("Customer Purchase History")
         dialog.setMinimumSize(900, 500)
 
         layout = QVBoxLayout(dialog)
 
+        # Lifetime summary from the cached aggregates
+        last_purchase = stats.last_purchase_at.strftime("%Y-%m-%d %H:%M") if stats.last_purchase_at else "—"
+        summary = QLabel(f"<b>Orders:</b> {stats.order_count} &nbsp;&nbsp; "
+                         f"<b>Lifetime Value:</b> ${stats.lifetime_value:,.2f} &nbsp;&nbsp; "
+                         f"<b>Last Purchase:</b> {last_purchase}")
+        layout.addWidget(summary)
+
         table = QTableWidget()
         table.setColumnCount(5)
         table.setHorizontalHeaderLabels(["Transaction ID", "Date", "Total", "Payment Method", "Staff"])
-        table.setRowCount(len(history))
 
         # ---- FIX CUT TEXT (ROW HEIGHT + WORD WRAP + AUTO RESIZE) ----
         from PyQt6.QtWidgets import QHeaderView
@@ -570,22 +736,33 @@ class AdminWindow(QMainWindow):
             }
         """)
 
-        # Fill rows safely
-        for row, trans in enumerate(history):
-            transaction_id = str(trans[0])
-            date = trans[1].strftime("%Y-%m-%d %H:%M:%S") if trans[1] else ""
-            total = f"${trans[2]:.2f}"
-            payment_method = trans[3] if trans[3] else "N/A"
-            staff_name = trans[4] if trans[4] else "SELF-Checkout"
-
-            table.setItem(row, 0, QTableWidgetItem(transaction_id))
-            table.setItem(row, 1, QTableWidgetItem(date))
-            table.setItem(row, 2, QTableWidgetItem(total))
-            table.setItem(row, 3, QTableWidgetItem(payment_method))
-            table.setItem(row, 4, QTableWidgetItem(staff_name))
+        layout.addWidget(table)
 
+        load_more_btn = QPushButton("Load More")
+        layout.addWidget(load_more_btn)
+        last = None  # keyset cursor: last row of the previous page
 
-        layout.addWidget(table)
+        def load_more():
+            nonlocal last
+            history = self.customer_model.get_customer_history(
+                customer_id, limit=self.HISTORY_PAGE_SIZE, before=last
+            )
+            # Fill rows safely
+            for trans in history:
+                row = table.rowCount()
+                table.insertRow(row)
+                date = trans.transaction_date.strftime("%Y-%m-%d %H:%M:%S") if trans.transaction_date else ""
+                table.setItem(row, 0, QTableWidgetItem(str(trans.transaction_id)))
+                table.setItem(row, 1, QTableWidgetItem(date))
+                table.setItem(row, 2, QTableWidgetItem(f"${trans.total_amount:.2f}"))
+                table.setItem(row, 3, QTableWidgetItem(trans.payment_method or "N/A"))
+                table.setItem(row, 4, QTableWidgetItem(trans.staff_name or "SELF-Checkout"))
+            if history:
+                last = history[-1]
+            load_more_btn.setVisible(len(history) == self.HISTORY_PAGE_SIZE)
+
+        load_more_btn.clicked.connect(load_more)
+        load_more()
 
         close_btn = QPushButton("Close")
         close_btn.clicked.connect(dialog.accept)
@@ -879,6 +1056,27 @@ class AdminWindow(QMainWindow):
         inventory_btn.setMinimumHeight(80)
         layout.addWidget(inventory_btn)
 
+        # GREY – Database query performance (top statements + slow-query log)
+        queries_btn = create_color_button(
+            "Query Performance", "⏱️",
+            "#546E7A", "#455A64", self.show_query_report
+        )
+        layout.addWidget(queries_btn)
+
+        # TEAL – Reorder suggestions from sales velocity
+        reorder_btn = create_color_button(
+            "Reorder Suggestions", "🔮",
+            "#00897B", "#00796B", self.show_reorder_suggestions
+        )
+        layout.addWidget(reorder_btn)
+
+        # BROWN – Move closed months of sales to the archive tables
+        archive_btn = create_color_button(
+            f"Archive Sales Older Than {ARCHIVE_AFTER_MONTHS} Months", "🗄️",
+            "#6D4C41", "#5D4037", self.archive_old_transactions
+        )
+        layout.addWidget(archive_btn)
+
         layout.addStretch()
         return page
 
@@ -950,6 +1148,98 @@ class AdminWindow(QMainWindow):
 
         QMessageBox.information(self, "Inventory Report", msg)
     
+    def show_reorder_suggestions(self):
+        """Days of cover and suggested reorder quantities per product"""
+        QApplication.setOverrideCursor(Qt.CursorShape.WaitCursor)
+        try:
+            forecast = ReorderForecaster(self.db).forecast()
+        finally:
+            QApplication.restoreOverrideCursor()
+
+        dialog = QDialog(self)
+        dialog.setWindowTitle("Reorder Suggestions")
+        dialog.setMinimumSize(900, 550)
+        layout = QVBoxLayout(dialog)
+
+        to_order = sum(1 for s in forecast if s.reorder_qty > 0)
+        summary = QLabel(f"{to_order} of {len(forecast)} products should be reordered now")
+        summary.setFont(QFont("Arial", 12, QFont.Weight.Bold))
+        layout.addWidget(summary)
+
+        table = QTableWidget(len(forecast), 6)
+        table.setHorizontalHeaderLabels(["Product", "Stock", "Sold / Day", "Days of Cover",
+                                         "Reorder Point", "Suggested Order"])
+        table.setEditTriggers(QTableWidget.EditTrigger.NoEditTriggers)
+        for row, suggestion in enumerate(forecast):
+            cover = "—" if suggestion.days_of_cover is None else f"{suggestion.days_of_cover:.1f}"
+            values = [suggestion.name, str(suggestion.stock), f"{suggestion.daily_velocity:.2f}", cover,
+                      str(suggestion.reorder_point), str(suggestion.reorder_qty or "")]
+            for column, value in enumerate(values):
+                item = QTableWidgetItem(value)
+                if suggestion.reorder_qty > 0:
+                    item.setForeground(QColor("#E65100"))
+                table.setItem(row, column, item)
+        table.horizontalHeader().setSectionResizeMode(0, QHeaderView.ResizeMode.Stretch)
+        layout.addWidget(table)
+
+        close_btn = QPushButton("Close")
+        close_btn.clicked.connect(dialog.accept)
+        layout.addWidget(close_btn, alignment=Qt.AlignmentFlag.AlignRight)
+        dialog.exec()
+    
+    def archive_old_transactions(self):
+        """Move sales older than the archive horizon to transactions_archive"""
+        archiver = TransactionArchiver(self.db)
+        reply = QMessageBox.question(
+            self, "Archive Sales",
+            f"Move sales made before {archiver.cutoff():%Y-%m-%d} to the archive tables?\n"
+            "They stay available to reports, receipt lookups and order history.",
+            QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No
+        )
+        if reply != QMessageBox.StandardButton.Yes:
+            return
+        QApplication.setOverrideCursor(Qt.CursorShape.WaitCursor)
+        try:
+            report = archiver.run()
+        finally:
+            QApplication.restoreOverrideCursor()
+        QMessageBox.information(self, "Archive Sales", report.summary())
+    
+    def show_query_report(self):
+        """Top statements by total time since start-up, with export to JSON/text"""
+        dialog = QDialog(self)
+        dialog.setWindowTitle("Query Performance")
+        dialog.setMinimumSize(1000, 600)
+        layout = QVBoxLayout(dialog)
+
+        text = QTextEdit()
+        text.setReadOnly(True)
+        text.setFont(QFont("Courier New", 9))
+        slow = len(query_log.slow_queries)
+        text.setPlainText(f"{query_log.report(30)}\n\n{slow} slow queries logged")
+        layout.addWidget(text)
+
+        buttons = QHBoxLayout()
+        export_btn = QPushButton("💾 Export...")
+        close_btn = QPushButton("Close")
+        buttons.addWidget(export_btn)
+        buttons.addStretch()
+        buttons.addWidget(close_btn)
+        layout.addLayout(buttons)
+
+        def export():
+            path, _ = QFileDialog.getSaveFileName(
+                dialog, "Export Query Report", f"query_report_{datetime.now():%Y%m%d_%H%M%S}.json",
+                "JSON (*.json);;Text (*.txt)"
+            )
+            if path:
+                query_log.dump(path)
+                QMessageBox.information(dialog, "Exported", f"Query report saved to:\n{path}")
+
+        export_btn.clicked.connect(export)
+        close_btn.clicked.connect(dialog.accept)
+        dialog.exec()
+
     def generate_report(self):
         start = self.start_date.date().toString("yyyy-MM-dd")
         end = self.end_date.date().toString("yyyy-MM-dd")
@@ -1113,7 +1403,6 @@ class ProductDialog(QDialog):
             self.product_model.add_product(name, desc, price, stock, category, threshold)
             QMessageBox.information(self, "Success", "Product added successfully!")
         
-        self.parent().refresh_products()
         self.parent().refresh_dashboard() 
         self.accept()
 
@@ -1229,6 +1518,9 @@ class CustomerDialog(QDialog):
 
 
 class StaffDialog(QDialog):
+    # Carries the Future of add_staff (it hashes the password) back to the Qt thread
+    save_finished = pyqtSignal(object)
+
     def __init__(self, db, parent):
         super().__init__(parent)
         self.db = db
@@ -1236,6 +1528,7 @@ class StaffDialog(QDialog):
         
         self.setWindowTitle("Add Staff Member")
         self.setMinimumSize(400, 350)
+        self.save_finished.connect(self.on_save_finished)
         self.setup_ui()
     
     def setup_ui(self):
@@ -1263,9 +1556,9 @@ class StaffDialog(QDialog):
         
         # Buttons
         button_layout = QHBoxLayout()
-        save_btn = QPushButton("Add Staff")
-        save_btn.clicked.connect(self.save)
-        button_layout.addWidget(save_btn)
+        self.save_btn = QPushButton("Add Staff")
+        self.save_btn.clicked.connect(self.save)
+        button_layout.addWidget(self.save_btn)
         
         cancel_btn = QPushButton("Cancel")
         cancel_btn.clicked.connect(self.reject)
@@ -1292,14 +1585,24 @@ class StaffDialog(QDialog):
             QMessageBox.warning(self, "Error", "Full name and email are required!")
             return
 
-        # Add staff member using the correct method
-        success, message = self.staff_model.add_staff(
+        # Add staff member on the auth worker pool (password hashing is slow)
+        self.save_btn.setEnabled(False)
+        future = get_authenticator(self.db).run(
+            self.staff_model.add_staff,
             username,
             password,
             name,
             email,
             role
         )
+        future.add_done_callback(self.save_finished.emit)
+
+    def on_save_finished(self, future):
+        self.save_btn.setEnabled(True)
+        try:
+            success, message = future.result()
+        except Exception as e:
+            success, message = False, str(e)
 
         if success:
             QMessageBox.information(self, "Success", "Staff member added successfully!")
@@ -1362,6 +1665,23 @@ class DeletedRecordsDialog(QDialog):
         restore_btn.clicked.connect(self.restore_selected)
         button_layout.addWidget(restore_btn)
         
+        archive_btn = QPushButton(f"📦 Archive Deleted > {RETENTION_DAYS} Days")
+        archive_btn.setMinimumHeight(45)
+        archive_btn.setFont(QFont("Arial", 11, QFont.Weight.Bold))
+        archive_btn.setStyleSheet("""
+            QPushButton {
+                background-color: #FF9800;
+                color: white;
+                border-radius: 8px;
+                padding: 10px 20px;
+            }
+            QPushButton:hover {
+                background-color: #F57C00;
+            }
+        """)
+        archive_btn.clicked.connect(self.archive_old_records)
+        button_layout.addWidget(archive_btn)
+        
         close_btn = QPushButton("Close")
         close_btn.setMinimumHeight(45)
         close_btn.setFont(QFont("Arial", 11, QFont.Weight.Bold))
@@ -1466,6 +1786,21 @@ class DeletedRecordsDialog(QDialog):
             no_data.setForeground(QColor("#999"))
             self.table.setItem(0, 0, no_data)
     
+    def archive_old_records(self):
+        """Move long-deleted, unreferenced rows of this type to the archive table"""
+        table = {"products": "products", "customers": "customers", "staff": "users"}[self.record_type]
+        reply = QMessageBox.question(
+            self, "Archive Records",
+            f"Move {self.record_type} deleted more than {RETENTION_DAYS} days ago to the archive?\n"
+            "Archived records can no longer be restored from this dialog.",
+            QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No
+        )
+        if reply != QMessageBox.StandardButton.Yes:
+            return
+        report = SoftDeleteArchiver(self.db).run([table])
+        QMessageBox.information(self, "Archive", report.summary())
+        self.load_deleted_records()
+    
     def restore_selected(self):
         selected = self.table.selectedItems()
         if not selected:
@@ -1516,6 +1851,9 @@ class DeletedRecordsDialog(QDialog):
             QMessageBox.critical(self, "Error", message)
 
 class StaffEditDialog(QDialog):
+    # Carries the Future of update_staff (it may hash a password) back to the Qt thread
+    save_finished = pyqtSignal(object)
+
     def __init__(self, db, parent, staff_member):
         super().__init__(parent)
         self.db = db
@@ -1524,6 +1862,7 @@ class StaffEditDialog(QDialog):
         
         self.setWindowTitle("Edit Staff Member")
         self.setMinimumSize(400, 300)
+        self.save_finished.connect(self.on_save_finished)
         self.setup_ui()
     
     def setup_ui(self):
@@ -1574,6 +1913,7 @@ class StaffEditDialog(QDialog):
         """)
         save_btn.clicked.connect(self.save)
         button_layout.addWidget(save_btn)
+        self.save_btn = save_btn
         
         cancel_btn = QPushButton("Cancel")
         cancel_btn.setStyleSheet("""
@@ -1608,30 +1948,23 @@ class StaffEditDialog(QDialog):
             QMessageBox.warning(self, "Error", "New password must be at least 6 characters!")
             return
         
+        # Basic info + optional new password, on the auth worker pool (hashing is slow)
+        self.save_btn.setEnabled(False)
+        future = get_authenticator(self.db).run(
+            self.staff_model.update_staff, self.staff_member[0], name, email, role, new_password or None)
+        future.add_done_callback(self.save_finished.emit)
+    
+    def on_save_finished(self, future):
+        self.save_btn.setEnabled(True)
         try:
-            conn = self.db.get_connection()
-            cursor = conn.cursor()
-            
-            # Update basic info
-            cursor.execute("""
-                UPDATE users 
-                SET full_name=%s, email=%s, role=%s
-                WHERE user_id=%s
-            """, (name, email, role, self.staff_member[0]))
-            
-            # Update password if provided
-            if new_password:
-                hashed_password = self.db.hash_password(new_password)
-                cursor.execute("""
-                    UPDATE users 
-                    SET password=%s
-                    WHERE user_id=%s
-                """, (hashed_password, self.staff_member[0]))
-            
-            conn.commit()
-            conn.close()
-            
+            success, message = future.result()
+        except Exception as e:
+            success, message = False, str(e)
+        if success:
+            if self.new_password_input.text().strip():
+                # The old password must not keep working from the verified-login cache
+                get_authenticator(self.db).forget(self.staff_member[1])
             QMessageBox.information(self, "Success", "Staff member updated successfully!")
             self.accept()
-        except Exception as e:
-            QMessageBox.critical(self, "Error", f"Update failed: {str(e)}")
+        else:
+            QMessageBox.critical(self, "Error", f"Update failed: {message}")
@@ -0,0 +1,271 @@
+import base64
+import hashlib
+import hmac
+import os
+import secrets
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# =============================================================================
+# AUTHENTICATION
+# Passwords are stored as scrypt hashes ("scrypt$N$r$p$salt$hash"); the cost
+# is tunable through TECHHAVEN_SCRYPT_N. Legacy unsalted SHA-256 rows still
+# verify and are rehashed transparently on the next successful login, as are
+# scrypt rows hashed with older parameters. Verification runs on a small
+# worker pool (hashlib releases the GIL while deriving), so the Qt thread
+# never waits on the KDF. Failed attempts are throttled per username and per
+# client (the till, identified by host name) with in-memory token buckets:
+# a failure costs a token from both, a success costs nothing and refills the
+# username's bucket. A verified login is remembered for a few
+# minutes so re-entering the same password (e.g. to change it) skips the KDF.
+# =============================================================================
+SCRYPT_N = int(os.environ.get("TECHHAVEN_SCRYPT_N", str(2 ** 14)))
+SCRYPT_R = 8
+SCRYPT_P = 1
+SCRYPT_DKLEN = 32
+SALT_BYTES = 16
+
+ATTEMPT_BURST = 5              # attempts per username allowed back to back...
+ATTEMPT_REFILL_SECONDS = 30.0  # ...then one more every 30 s
+CLIENT_ATTEMPT_BURST = 20      # a till is shared, so its own bucket is larger
+LOCAL_CLIENT = socket.gethostname() or "local"
+VERIFIED_CACHE_SECONDS = 300
+AUTH_WORKERS = 2
+
+_LEGACY_LENGTH = 64  # hex SHA-256
+
+
+def _b64(raw):
+    return base64.b64encode(raw).decode("ascii")
+
+
+def _derive(password, salt, n, r, p, dklen=SCRYPT_DKLEN):
+    return hashlib.scrypt(password.encode("utf-8"), salt=salt, n=n, r=r, p=p,
+                          maxmem=128 * n * r * p + 1024 * 1024, dklen=dklen)
+
+
+def hash_password(password):
+    """scrypt hash of a password with a fresh salt, in the stored string format"""
+    salt = secrets.token_bytes(SALT_BYTES)
+    derived = _derive(password, salt, SCRYPT_N, SCRYPT_R, SCRYPT_P)
+    return f"scrypt${SCRYPT_N}${SCRYPT_R}${SCRYPT_P}${_b64(salt)}${_b64(derived)}"
+
+
+def verify_password(password, stored):
+    """Returns (matches, needs_rehash) for a stored hash in either format"""
+    if not stored:
+        return False, False
+    if stored.startswith("scrypt$"):
+        try:
+            _, n, r, p, salt, expected = stored.split("$")
+            n, r, p = int(n), int(r), int(p)
+            expected = base64.b64decode(expected)
+            derived = _derive(password, base64.b64decode(salt), n, r, p, len(expected))
+        except (ValueError, TypeError):
+            return False, False
+        matches = hmac.compare_digest(derived, expected)
+        return matches, matches and (n, r, p) != (SCRYPT_N, SCRYPT_R, SCRYPT_P)
+    if len(stored) == _LEGACY_LENGTH:
+        legacy = hashlib.sha256(password.encode("utf-8")).hexdigest()
+        matches = hmac.compare_digest(legacy, stored)
+        return matches, matches
+    return False, False
+
+
+# Verified against when the username does not exist, so both cases take as long
+_dummy_hash = None
+
+
+def _verify_dummy(password):
+    global _dummy_hash
+    if _dummy_hash is None:
+        _dummy_hash = hash_password(secrets.token_hex(8))
+    verify_password(password, _dummy_hash)
+
+
+# ---------------------------------------------------
+# Throttling
+# ---------------------------------------------------
+class TokenBucket:
+    def __init__(self, capacity, refill_seconds):
+        self.capacity = capacity
+        self.refill_seconds = refill_seconds
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) / self.refill_seconds)
+        self.updated = now
+
+    def wait(self):
+        """Seconds until a token is available (0 = available now); consumes nothing"""
+        self._refill(time.monotonic())
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) * self.refill_seconds
+
+    def take(self):
+        """Consume one token if there is one"""
+        self._refill(time.monotonic())
+        self.tokens = max(0.0, self.tokens - 1)
+
+    @property
+    def full(self):
+        self._refill(time.monotonic())
+        return self.tokens >= self.capacity
+
+
+class AttemptLimiter:
+    """Token bucket per key (a username or a client)"""
+
+    def __init__(self, capacity=ATTEMPT_BURST, refill_seconds=ATTEMPT_REFILL_SECONDS):
+        self.capacity = capacity
+        self.refill_seconds = refill_seconds
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def wait(self, key):
+        """Seconds until `key` may try again (0 = allowed); consumes nothing"""
+        with self._lock:
+            bucket = self._buckets.get(key)
+            return bucket.wait() if bucket is not None else 0.0
+
+    def charge(self, key):
+        """Take a token from `key`'s bucket (a failed attempt)"""
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = TokenBucket(self.capacity, self.refill_seconds)
+            bucket.take()
+            # Drop buckets that have fully recovered so the dict stays small
+            if len(self._buckets) > 1000:
+                self._buckets = {k: b for k, b in self._buckets.items() if not b.full}
+
+    def reset(self, key):
+        with self._lock:
+            self._buckets.pop(key, None)
+
+
+# ---------------------------------------------------
+# Authenticator
+# ---------------------------------------------------
+class AuthResult:
+    def __init__(self, user=None, message=""):
+        self.user = user
+        self.message = message
+
+    def __bool__(self):
+        return self.user is not None
+
+
+class Authenticator:
+    def __init__(self, db, workers=AUTH_WORKERS):
+        self.db = db
+        self.user_attempts = AttemptLimiter()
+        self.client_attempts = AttemptLimiter(CLIENT_ATTEMPT_BURST)
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="auth")
+        # username -> (stored hash, keyed digest of the password, verified at)
+        self._verified = {}
+        self._cache_key = secrets.token_bytes(32)
+        self._lock = threading.Lock()
+
+    # ---- verified-login cache ----
+    def _digest(self, username, password):
+        return hmac.new(self._cache_key, f"{username}\0{password}".encode("utf-8"), hashlib.sha256).digest()
+
+    def _cached(self, username, password, stored):
+        with self._lock:
+            entry = self._verified.get(username)
+        if entry is None or entry[0] != stored or time.monotonic() - entry[2] > VERIFIED_CACHE_SECONDS:
+            return False
+        return hmac.compare_digest(entry[1], self._digest(username, password))
+
+    def _remember(self, username, password, stored):
+        with self._lock:
+            self._verified[username] = (stored, self._digest(username, password), time.monotonic())
+
+    def forget(self, username):
+        with self._lock:
+            self._verified.pop(username, None)
+
+    # ---- verification ----
+    def check_password(self, username, password, stored):
+        """Verify against a stored hash (cache first); returns (matches, needs_rehash)"""
+        if self._cached(username, password, stored):
+            return True, False
+        matches, needs_rehash = verify_password(password, stored)
+        if matches:
+            self._remember(username, password, stored)
+        return matches, needs_rehash
+
+    def authenticate(self, username, password, client=LOCAL_CLIENT):
+        """Blocking login check; returns an AuthResult (user dict as Database.authenticate_user)"""
+        user_key = username.lower()
+        # In order, and nothing is taken here: the client is not consulted once the user is locked out
+        wait = self.user_attempts.wait(user_key) or self.client_attempts.wait(client)
+        if wait:
+            return AuthResult(message=f"Too many login attempts. Try again in {int(wait) + 1} seconds.")
+
+        row = self.db.get_login_row(username)
+        if row is None:
+            _verify_dummy(password)
+            return self._failed(user_key, client)
+
+        user, stored = row
+        matches, needs_rehash = self.check_password(username, password, stored)
+        if not matches:
+            return self._failed(user_key, client)
+        # Only failures should lock a user out
+        self.user_attempts.reset(user_key)
+        if needs_rehash:
+            new_hash = hash_password(password)
+            if self.db.replace_password_hash(user["user_id"], stored, new_hash):
+                self._remember(username, password, new_hash)
+        return AuthResult(user, "Login successful")
+
+    def _failed(self, user_key, client):
+        self.user_attempts.charge(user_key)
+        self.client_attempts.charge(client)
+        return AuthResult(message="Invalid username or password!")
+
+    def submit(self, username, password, client=LOCAL_CLIENT):
+        """Run authenticate() on the worker pool; returns a Future of AuthResult"""
+        return self._executor.submit(self.authenticate, username, password, client)
+
+    # ---- password changes ----
+    def change_password(self, username, user_id, current, new):
+        """Blocking: verify the current password (throttled like a login), store the new one; (success, message)"""
+        user_key = username.lower()
+        wait = self.user_attempts.wait(user_key)
+        if wait:
+            return False, f"Too many attempts. Try again in {int(wait) + 1} seconds."
+        stored = self.db.get_password_hash(user_id)
+        matches, _ = self.check_password(username, current, stored)
+        if not matches:
+            self.user_attempts.charge(user_key)
+            return False, "Current password is incorrect!"
+        if not self.db.replace_password_hash(user_id, stored, hash_password(new)):
+            return False, "Password was changed elsewhere - please try again."
+        self.forget(username)
+        return True, "Password changed"
+
+    def submit_change_password(self, username, user_id, current, new):
+        """Run change_password() on the worker pool; returns a Future of (success, message)"""
+        return self._executor.submit(self.change_password, username, user_id, current, new)
+
+    def run(self, fn, *args):
+        """Run a call that hashes passwords (e.g. creating an account) on the worker pool; returns a Future"""
+        return self._executor.submit(fn, *args)
+
+
+_authenticator = None
+_authenticator_lock = threading.Lock()
+
+
+def get_authenticator(db):
+    """Return the single Authenticator for this process"""
+    global _authenticator
+    with _authenticator_lock:
+        if _authenticator is None:
+            _authenticator = Authenticator(db)
+        return _authenticator
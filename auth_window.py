@@ -1,10 +1,14 @@
 from decimal import Decimal
 from PyQt6.QtWidgets import *
-from PyQt6.QtCore import Qt
+from PyQt6.QtCore import Qt, pyqtSignal
 from PyQt6.QtGui import QFont
 from database import Database
+from auth import get_authenticator, LOCAL_CLIENT
 
 class LoginWindow(QMainWindow):
+    # Emitted (from an auth worker thread) with the finished verification Future
+    auth_finished = pyqtSignal(object)
+
     def __init__(self, db: Database):
         super().__init__()
         self.db = db
@@ -14,6 +18,7 @@ class LoginWindow(QMainWindow):
         # --- Build UI then apply styles ---
         self.setup_ui()
         self.apply_styles()  # <- moved styling safely after UI setup
+        self.auth_finished.connect(self.on_auth_finished)
 
     def setup_ui(self):
         central_widget = QWidget()
@@ -215,6 +220,8 @@ class LoginWindow(QMainWindow):
         """)
 
     def login(self):
+        if not self.login_btn.isEnabled():
+            return  # A verification is already running
         username = self.username_input.text().strip()
         password = self.password_input.text().strip()
 
@@ -222,7 +229,21 @@ class LoginWindow(QMainWindow):
             QMessageBox.warning(self, "Input Error", "Please enter both username and password!")
             return
 
-        user = self.db.authenticate_user(username, password)
+        # Password hashing is deliberately slow - verify on the auth worker pool
+        self.login_btn.setEnabled(False)
+        self.login_btn.setText("Signing in...")
+        future = get_authenticator(self.db).submit(username, password, LOCAL_CLIENT)
+        future.add_done_callback(self.auth_finished.emit)
+
+    def on_auth_finished(self, future):
+        self.login_btn.setEnabled(True)
+        self.login_btn.setText("🔐 Login")
+        try:
+            result = future.result()
+        except Exception as e:
+            QMessageBox.critical(self, "Login Failed", f"Could not sign in: {e}")
+            return
+        user = result.user
 
         if user:
             QMessageBox.information(self, "Success", f"Welcome, {user['full_name']}!")
@@ -238,14 +259,11 @@ class LoginWindow(QMainWindow):
                 self.staff_window.show()
             elif user['role'] == 'customer':
                 from customer_window import CustomerWindow
-                conn = self.db.get_connection()
-                cursor = conn.cursor()
-                cursor.execute("SELECT customer_id FROM customers WHERE email=%s", (user.get('email'),))
-                result = cursor.fetchone()
-                conn.close()
-                if result:
-                    user['customer_id'] = result[0]
-                    self.customer_window = CustomerWindow(self.db, user)
+                from models import Customer
+                # customer_id came with the login row; load the rest of the window in one go
+                bundle = Customer(self.db).get_session_bundle(user['customer_id']) if user['customer_id'] else None
+                if bundle:
+                    self.customer_window = CustomerWindow(self.db, user, bundle)
                     self.customer_window.show()
                 else:
                     QMessageBox.warning(self, "Error", "Customer profile not found!")
@@ -253,7 +271,7 @@ class LoginWindow(QMainWindow):
 
             self.close()
         else:
-            QMessageBox.critical(self, "Login Failed", "Invalid username or password!")
+            QMessageBox.critical(self, "Login Failed", result.message)
             self.password_input.clear()
 
     def show_register(self):
@@ -0,0 +1,316 @@
+import time
+from decimal import Decimal
+from typing import NamedTuple, Optional
+import metrics
+import model_events
+from models import record_order_stats, apply_stock_deltas, MOVEMENT_RECALL
+
+# =============================================================================
+# BULK REFUNDS (PRODUCT RECALLS)
+# Refunds every sale line of one product that is still returnable. Work is done
+# in chunks of N original transactions, each chunk in its own DB transaction
+# with the job checkpoint, so an interrupted recall resumes where it stopped.
+# Stock, returned quantities, refund items and loyalty changes are written
+# set-based per chunk; only refund header rows are inserted one by one
+# (their AUTO_INCREMENT ids are needed for the item rows).
+# =============================================================================
+DEFAULT_CHUNK_SIZE = 200
+TAX_RATE = Decimal("0.10")
+
+_RECALL_REFUNDS = metrics.REFUNDS.labels(source="recall", status="ok")
+_RECALL_AMOUNT = metrics.REFUND_AMOUNT.labels(source="recall")
+_RECALL_CHUNK_SECONDS = metrics.REFUND_SECONDS.labels(source="recall")
+
+
+class RecallJob(NamedTuple):
+    job_id: int
+    product_id: int
+    reason: Optional[str]
+    processed_by: Optional[int]
+    refund_method: Optional[str]
+    status: str
+    last_transaction_id: int
+    refunded_transactions: int
+    refunded_units: int
+    refunded_amount: Decimal
+
+
+RECALL_JOB_COLUMNS = ", ".join(RecallJob._fields)
+
+
+class RecallReport:
+    """Progress/outcome of one run of a recall job"""
+
+    def __init__(self, job_id):
+        self.job_id = job_id
+        self.transactions = 0
+        self.units = 0
+        self.amount = Decimal("0.00")
+        self.chunks = 0
+        self.elapsed = 0.0
+        self.completed = False
+
+    @property
+    def transactions_per_second(self):
+        return self.transactions / self.elapsed if self.elapsed else 0.0
+
+    def summary(self):
+        state = "completed" if self.completed else "paused"
+        return (f"Recall job #{self.job_id} {state}: {self.transactions} transactions refunded, "
+                f"{self.units} units, ${self.amount:,.2f} "
+                f"({self.transactions_per_second:,.0f} transactions/s)")
+
+
+class BulkRefundEngine:
+    def __init__(self, db, chunk_size=DEFAULT_CHUNK_SIZE):
+        self.db = db
+        self.chunk_size = chunk_size
+
+    # ---------------------------------------------------
+    # Jobs
+    # ---------------------------------------------------
+    def preview(self, product_id):
+        """(transactions, units, refund subtotal) still refundable for a product"""
+        conn = self.db.get_connection()
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT COUNT(DISTINCT ti.transaction_id),
+                   COALESCE(SUM(ti.quantity - ti.returned_quantity), 0),
+                   COALESCE(SUM((ti.quantity - ti.returned_quantity) * ti.unit_price), 0)
+            FROM transaction_items ti
+            JOIN transactions t ON t.transaction_id = ti.transaction_id
+            WHERE ti.product_id = %s AND t.transaction_type = 'sale'
+              AND ti.returned_quantity < ti.quantity
+        """, (product_id,))
+        result = cursor.fetchone()
+        conn.close()
+        return int(result[0]), int(result[1]), Decimal(str(result[2]))
+
+    def start_recall(self, product_id, reason, processed_by, refund_method="Original Payment"):
+        conn = self.db.get_connection()
+        cursor = conn.cursor()
+        cursor.execute("""
+            INSERT INTO recall_jobs (product_id, reason, processed_by, refund_method, status)
+            VALUES (%s, %s, %s, %s, 'running')
+        """, (product_id, reason, processed_by, refund_method))
+        conn.commit()
+        job_id = cursor.lastrowid
+        conn.close()
+        return job_id
+
+    def get_job(self, job_id):
+        conn = self.db.get_connection()
+        cursor = conn.cursor()
+        cursor.execute(f"SELECT {RECALL_JOB_COLUMNS} FROM recall_jobs WHERE job_id = %s", (job_id,))
+        row = cursor.fetchone()
+        conn.close()
+        return RecallJob._make(row) if row else None
+
+    def get_unfinished_jobs(self):
+        """Jobs that were interrupted (or paused) and can be resumed"""
+        conn = self.db.get_connection()
+        cursor = conn.cursor()
+        cursor.execute(f"SELECT {RECALL_JOB_COLUMNS} FROM recall_jobs WHERE status = 'running' ORDER BY job_id")
+        jobs = [RecallJob._make(row) for row in cursor.fetchall()]
+        conn.close()
+        return jobs
+
+    # ---------------------------------------------------
+    # Processing
+    # ---------------------------------------------------
+    def run(self, job_id, progress=None):
+        """
+        Run (or resume) a recall job from its checkpoint.
+        progress(report) is called after each chunk; return False to pause.
+        """
+        job = self.get_job(job_id)
+        if job is None:
+            raise ValueError(f"Recall job {job_id} not found")
+
+        report = RecallReport(job_id)
+        if job.status != 'running':
+            report.completed = job.status == 'completed'
+            return report
+
+        started = time.perf_counter()
+        conn = self.db.get_connection()
+        cursor = conn.cursor()
+        checkpoint = job.last_transaction_id
+
+        try:
+            while True:
+                chunk_started = time.perf_counter()
+                refunded, amount = report.transactions, report.amount
+                processed, checkpoint = self._process_chunk(cursor, job, checkpoint, report)
+                conn.commit()
+                _RECALL_CHUNK_SECONDS.observe(time.perf_counter() - chunk_started)
+                _RECALL_REFUNDS.inc(report.transactions - refunded)
+                _RECALL_AMOUNT.inc(float(report.amount - amount))
+                if not processed:
+                    cursor.execute("""
+                        UPDATE recall_jobs SET status = 'completed', finished_at = NOW()
+                        WHERE job_id = %s
+                    """, (job_id,))
+                    conn.commit()
+                    report.completed = True
+                    break
+
+                report.chunks += 1
+                report.elapsed = time.perf_counter() - started
+                if progress and progress(report) is False:
+                    break
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+            report.elapsed = time.perf_counter() - started
+            if report.units:
+                model_events.products_changed([job.product_id])
+
+        return report
+
+    def _process_chunk(self, cursor, job, checkpoint, report):
+        """Refund the next chunk of transactions; returns (transactions processed, new checkpoint)"""
+        # ---- Next chunk of affected original transactions ----
+        cursor.execute("""
+            SELECT DISTINCT ti.transaction_id
+            FROM transaction_items ti
+            JOIN transactions t ON t.transaction_id = ti.transaction_id
+            WHERE ti.product_id = %s AND ti.transaction_id > %s
+              AND t.transaction_type = 'sale'
+              AND ti.returned_quantity < ti.quantity
+            ORDER BY ti.transaction_id
+            LIMIT %s
+        """, (job.product_id, checkpoint, self.chunk_size))
+        transaction_ids = [row[0] for row in cursor.fetchall()]
+        if not transaction_ids:
+            return 0, checkpoint
+
+        placeholders = ", ".join(["%s"] * len(transaction_ids))
+
+        # ---- Lock the lines being refunded (remaining quantities are now stable) ----
+        cursor.execute(f"""
+            SELECT ti.item_id, ti.transaction_id, t.customer_id,
+                   ti.quantity - ti.returned_quantity, ti.unit_price
+            FROM transaction_items ti
+            JOIN transactions t ON t.transaction_id = ti.transaction_id
+            WHERE ti.transaction_id IN ({placeholders}) AND ti.product_id = %s
+              AND ti.returned_quantity < ti.quantity
+            ORDER BY ti.transaction_id, ti.item_id
+            FOR UPDATE
+        """, tuple(transaction_ids) + (job.product_id,))
+        lines = cursor.fetchall()
+
+        # Group lines per original transaction
+        refunds = {}
+        for item_id, transaction_id, customer_id, qty, price in lines:
+            refund = refunds.setdefault(transaction_id, {"customer_id": customer_id, "lines": [], "subtotal": Decimal("0.00")})
+            price = Decimal(str(price))
+            refund["lines"].append((item_id, int(qty), price))
+            refund["subtotal"] += int(qty) * price
+
+        # ---- Mark lines returned (set-based) ----
+        item_ids = [line[0] for line in lines]
+        if item_ids:
+            cursor.execute(f"""
+                UPDATE transaction_items SET returned_quantity = quantity
+                WHERE item_id IN ({", ".join(["%s"] * len(item_ids))})
+            """, tuple(item_ids))
+
+        # ---- Refund headers (one row each - ids are needed) ----
+        for transaction_id, refund in refunds.items():
+            tax = refund["subtotal"] * TAX_RATE
+            refund["total"] = refund["subtotal"] + tax
+            cursor.execute("""
+                INSERT INTO transactions (customer_id, staff_id, total_amount, discount, tax, payment_method, transaction_type)
+                VALUES (%s, %s, %s, %s, %s, %s, %s)
+            """, (refund["customer_id"], job.processed_by, -refund["total"], 0, -tax, job.refund_method, 'refund'))
+            refund["refund_id"] = cursor.lastrowid
+
+        # ---- Refund items + returns rows (multi-row) ----
+        item_rows = []
+        return_rows = []
+        units = 0
+        amount = Decimal("0.00")
+        for transaction_id, refund in refunds.items():
+            for _, qty, price in refund["lines"]:
+                item_rows.append((refund["refund_id"], job.product_id, -qty, price, -(qty * price)))
+                units += qty
+            return_rows.append((transaction_id, refund["refund_id"], job.reason, refund["total"],
+                                job.processed_by, 'completed'))
+            amount += refund["total"]
+
+        if item_rows:
+            cursor.execute(f"""
+                INSERT INTO transaction_items (transaction_id, product_id, quantity, unit_price, subtotal)
+                VALUES {", ".join(["(%s, %s, %s, %s, %s)"] * len(item_rows))}
+            """, tuple(value for row in item_rows for value in row))
+            cursor.execute(f"""
+                INSERT INTO returns (original_transaction_id, return_transaction_id, reason, refund_amount, processed_by, status)
+                VALUES {", ".join(["(%s, %s, %s, %s, %s, %s)"] * len(return_rows))}
+            """, tuple(value for row in return_rows for value in row))
+
+            # ---- Stock restore + stock ledger (one product, one movement) ----
+            apply_stock_deltas(cursor, [(job.product_id, units)], MOVEMENT_RECALL, job.job_id)
+
+        self._deduct_loyalty(cursor, refunds)
+        record_order_stats(cursor, [(refund["customer_id"], 0, -refund["total"])
+                                    for refund in refunds.values()])
+
+        # ---- Checkpoint (commits together with the chunk) ----
+        checkpoint = transaction_ids[-1]
+        cursor.execute("""
+            UPDATE recall_jobs
+            SET last_transaction_id = %s,
+                refunded_transactions = refunded_transactions + %s,
+                refunded_units = refunded_units + %s,
+                refunded_amount = refunded_amount + %s
+            WHERE job_id = %s
+        """, (checkpoint, len(refunds), units, amount, job.job_id))
+
+        report.transactions += len(refunds)
+        report.units += units
+        report.amount += amount
+        return len(transaction_ids), checkpoint
+
+    def _deduct_loyalty(self, cursor, refunds):
+        """Same rule as process_return (1 point per $10), batched per chunk with ledger rows"""
+        per_customer = {}
+        for refund in refunds.values():
+            points = int(refund["total"] / Decimal("10"))
+            if refund["customer_id"] and points:
+                per_customer.setdefault(refund["customer_id"], []).append((refund["refund_id"], points))
+        if not per_customer:
+            return
+
+        customer_ids = list(per_customer)
+        cursor.execute(f"""
+            SELECT customer_id, loyalty_points FROM customers
+            WHERE customer_id IN ({", ".join(["%s"] * len(customer_ids))})
+            FOR UPDATE
+        """, tuple(customer_ids))
+        balances = {customer_id: points or 0 for customer_id, points in cursor.fetchall()}
+
+        ledger_rows = []
+        for customer_id, deductions in per_customer.items():
+            balance = balances.get(customer_id, 0)
+            for refund_id, points in deductions:
+                applied = min(points, balance)  # Never below zero
+                if applied:
+                    balance -= applied
+                    ledger_rows.append((customer_id, -applied, balance, 'refund', refund_id))
+            balances[customer_id] = balance
+
+        if not ledger_rows:
+            return
+        changed = sorted({row[0] for row in ledger_rows})
+        cursor.execute(f"""
+            UPDATE customers
+            SET loyalty_points = CASE customer_id {" ".join(["WHEN %s THEN %s"] * len(changed))} END
+            WHERE customer_id IN ({", ".join(["%s"] * len(changed))})
+        """, tuple(v for cid in changed for v in (cid, balances[cid])) + tuple(changed))
+        cursor.execute(f"""
+            INSERT INTO loyalty_ledger (customer_id, delta, balance_after, reason, transaction_id)
+            VALUES {", ".join(["(%s, %s, %s, %s, %s)"] * len(ledger_rows))}
+        """, tuple(value for row in ledger_rows for value in row))
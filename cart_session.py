@@ -0,0 +1,174 @@
+from decimal import Decimal
+from typing import NamedTuple
+from PyQt6.QtCore import QObject, QTimer, pyqtSignal
+from models import Cart, ProductRow
+
+# =============================================================================
+# CART SESSION
+# The customer's cart held in memory for the life of the window. Edits are
+# applied locally (the UI updates immediately, no query per spinbox step) and
+# coalesced per product, so any number of edits to one line become a single
+# row in the next write: adds stay relative (units added, merged with the line
+# in the DB so another window's adds are kept), quantity edits and removals
+# are absolute. Pending edits are flushed to
+# shopping_cart in one batched DB transaction after FLUSH_DELAY_MS of quiet,
+# and explicitly before checkout and when the window closes.
+# Product details (price, stock, active) come from the shared catalog.
+# =============================================================================
+FLUSH_DELAY_MS = 1500
+
+
+class CartLine(NamedTuple):
+    product: ProductRow
+    quantity: int
+
+    @property
+    def subtotal(self):
+        return self.product.price * self.quantity
+
+
+class CartSession(QObject):
+    # Emitted after every local edit (not on flush)
+    changed = pyqtSignal()
+    # Emitted with the error message when a flush fails (it is retried)
+    flush_failed = pyqtSignal(str)
+    # Emitted with the reason when the DB refused lines (they are dropped)
+    lines_rejected = pyqtSignal(str)
+
+    def __init__(self, db, customer_id, catalog, items=None, flush_delay_ms=FLUSH_DELAY_MS):
+        super().__init__()
+        self.cart_model = Cart(db)
+        self.customer_id = customer_id
+        self.catalog = catalog
+        self._quantities = {}
+        self._pending = {}   # product_id -> quantity set explicitly
+        self._added = {}     # product_id -> units added
+        self._cleared = False
+
+        self._flush_timer = QTimer(self)
+        self._flush_timer.setSingleShot(True)
+        self._flush_timer.setInterval(flush_delay_ms)
+        self._flush_timer.timeout.connect(self.flush)
+        if items is None:
+            self.load()
+        else:
+            # Cart rows already fetched (e.g. in the login session bundle)
+            self._quantities = {item[2]: item[1] for item in items}
+
+    # ---------------------------------------------------
+    # Reads
+    # ---------------------------------------------------
+    def load(self):
+        """(Re)read the persisted cart; pending edits are flushed first so none are lost"""
+        self.flush()
+        items = self.cart_model.get_cart_items(self.customer_id)
+        self._quantities = {item[2]: item[1] for item in items}
+
+    def lines(self):
+        """Cart lines for products that are still active, in the order they were added"""
+        lines = []
+        for product_id, quantity in self._quantities.items():
+            product = self.catalog.get(product_id)
+            if product is not None:
+                lines.append(CartLine(product, quantity))
+        return lines
+
+    def quantity(self, product_id):
+        return self._quantities.get(product_id, 0)
+
+    def count(self):
+        return len(self.lines())
+
+    def subtotal(self):
+        return sum((line.subtotal for line in self.lines()), Decimal("0.00"))
+
+    @property
+    def dirty(self):
+        return bool(self._pending or self._added or self._cleared)
+
+    # ---------------------------------------------------
+    # Local edits
+    # ---------------------------------------------------
+    def add(self, product_id, quantity=1):
+        """Add units of a product; returns (success, message) checked against catalog stock"""
+        product = self.catalog.get(product_id)
+        if product is None:
+            return False, "Product is no longer available"
+        in_cart = self.quantity(product_id)
+        if in_cart + quantity > product.stock:
+            return False, f"Only {product.stock} in stock ({in_cart} already in your cart)"
+        self._quantities[product_id] = in_cart + quantity
+        if product_id in self._pending:
+            self._pending[product_id] += quantity
+        else:
+            self._added[product_id] = self._added.get(product_id, 0) + quantity
+        self._schedule()
+        return True, "Added to cart"
+
+    def set_quantity(self, product_id, quantity):
+        if quantity <= 0:
+            self.remove(product_id)
+        elif quantity != self.quantity(product_id):
+            self._set(product_id, quantity)
+
+    def remove(self, product_id):
+        if product_id in self._quantities:
+            self._set(product_id, 0)
+
+    def clear(self):
+        self._quantities = {}
+        self._pending = {}
+        self._added = {}
+        self._cleared = True
+        self._schedule()
+
+    def _set(self, product_id, quantity):
+        if quantity > 0:
+            self._quantities[product_id] = quantity
+        else:
+            self._quantities.pop(product_id, None)
+        self._pending[product_id] = quantity
+        self._added.pop(product_id, None)
+        self._schedule()
+
+    def _schedule(self):
+        # Restarting the single-shot timer debounces a burst of edits into one write
+        self._flush_timer.start()
+        self.changed.emit()
+
+    # ---------------------------------------------------
+    # Write-behind
+    # ---------------------------------------------------
+    def flush(self):
+        """
+        Write pending edits now; returns (success, message). Edits lost to a
+        DB error are retried later; lines the DB rejected (inactive product,
+        not enough stock) are dropped and the cart re-read as stored.
+        """
+        self._flush_timer.stop()
+        if not self.dirty:
+            return True, "Cart saved"
+        pending, added, cleared = self._pending, self._added, self._cleared
+        self._pending, self._added, self._cleared = {}, {}, False
+
+        success, message, rejected = self.cart_model.save_cart(self.customer_id, pending, cleared, added)
+        if rejected:
+            items = self.cart_model.get_cart_items(self.customer_id)
+            self._quantities = {item[2]: item[1] for item in items}
+            self.changed.emit()
+            self.lines_rejected.emit(message)
+        elif not success:
+            # Newer edits made since win over the ones being retried
+            for product_id, units in self._added.items():
+                if product_id in pending:
+                    pending[product_id] += units
+                else:
+                    added[product_id] = added.get(product_id, 0) + units
+            pending.update(self._pending)
+            for product_id in self._pending:
+                added.pop(product_id, None)
+            self._pending, self._added = pending, added
+            self._cleared = self._cleared or cleared
+            self._flush_timer.start()
+            self.flush_failed.emit(message)
+        return success, message
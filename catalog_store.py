@@ -0,0 +1,83 @@
+from PyQt6.QtCore import QObject, pyqtSignal
+import model_events
+from models import Product
+
+
+class CatalogStore(QObject):
+    """Process-wide cache of ACTIVE products shared by every window.
+
+    The store loads the catalog once and then applies model writes
+    incrementally (only the touched product rows are re-read), so opening
+    more windows does not multiply memory or database load.
+    """
+    # Emitted with the list of product IDs that were added/updated/removed
+    products_changed = pyqtSignal(list)
+    # Emitted after a full reload
+    products_reset = pyqtSignal()
+
+    def __init__(self, db):
+        super().__init__()
+        self.db = db
+        self.product_model = Product(db)
+        self._products = {}
+        self._ordered = None
+        self._loaded = False
+        model_events.subscribe(model_events.PRODUCTS_CHANGED, self._on_products_changed)
+
+    # ---------------------------------------------------
+    # Reads
+    # ---------------------------------------------------
+    def products(self):
+        """All active products, newest first (same order as Product.get_all_products)"""
+        if not self._loaded:
+            self.reload(emit=False)
+        if self._ordered is None:
+            self._ordered = sorted(self._products.values(), key=lambda p: p.product_id, reverse=True)
+        return self._ordered
+
+    def get(self, product_id):
+        if not self._loaded:
+            self.reload(emit=False)
+        return self._products.get(product_id)
+
+    def low_stock_products(self):
+        return [p for p in self.products() if p.stock <= p.low_stock_threshold]
+
+    # ---------------------------------------------------
+    # Updates
+    # ---------------------------------------------------
+    def reload(self, emit=True):
+        """Full reload from the database (used on first access and by Refresh buttons)"""
+        self._products = {p.product_id: p for p in self.product_model.get_all_products()}
+        self._ordered = None
+        self._loaded = True
+        if emit:
+            self.products_reset.emit()
+
+    def _on_products_changed(self, product_ids=None):
+        if not self._loaded:
+            return  # Nothing cached yet; the first read loads fresh data
+        if product_ids is None:
+            self.reload()
+            return
+
+        fresh = {p.product_id: p for p in self.product_model.get_products_by_ids(product_ids)}
+        for product_id in product_ids:
+            if product_id in fresh:
+                self._products[product_id] = fresh[product_id]
+            else:
+                # Deactivated (soft-deleted) or missing
+                self._products.pop(product_id, None)
+        self._ordered = None
+        self.products_changed.emit(list(product_ids))
+
+
+_store = None
+
+
+def get_catalog_store(db):
+    """Return the single CatalogStore for this process"""
+    global _store
+    if _store is None:
+        _store = CatalogStore(db)
+    return _store
@@ -197,14 +197,11 @@ class ComprehensiveReportsDialog(QDialog):
         self.inventory_summary_layout = QHBoxLayout()
         layout.addLayout(self.inventory_summary_layout)
         
-        # Products table
-        self.inventory_table = QTableWidget()
-        self.inventory_table.setColumnCount(7)
-        self.inventory_table.setHorizontalHeaderLabels([
-            "Product ID", "Name", "Category", "Price", "Stock", "Value", "Status"
-        ])
-        self.inventory_table.horizontalHeader().setStretchLastSection(True)
-        layout.addWidget(self.inventory_table)
+        # One products table per filter, built the first time it is shown;
+        # switching filters afterwards just flips the stacked page
+        self.inventory_stack = QStackedWidget()
+        self.inventory_tables = {}
+        layout.addWidget(self.inventory_stack)
         
         # Auto-generate on load
         self.generate_inventory_report()
@@ -328,48 +325,60 @@ class ComprehensiveReportsDialog(QDialog):
             card = self.create_summary_card(title, value, color, small=True)
             self.inventory_summary_layout.addWidget(card)
         
+        # Tables from the previous report are stale
+        for table in self.inventory_tables.values():
+            self.inventory_stack.removeWidget(table)
+            table.deleteLater()
+        self.inventory_tables = {}
+        
         # Apply current filter
         self.filter_inventory_report()
     
     def filter_inventory_report(self):
-        """Filter inventory table based on selected filter"""
+        """Show the table for the selected filter (products come pre-bucketed per status)"""
         if not hasattr(self, 'inventory_data'):
             return
         
         filter_text = self.inventory_filter.currentText()
-        products = self.inventory_data['products']
-        
-        # Filter products
-        if filter_text == "Out of Stock":
-            filtered = [p for p in products if p[4] == 0]
-        elif filter_text == "Low Stock":
-            filtered = [p for p in products if 0 < p[4] <= p[6]]
-        elif filter_text == "In Stock":
-            filtered = [p for p in products if p[4] > p[6]]
-        else:
-            filtered = products
-        
-        # Populate table
-        self.inventory_table.setRowCount(len(filtered))
-        
-        for row, prod in enumerate(filtered):
-            self.inventory_table.setItem(row, 0, QTableWidgetItem(str(prod[0])))
-            self.inventory_table.setItem(row, 1, QTableWidgetItem(prod[1]))
-            self.inventory_table.setItem(row, 2, QTableWidgetItem(prod[5] or "N/A"))
-            self.inventory_table.setItem(row, 3, QTableWidgetItem(f"${prod[3]:.2f}"))
-            self.inventory_table.setItem(row, 4, QTableWidgetItem(str(prod[4])))
-            self.inventory_table.setItem(row, 5, QTableWidgetItem(f"${prod[3] * prod[4]:.2f}"))
+        table = self.inventory_tables.get(filter_text)
+        if table is None:
+            if filter_text in self.inventory_data['by_status']:
+                products = self.inventory_data['by_status'][filter_text]
+            else:
+                products = self.inventory_data['products']
+            table = self.create_inventory_table(products)
+            self.inventory_tables[filter_text] = table
+            self.inventory_stack.addWidget(table)
+        self.inventory_stack.setCurrentWidget(table)
+    
+    def create_inventory_table(self, products):
+        table = QTableWidget()
+        table.setColumnCount(7)
+        table.setHorizontalHeaderLabels([
+            "Product ID", "Name", "Category", "Price", "Stock", "Value", "Status"
+        ])
+        table.horizontalHeader().setStretchLastSection(True)
+        table.setRowCount(len(products))
+        
+        for row, prod in enumerate(products):
+            table.setItem(row, 0, QTableWidgetItem(str(prod[0])))
+            table.setItem(row, 1, QTableWidgetItem(prod[1]))
+            table.setItem(row, 2, QTableWidgetItem(prod[5] or "N/A"))
+            table.setItem(row, 3, QTableWidgetItem(f"${prod[3]:.2f}"))
+            table.setItem(row, 4, QTableWidgetItem(str(prod[4])))
+            table.setItem(row, 5, QTableWidgetItem(f"${prod[3] * prod[4]:.2f}"))
             
-            # Status with color
-            status_item = QTableWidgetItem(prod[8])
-            if prod[8] == "Out of Stock":
+            # Status with color (appended after the product columns)
+            status_item = QTableWidgetItem(prod[7])
+            if prod[7] == "Out of Stock":
                 status_item.setForeground(Qt.GlobalColor.red)
-            elif prod[8] == "Low Stock":
+            elif prod[7] == "Low Stock":
                 status_item.setForeground(QColor(255, 152, 0))
             else:
                 status_item.setForeground(Qt.GlobalColor.darkGreen)
             
-            self.inventory_table.setItem(row, 6, status_item)
+            table.setItem(row, 6, status_item)
+        return table
     
     def create_summary_card(self, title, value, color, small=False):
         """Create a summary statistics card"""
@@ -537,7 +546,7 @@ class ComprehensiveReportsDialog(QDialog):
                 <td>${prod[3]:.2f}</td>
                 <td>{prod[4]}</td>
                 <td>${prod[3] * prod[4]:.2f}</td>
-                <td>{prod[8]}</td>
+                <td>{prod[7]}</td>
             </tr>
             """
         
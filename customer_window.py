@@ -1,11 +1,15 @@
+import threading
 from decimal import Decimal
 from PyQt6.QtWidgets import *
-from PyQt6.QtCore import Qt
+from PyQt6.QtCore import Qt, pyqtSignal
 from PyQt6.QtGui import QFont, QPixmap
 from database import Database
-from models import Product, Cart, Transaction
+from models import Product, Transaction, new_idempotency_key
 from datetime import datetime
 from models import Customer
+from catalog_store import get_catalog_store
+from cart_session import CartSession
+from auth import get_authenticator
 from PyQt6.QtWidgets import QDialog, QFormLayout, QLineEdit, QTextEdit, QPushButton, QVBoxLayout, QMessageBox
 from loyalty_points_widget import (
     LoyaltyCardWidget,
@@ -15,19 +19,40 @@ from loyalty_points_widget import (
 )
 
 class CustomerWindow(QMainWindow):
-    def __init__(self, db: Database, user):
+    ORDERS_PAGE_SIZE = 50
+    # Carries the Future of a password change from the auth worker pool to the Qt thread
+    password_change_finished = pyqtSignal(object)
+    
+    def __init__(self, db: Database, user, bundle=None):
         super().__init__()
         self.db = db
         self.user = user
         self.product_model = Product(db)
-        self.cart_model = Cart(db)
         self.transaction_model = Transaction(db)
+        self.customer_model = Customer(db)
+        self.catalog = get_catalog_store(db)
+        
+        # Session bootstrap: profile, stats, cart and points history in one load
+        # (LoginWindow passes the bundle it fetched; cached for the session)
+        self.bundle = bundle or self.customer_model.get_session_bundle(user['customer_id'])
+        self.customer = self.bundle.customer
+        self.order_stats = self.bundle.order_stats
+        
+        # In-memory cart; edits are written behind in batches (see cart_session.py)
+        self.cart = CartSession(db, user['customer_id'], self.catalog, items=self.bundle.cart_items)
+        self.cart.changed.connect(self.load_cart)
+        self.password_change_finished.connect(self.on_password_change_finished)
+        self.cart.flush_failed.connect(self.on_cart_flush_failed)
+        self.cart.lines_rejected.connect(self.on_cart_lines_rejected)
+        self.cart_discount_rate = Decimal('0')
         
         self.setWindowTitle(f"TechHaven - Welcome {user['full_name']}!")
         self.setMinimumSize(1280, 650)
         self.setup_ui()
         self.apply_styles()
         self.load_cart()
+        self.catalog.products_changed.connect(self.on_catalog_changed)
+        self.catalog.products_reset.connect(self.on_catalog_changed)
     
     def edit_profile(self):
         
@@ -38,13 +63,8 @@ class CustomerWindow(QMainWindow):
         layout = QVBoxLayout(dialog)
         form = QFormLayout()
 
-        # Fetch current details
-        conn = self.db.get_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT full_name, email, contact, address FROM customers WHERE customer_id=%s",
-                    (self.user['customer_id'],))
-        customer = cursor.fetchone()
-        conn.close()
+        # Current details (session copy - refreshed after every save)
+        customer = (self.customer.full_name, self.customer.email, self.customer.contact, self.customer.address)
 
         # Inputs
         self.name_edit = QLineEdit(customer[0])
@@ -80,10 +100,10 @@ class CustomerWindow(QMainWindow):
         layout.addWidget(password_group)
 
 
-        save_btn = QPushButton("Save")
-        save_btn.clicked.connect(lambda: self.save_profile(dialog))
+        self.profile_save_btn = QPushButton("Save")
+        self.profile_save_btn.clicked.connect(lambda: self.save_profile(dialog))
 
-        layout.addWidget(save_btn)
+        layout.addWidget(self.profile_save_btn)
 
         dialog.exec()
 
@@ -112,29 +132,30 @@ class CustomerWindow(QMainWindow):
                 QMessageBox.warning(self, "Error", "New password and confirmation do not match!")
                 return
 
-            # Validate current password
-            conn = self.db.get_connection()
-            cursor = conn.cursor()
-            cursor.execute(
-                "SELECT password FROM users WHERE user_id = %s",
-                (self.user['user_id'],)
-            )
-            stored_pw = cursor.fetchone()[0]
+            # Verify + rehash on the auth worker pool (throttled like a login);
+            # the profile is saved once the password change went through
+            self.profile_save_btn.setEnabled(False)
+            self._pending_profile = (dialog, name, email, contact, address)
+            future = get_authenticator(self.db).submit_change_password(
+                self.user['username'], self.user['user_id'], current_pw, new_pw)
+            future.add_done_callback(self.password_change_finished.emit)
+            return
 
-            if self.db.hash_password(current_pw) != stored_pw:
-                QMessageBox.warning(self, "Error", "Current password is incorrect!")
-                conn.close()
-                return
+        self.save_profile_details(dialog, name, email, contact, address)
 
-            # Update password
-            hashed_new_pw = self.db.hash_password(new_pw)
-            cursor.execute(
-                "UPDATE users SET password=%s WHERE user_id=%s",
-                (hashed_new_pw, self.user['user_id'])
-            )
-            conn.commit()
-            conn.close()
+    def on_password_change_finished(self, future):
+        dialog, name, email, contact, address = self._pending_profile
+        self.profile_save_btn.setEnabled(True)
+        try:
+            success, message = future.result()
+        except Exception as e:
+            success, message = False, f"Could not change password: {e}"
+        if not success:
+            QMessageBox.warning(self, "Error", message)
+            return
+        self.save_profile_details(dialog, name, email, contact, address)
 
+    def save_profile_details(self, dialog, name, email, contact, address):
         # ---- UPDATE PROFILE INFORMATION ----
         conn = self.db.get_connection()
         cursor = conn.cursor()
@@ -148,6 +169,7 @@ class CustomerWindow(QMainWindow):
 
         QMessageBox.information(self, "Success", "Profile updated successfully!")
         dialog.accept()
+        self.reload_customer()
         self.refresh_profile()
 
 
@@ -288,8 +310,24 @@ class CustomerWindow(QMainWindow):
         return page
     
     def load_products(self):
-        self.all_products = self.product_model.get_all_products()
+        self.all_products = self.catalog.products()
         self.display_products(self.all_products)
+
+    def on_catalog_changed(self, product_ids=None):
+        """Shared catalog changed (sale, return, admin edit) - re-apply current filter"""
+        self.all_products = self.catalog.products()
+        self.filter_products()
+
+    def closeEvent(self, event):
+        # Persist any cart edits still waiting for the write-behind timer
+        self.cart.flush()
+        # Stop listening to the shared catalog once this window is gone
+        try:
+            self.catalog.products_changed.disconnect(self.on_catalog_changed)
+            self.catalog.products_reset.disconnect(self.on_catalog_changed)
+        except TypeError:
+            pass
+        super().closeEvent(event)
     
     def display_products(self, products):
         # Clear existing products
@@ -385,9 +423,11 @@ class CustomerWindow(QMainWindow):
     
     def add_to_cart(self, product):
         try:
-            self.cart_model.add_to_cart(self.user['customer_id'], product[0], 1)
+            success, message = self.cart.add(product[0], 1)
+            if not success:
+                QMessageBox.warning(self, "Cannot Add", message)
+                return
             QMessageBox.information(self, "Success", f"{product[1]} added to cart!")
-            self.load_cart()
         except Exception as e:
             QMessageBox.critical(self, "Error", f"Failed to add to cart: {str(e)}")
     
@@ -463,58 +503,59 @@ class CustomerWindow(QMainWindow):
         return page
     
     def load_cart(self):
-        items = self.cart_model.get_cart_items(self.user['customer_id'])
-        self.cart_badge.setText(f"Cart: {len(items)} items")
+        self.cart_badge.setText(f"Cart: {self.cart.count()} items")
+    
+    def on_cart_flush_failed(self, message):
+        self.statusBar().showMessage(f"⚠ {message} - will retry", 5000)
+    
+    def on_cart_lines_rejected(self, message):
+        """The DB refused some cart lines - show the cart as it was stored"""
+        self.statusBar().showMessage(f"⚠ {message}", 8000)
+        self.refresh_cart()
     
     def refresh_cart(self):
-        items = self.cart_model.get_cart_items(self.user['customer_id'])
-        self.cart_table.setRowCount(len(items))
+        """Rebuild the cart table from the in-memory cart (no cart query)"""
+        lines = self.cart.lines()
+        self.cart_table.setRowCount(len(lines))
         
-        subtotal = 0
-        for row, item in enumerate(items):
-            cart_id = item[0]
-            quantity = item[1]
-            product = item[2:]
+        for row, line in enumerate(lines):
+            product = line.product
             
-            self.cart_table.setItem(row, 0, QTableWidgetItem(product[1]))
-            self.cart_table.setItem(row, 1, QTableWidgetItem(f"${product[3]:.2f}"))
+            self.cart_table.setItem(row, 0, QTableWidgetItem(product.name))
+            self.cart_table.setItem(row, 1, QTableWidgetItem(f"${product.price:.2f}"))
             
             # Quantity spinbox
             qty_spin = QSpinBox()
             qty_spin.setMinimum(1)
-            qty_spin.setMaximum(product[4])
-            qty_spin.setValue(quantity)
-            qty_spin.valueChanged.connect(lambda val, cid=cart_id: self.update_cart_quantity(cid, val))
+            qty_spin.setMaximum(max(product.stock, line.quantity))
+            qty_spin.setValue(line.quantity)
+            qty_spin.valueChanged.connect(
+                lambda val, r=row, pid=product.product_id: self.update_cart_quantity(r, pid, val))
             self.cart_table.setCellWidget(row, 2, qty_spin)
             
-            item_subtotal = product[3] * quantity
-            subtotal += item_subtotal
-            self.cart_table.setItem(row, 3, QTableWidgetItem(f"${item_subtotal:.2f}"))
-            self.cart_table.setItem(row, 4, QTableWidgetItem(str(product[4])))
+            self.cart_table.setItem(row, 3, QTableWidgetItem(f"${line.subtotal:.2f}"))
+            self.cart_table.setItem(row, 4, QTableWidgetItem(str(product.stock)))
             
             # Remove button
             remove_btn = QPushButton("🗑️")
             remove_btn.setMaximumWidth(50)
             remove_btn.setCursor(Qt.CursorShape.PointingHandCursor)
-            remove_btn.clicked.connect(lambda checked, cid=cart_id: self.remove_from_cart(cid))
+            remove_btn.clicked.connect(
+                lambda checked, pid=product.product_id: self.remove_from_cart(pid))
             self.cart_table.setCellWidget(row, 5, remove_btn)
         
-        # Get customer info for discount
-        conn = self.db.get_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT customer_type FROM customers WHERE customer_id=%s", 
-                      (self.user['customer_id'],))
-        result = cursor.fetchone()
-        conn.close()
-        
-        discount = 0
-        if result:
-            customer_type = result[0]
-            if customer_type == 'vip':
-                discount = subtotal * Decimal('0.15')
-            elif customer_type == 'student':
-                discount = subtotal * Decimal('0.10')
+        # Discount rate depends on the customer type (session copy)
+        self.cart_discount_rate = Decimal('0')
+        if self.customer.customer_type == 'vip':
+            self.cart_discount_rate = Decimal('0.15')
+        elif self.customer.customer_type == 'student':
+            self.cart_discount_rate = Decimal('0.10')
         
+        self.update_cart_totals()
+    
+    def update_cart_totals(self):
+        subtotal = self.cart.subtotal()
+        discount = subtotal * self.cart_discount_rate
         tax = (subtotal - discount) * Decimal('0.10')
         total = subtotal - discount + tax
         
@@ -523,19 +564,23 @@ class CustomerWindow(QMainWindow):
         self.cart_tax_label.setText(f"Tax (10%): ${tax:.2f}")
         self.cart_total_label.setText(f"TOTAL: ${total:.2f}")
         
-        self.checkout_btn.setEnabled(len(items) > 0)
+        self.checkout_btn.setEnabled(self.cart.count() > 0)
         self.load_cart()
     
-    def update_cart_quantity(self, cart_id, quantity):
-        self.cart_model.update_cart_item(cart_id, quantity)
-        self.refresh_cart()
+    def update_cart_quantity(self, row, product_id, quantity):
+        # Local edit only: update this row and the totals, the write happens later
+        self.cart.set_quantity(product_id, quantity)
+        product = self.catalog.get(product_id)
+        if product is not None:
+            self.cart_table.setItem(row, 3, QTableWidgetItem(f"${product.price * quantity:.2f}"))
+        self.update_cart_totals()
     
-    def remove_from_cart(self, cart_id):
+    def remove_from_cart(self, product_id):
         reply = QMessageBox.question(self, "Remove Item",
                                      "Remove this item from cart?",
                                      QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No)
         if reply == QMessageBox.StandardButton.Yes:
-            self.cart_model.update_cart_item(cart_id, 0)
+            self.cart.remove(product_id)
             self.refresh_cart()
     
     def clear_cart(self):
@@ -543,39 +588,48 @@ class CustomerWindow(QMainWindow):
                                      "Are you sure you want to clear your cart?",
                                      QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No)
         if reply == QMessageBox.StandardButton.Yes:
-            self.cart_model.clear_cart(self.user['customer_id'])
+            self.cart.clear()
             self.refresh_cart()
     
     def proceed_to_checkout(self):
-        items = self.cart_model.get_cart_items(self.user['customer_id'])
-        if not items:
+        lines = self.cart.lines()
+        if not lines:
             QMessageBox.warning(self, "Empty Cart", "Your cart is empty!")
             return
         
+        # Persist the cart as shown before money moves
+        success, message = self.cart.flush()
+        if not success:
+            QMessageBox.warning(self, "Cart Not Saved", f"{message}\n\nPlease review your cart before checking out.")
+            return
+        
         # Convert cart items to transaction format
         cart_items = []
-        for item in items:
-            product = item[2:]
+        for line in lines:
+            product = line.product
             cart_items.append({
-                'product_id': product[0],
-                'name': product[1],
-                'price': product[3],
-                'quantity': item[1],
-                'stock': product[4]
+                'product_id': product.product_id,
+                'name': product.name,
+                'price': product.price,
+                'quantity': line.quantity,
+                'stock': product.stock
             })
         
-        # Get customer info
-        conn = self.db.get_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT * FROM customers WHERE customer_id=%s", (self.user['customer_id'],))
-        customer = cursor.fetchone()
-        conn.close()
-        
-        dialog = CustomerCheckoutDialog(self, self.db, cart_items, customer, self.user)
+        dialog = CustomerCheckoutDialog(self, self.db, cart_items, self.customer, self.user)
         if dialog.exec():
-            self.cart_model.clear_cart(self.user['customer_id'])
+            self.cart.clear()
+            self.cart.flush()
+            # Points, tier and order stats changed with the sale
+            self.reload_customer()
+            self.order_stats = None
             self.refresh_cart()
-            self.load_products()
+            self.refresh_profile()
+    
+    def reload_customer(self):
+        """Re-read the session's customer row after this window changed it"""
+        customer = self.customer_model.get_customer(self.user['customer_id'])
+        if customer is not None:
+            self.customer = customer
     
     def create_orders_page(self):
         page = QWidget()
@@ -589,47 +643,80 @@ class CustomerWindow(QMainWindow):
         title.setStyleSheet("color: #2196F3;")
         layout.addWidget(title)
         
-        # Orders table
+        # Lifetime summary (cached aggregates - no scan of the order history)
+        self.orders_summary = QLabel()
+        self.orders_summary.setStyleSheet("padding: 10px; background-color: #f5f5f5; border-radius: 8px;")
+        layout.addWidget(self.orders_summary)
+        
+        # Orders table (double-click a row to view the order)
         self.orders_table = QTableWidget()
-        self.orders_table.setColumnCount(5)
+        self.orders_table.setColumnCount(4)
         self.orders_table.setHorizontalHeaderLabels([
-            "Order ID", "Date", "Total", "Payment Method", "View"
+            "Order ID", "Date", "Total", "Payment Method"
         ])
         self.orders_table.horizontalHeader().setStretchLastSection(True)
+        self.orders_table.setEditTriggers(QTableWidget.EditTrigger.NoEditTriggers)
+        self.orders_table.setSelectionBehavior(QTableWidget.SelectionBehavior.SelectRows)
+        self.orders_table.cellDoubleClicked.connect(self.open_selected_order)
         layout.addWidget(self.orders_table)
         
+        hint = QLabel("Double-click an order to view its details")
+        hint.setStyleSheet("color: #666;")
+        layout.addWidget(hint)
+        
+        self.orders_more_btn = QPushButton("Load More")
+        self.orders_more_btn.clicked.connect(self.load_more_orders)
+        layout.addWidget(self.orders_more_btn)
+        self.last_order = None
+        
         return page
     
     def refresh_orders(self):
-        conn = self.db.get_connection()
-        cursor = conn.cursor()
-        cursor.execute("""
-            SELECT * FROM transactions 
-            WHERE customer_id=%s 
-            ORDER BY transaction_date DESC
-        """, (self.user['customer_id'],))
-        orders = cursor.fetchall()
-        conn.close()
+        if self.order_stats is None:
+            self.order_stats = self.customer_model.get_order_stats(self.user['customer_id'])
+        stats = self.order_stats
+        last_purchase = stats.last_purchase_at.strftime("%Y-%m-%d") if stats.last_purchase_at else "—"
+        self.orders_summary.setText(
+            f"<b>Orders:</b> {stats.order_count} &nbsp;&nbsp; "
+            f"<b>Lifetime Value:</b> ${stats.lifetime_value:.2f} &nbsp;&nbsp; "
+            f"<b>Last Purchase:</b> {last_purchase}"
+        )
         
-        self.orders_table.setRowCount(len(orders))
+        self.orders_table.setRowCount(0)
+        self.last_order = None
+        self.load_more_orders()
+    
+    def load_more_orders(self):
+        """Append the next page of orders"""
+        orders = self.customer_model.get_customer_history(
+            self.user['customer_id'], limit=self.ORDERS_PAGE_SIZE, before=self.last_order
+        )
         
-        for row, order in enumerate(orders):
+        for order in orders:
+            row = self.orders_table.rowCount()
+            self.orders_table.insertRow(row)
 
-            order_datetime = order[8]
+            order_datetime = order.transaction_date
             if isinstance(order_datetime, datetime):
                 order_datetime = order_datetime.strftime("%Y-%m-%d %H:%M:%S")
             else:
                 order_datetime = str(order_datetime)
 
-            self.orders_table.setItem(row, 0, QTableWidgetItem(f"#{order[0]}"))
+            id_item = QTableWidgetItem(f"#{order.transaction_id}")
+            id_item.setData(Qt.ItemDataRole.UserRole, order.transaction_id)
+            self.orders_table.setItem(row, 0, id_item)
             self.orders_table.setItem(row, 1, QTableWidgetItem(order_datetime))
-            self.orders_table.setItem(row, 2, QTableWidgetItem(f"${order[3]:.2f}"))
-            self.orders_table.setItem(row, 3, QTableWidgetItem(order[7] or "N/A"))
-            
-            view_btn = QPushButton("👁️ View")
-            view_btn.setCursor(Qt.CursorShape.PointingHandCursor)
-            view_btn.clicked.connect(lambda checked, tid=order[0]: self.view_order(tid))
-            self.orders_table.setCellWidget(row, 4, view_btn)
+            self.orders_table.setItem(row, 2, QTableWidgetItem(f"${order.total_amount:.2f}"))
+            self.orders_table.setItem(row, 3, QTableWidgetItem(order.payment_method or "N/A"))
+        
+        if orders:
+            self.last_order = orders[-1]
+        self.orders_more_btn.setVisible(len(orders) == self.ORDERS_PAGE_SIZE)
+    
+    def open_selected_order(self, row, column):
+        item = self.orders_table.item(row, 0)
+        if item is not None:
+            self.view_order(item.data(Qt.ItemDataRole.UserRole))
 
     def view_order(self, transaction_id):
         transaction, items = self.transaction_model.get_transaction(transaction_id)
@@ -700,13 +787,9 @@ class CustomerWindow(QMainWindow):
         layout.addWidget(title)
 
         # -------------------------------------------------------------
-        # GET CUSTOMER INFO
+        # CUSTOMER INFO (session copy)
         # -------------------------------------------------------------
-        conn = self.db.get_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT * FROM customers WHERE customer_id=%s", (self.user['customer_id'],))
-        customer = cursor.fetchone()
-        conn.close()
+        customer = self.customer
 
         # -------------------------------------------------------------
         # MAIN CONTENT: LEFT + RIGHT GRID
@@ -741,7 +824,7 @@ class CustomerWindow(QMainWindow):
         left_col.addWidget(edit_btn)
 
         # --- Loyalty Card (ONLY gradient card) ---
-        loyalty_card = LoyaltyCardWidget(self.db, self.user["customer_id"])
+        loyalty_card = LoyaltyCardWidget(self.db, self.user["customer_id"], customer)
         left_col.addWidget(loyalty_card)
 
         left_col.addStretch()
@@ -758,11 +841,13 @@ class CustomerWindow(QMainWindow):
         right_col.addWidget(tiers)
 
         # --- Redeem Points ---
-        redeem = RedeemPointsWidget(self.db, self.user["customer_id"])
+        redeem = RedeemPointsWidget(self.db, self.user["customer_id"], customer)
         right_col.addWidget(redeem)
 
         # --- Points History ---
-        history = PointsHistoryWidget(self.db, self.user["customer_id"])
+        # First page from the session bundle; later rebuilds read it fresh
+        first_page, self.bundle = (self.bundle.loyalty_history if self.bundle else None), None
+        history = PointsHistoryWidget(self.db, self.user["customer_id"], first_page)
         right_col.addWidget(history)
 
         right_col.addStretch()
@@ -871,8 +956,13 @@ class CustomerWindow(QMainWindow):
             self.close()
 
 class CustomerCheckoutDialog(QDialog):
+    # (transaction_id, payment_method, error) from the checkout worker thread
+    checkout_finished = pyqtSignal(object)
+
     def __init__(self, parent, db, cart_items, customer, user):
         super().__init__(parent)
+        self.checkout_running = False
+        self.checkout_finished.connect(self.on_checkout_finished)
         self.db = db
         self.cart_items = cart_items
         self.customer = customer   # tuple from customers table
@@ -880,21 +970,16 @@ class CustomerCheckoutDialog(QDialog):
         self.transaction_model = Transaction(db)
         self.loyalty_discount = Decimal('0.00')
         self.points_redeemed = 0
+        # One key per order - retries and double clicks reuse it
+        self.order_key = new_idempotency_key()
 
-        # Fetch current loyalty points and pending discount (MySQL-style query)
-        conn = db.get_connection()
-        cursor = conn.cursor()
-        cursor.execute(
-            "SELECT loyalty_points, pending_discount FROM customers WHERE customer_id = %s",
-            (customer[0],)
-        )
-        result = cursor.fetchone()
-        conn.close()
+        # Fetch current loyalty points and pending discount
+        result = Customer(db).get_customer(customer[0])
         
         if result:
-            self.available_points = result[0] if result[0] else 0
+            self.available_points = result.loyalty_points or 0
             # Load any pending discount from previous redemptions
-            self.loyalty_discount = Decimal(str(result[1])) if result[1] else Decimal('0.00')
+            self.loyalty_discount = Decimal(str(result.pending_discount)) if result.pending_discount else Decimal('0.00')
         else:
             self.available_points = 0
 
@@ -1200,6 +1285,8 @@ class CustomerCheckoutDialog(QDialog):
                 QMessageBox.warning(self, "Invalid CVV", "Please enter a valid CVV!")
                 return
         
+        # Block double submits while this attempt is in progress
+        self.complete_btn.setEnabled(False)
         try:
             # Update customer profile if changed
             if address != self.customer[5] or phone != self.customer[4]:
@@ -1220,38 +1307,53 @@ class CustomerCheckoutDialog(QDialog):
                 discount_rate = Decimal("0")
             
             # ---- FIXED: DO NOT CONVERT TO FLOAT ----
-            transaction_id = self.transaction_model.create_transaction(
+            # Retries back off and may wait on row locks - run it off the Qt thread
+            self.checkout_running = True
+            threading.Thread(target=self._run_checkout, args=(payment_method, discount_rate),
+                             daemon=True).start()
+            
+        except Exception as e:
+            QMessageBox.critical(self, "Error", f"Order failed: {str(e)}")
+            self.complete_btn.setEnabled(True)
+    
+    def _run_checkout(self, payment_method, discount_rate):
+        try:
+            # Idempotent: a replayed order key returns the order already placed
+            transaction_id, _ = self.transaction_model.checkout(
+                self.order_key,             # idempotency key
                 self.customer[0],           # customer id
                 None,                       # staff id (online)
                 self.cart_items,            # cart items
                 payment_method,             # payment method
-                discount_rate               # KEEP AS DECIMAL ✔
+                discount_rate,              # KEEP AS DECIMAL ✔
+                clear_pending_discount=self.loyalty_discount > 0
             )
-            
-            # Clear pending discount after successful purchase
-            if self.loyalty_discount > 0:
-                conn = self.db.get_connection()
-                cursor = conn.cursor()
-                cursor.execute("""
-                    UPDATE customers 
-                    SET pending_discount = 0.00
-                    WHERE customer_id = %s
-                """, (self.customer[0],))
-                conn.commit()
-                cursor.close()
-                conn.close()
-            
-            QMessageBox.information(
-                self,
-                "Order Placed Successfully!", 
-                f"Your order has been placed!\n"
-                f"Order ID: #{transaction_id}\n\n"
-                f"Total: ${self.total:.2f}\n"
-                f"Payment: {payment_method}\n\n"
-                f"Thank you for shopping with TechHaven!"
-            )
-            
-            self.accept()
-            
+            self.checkout_finished.emit((transaction_id, payment_method, None))
         except Exception as e:
-            QMessageBox.critical(self, "Error", f"Order failed: {str(e)}")
+            self.checkout_finished.emit((None, payment_method, e))
+    
+    def on_checkout_finished(self, result):
+        self.checkout_running = False
+        transaction_id, payment_method, error = result
+        if error is not None:
+            QMessageBox.critical(self, "Error", f"Order failed: {str(error)}")
+            self.complete_btn.setEnabled(True)
+            return
+        
+        QMessageBox.information(
+            self,
+            "Order Placed Successfully!", 
+            f"Your order has been placed!\n"
+            f"Order ID: #{transaction_id}\n\n"
+            f"Total: ${self.total:.2f}\n"
+            f"Payment: {payment_method}\n\n"
+            f"Thank you for shopping with TechHaven!"
+        )
+        
+        self.accept()
+    
+    def reject(self):
+        # The order is in flight - closing now would hide its outcome
+        if self.checkout_running:
+            return
+        super().reject()
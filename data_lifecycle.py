@@ -0,0 +1,311 @@
+import time
+from datetime import date, datetime
+import mysql.connector
+
+# =============================================================================
+# DATA LIFECYCLE
+# =============================================================================
+# ---------------------------------------------------
+# Soft-deleted record archiver
+# ---------------------------------------------------
+# Rows soft-deleted longer than RETENTION_DAYS ago are moved (copy + delete,
+# in batches, one DB transaction per batch) from the hot tables to
+# <table>_archive, keeping products/customers/users and their indexes small.
+# Rows still referenced by a foreign key (a product that was sold, a customer
+# with orders, a staff member who processed sales) are left in place: the
+# references are discovered from information_schema, so tables added later
+# are respected automatically. Archived sales have no foreign keys, so the
+# archive table of each referencing history table is checked as well.
+RETENTION_DAYS = 365
+BATCH_SIZE = 500
+
+# table -> primary key column
+ARCHIVED_TABLES = {
+    "products": "product_id",
+    "customers": "customer_id",
+    "users": "user_id",
+}
+
+
+class ArchiveReport:
+    def __init__(self):
+        self.moved = {}
+        self.elapsed = 0.0
+
+    @property
+    def total(self):
+        return sum(self.moved.values())
+
+    def summary(self):
+        if not self.total:
+            return "Nothing to archive"
+        parts = ", ".join(f"{count} {table}" for table, count in self.moved.items() if count)
+        return f"Archived {parts} in {self.elapsed:.1f}s"
+
+
+class SoftDeleteArchiver:
+    def __init__(self, db, retention_days=RETENTION_DAYS, batch_size=BATCH_SIZE):
+        self.db = db
+        self.retention_days = retention_days
+        self.batch_size = batch_size
+
+    # ---------------------------------------------------
+    # Schema helpers
+    # ---------------------------------------------------
+    def _ensure_archive_table(self, cursor, table):
+        # Plain copy of the columns (no unique keys - a username can be archived twice)
+        cursor.execute(f"""
+            CREATE TABLE IF NOT EXISTS {table}_archive ENGINE=InnoDB AS
+            SELECT *, NOW() AS archived_at FROM {table} WHERE 1 = 0
+        """)
+
+    def _columns(self, cursor, table):
+        cursor.execute("""
+            SELECT COLUMN_NAME FROM information_schema.COLUMNS
+            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s
+            ORDER BY ORDINAL_POSITION
+        """, (table,))
+        return [row[0] for row in cursor.fetchall()]
+
+    def _references(self, cursor, table):
+        """(referencing table, column) pairs for every foreign key pointing at `table`"""
+        cursor.execute("""
+            SELECT TABLE_NAME, COLUMN_NAME FROM information_schema.KEY_COLUMN_USAGE
+            WHERE REFERENCED_TABLE_SCHEMA = DATABASE() AND REFERENCED_TABLE_NAME = %s
+        """, (table,))
+        references = cursor.fetchall()
+        for ref_table, ref_column in list(references):
+            if ref_table in ARCHIVED_HISTORY:
+                archive = ARCHIVED_HISTORY[ref_table][0]
+                if _table_exists(cursor, archive):
+                    references.append((archive, ref_column))
+        return references
+
+    # ---------------------------------------------------
+    # Archiving
+    # ---------------------------------------------------
+    def run(self, tables=None):
+        """Archive eligible rows of each table; returns an ArchiveReport"""
+        report = ArchiveReport()
+        started = time.perf_counter()
+        conn = self.db.get_connection()
+        cursor = conn.cursor()
+        try:
+            for table in tables or ARCHIVED_TABLES:
+                report.moved[table] = self._archive_table(conn, cursor, table)
+        finally:
+            cursor.close()
+            conn.close()
+        report.elapsed = time.perf_counter() - started
+        return report
+
+    def _archive_table(self, conn, cursor, table):
+        key = ARCHIVED_TABLES[table]
+        self._ensure_archive_table(cursor, table)
+        archive_columns = set(self._columns(cursor, f"{table}_archive"))
+        # Columns added to the hot table after the archive was created stay behind
+        columns = ", ".join(c for c in self._columns(cursor, table) if c in archive_columns)
+
+        unreferenced = " ".join(
+            f"AND NOT EXISTS (SELECT 1 FROM {ref_table} r WHERE r.{ref_column} = t.{key})"
+            for ref_table, ref_column in self._references(cursor, table)
+        )
+        moved = 0
+        while True:
+            try:
+                cursor.execute(f"""
+                    SELECT t.{key} FROM {table} t
+                    WHERE t.is_active = 0
+                      AND t.deleted_at < NOW() - INTERVAL %s DAY
+                      {unreferenced}
+                    ORDER BY t.{key}
+                    LIMIT %s
+                    FOR UPDATE
+                """, (self.retention_days, self.batch_size))
+                ids = [row[0] for row in cursor.fetchall()]
+                if not ids:
+                    conn.commit()
+                    return moved
+
+                placeholders = ", ".join(["%s"] * len(ids))
+                cursor.execute(f"""
+                    INSERT INTO {table}_archive ({columns}, archived_at)
+                    SELECT {columns}, NOW() FROM {table} WHERE {key} IN ({placeholders})
+                """, tuple(ids))
+                cursor.execute(f"DELETE FROM {table} WHERE {key} IN ({placeholders})", tuple(ids))
+                conn.commit()
+                moved += len(ids)
+            except mysql.connector.Error as e:
+                conn.rollback()
+                print(f"Archive warning for {table}: {e}")
+                return moved
+
+
+# =============================================================================
+# TRANSACTION ARCHIVE
+# transactions/transaction_items cannot be RANGE partitioned in MySQL: InnoDB
+# partitioned tables may not have foreign keys (transaction_items references
+# transactions) and every unique key would need transaction_date
+# (idempotency_key). Closed months are instead moved to compressed archive
+# tables (<table>_archive, same columns and indexes, no foreign keys):
+#   * TransactionArchiver moves every month older than ARCHIVE_AFTER_MONTHS,
+#     a batch of whole sales (header + items) per DB transaction.
+#   * all_transactions / all_transaction_items are UNION ALL views over the
+#     hot and archive tables.
+#   * transaction_tables() routes a query: ranges that start after the newest
+#     archived sale read the hot tables only; older ranges read the views.
+# returns and loyalty_ledger keep their transaction ids as plain indexed
+# columns so archived sales can be moved out from under them.
+# =============================================================================
+ARCHIVE_AFTER_MONTHS = 24
+TRANSACTION_BATCH_SIZE = 1000
+
+# hot table -> (archive table, UNION ALL view, primary key)
+ARCHIVED_HISTORY = {
+    "transactions": ("transactions_archive", "all_transactions", "transaction_id"),
+    "transaction_items": ("transaction_items_archive", "all_transaction_items", "item_id"),
+}
+
+
+def _table_exists(cursor, table):
+    cursor.execute("""
+        SELECT 1 FROM information_schema.TABLES
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s
+    """, (table,))
+    return cursor.fetchone() is not None
+
+
+def _shared_columns(cursor, table, other):
+    cursor.execute("""
+        SELECT a.COLUMN_NAME FROM information_schema.COLUMNS a
+        JOIN information_schema.COLUMNS b
+          ON b.TABLE_SCHEMA = a.TABLE_SCHEMA AND b.TABLE_NAME = %s AND b.COLUMN_NAME = a.COLUMN_NAME
+        WHERE a.TABLE_SCHEMA = DATABASE() AND a.TABLE_NAME = %s
+        ORDER BY a.ORDINAL_POSITION
+    """, (other, table))
+    return ", ".join(row[0] for row in cursor.fetchall())
+
+
+def ensure_transaction_archive(cursor):
+    """Create the archive tables (once) and (re)create the UNION ALL views; run by Database migrations"""
+    for table, (archive, view, _) in ARCHIVED_HISTORY.items():
+        try:
+            if not _table_exists(cursor, archive):
+                # LIKE copies columns and indexes but no foreign keys
+                cursor.execute(f"CREATE TABLE {archive} LIKE {table}")
+                try:
+                    cursor.execute(f"ALTER TABLE {archive} ROW_FORMAT=COMPRESSED KEY_BLOCK_SIZE=8")
+                except mysql.connector.Error as e:
+                    print(f"Archive compression unavailable for {archive}: {e}")
+                print(f"✓ Created archive table {archive}")
+            columns = _shared_columns(cursor, table, archive)
+            cursor.execute(f"""
+                CREATE OR REPLACE VIEW {view} AS
+                SELECT {columns} FROM {table}
+                UNION ALL
+                SELECT {columns} FROM {archive}
+            """)
+        except mysql.connector.Error as e:
+            print(f"Archive setup warning for {table}: {e}")
+
+
+def archive_horizon(cursor):
+    """Newest archived transaction_date (None while nothing is archived)"""
+    cursor.execute("SELECT MAX(transaction_date) FROM transactions_archive")
+    rows = cursor.fetchall()
+    return rows[0][0] if rows else None
+
+
+def transaction_tables(cursor, start_date):
+    """
+    (transactions source, transaction_items source) for a query reading from
+    start_date onwards: the hot tables when the range is newer than anything
+    archived, otherwise the UNION ALL views.
+    """
+    horizon = archive_horizon(cursor)
+    if horizon is not None:
+        if isinstance(start_date, str):
+            start_date = datetime.strptime(start_date[:10], "%Y-%m-%d")
+        elif not isinstance(start_date, datetime) and isinstance(start_date, date):
+            start_date = datetime(start_date.year, start_date.month, start_date.day)
+        if start_date <= horizon:
+            return "all_transactions", "all_transaction_items"
+    return "transactions", "transaction_items"
+
+
+def _month_start(moment, months_back):
+    month_index = moment.year * 12 + moment.month - 1 - months_back
+    return datetime(month_index // 12, month_index % 12 + 1, 1)
+
+
+class TransactionArchiver:
+    def __init__(self, db, after_months=ARCHIVE_AFTER_MONTHS, batch_size=TRANSACTION_BATCH_SIZE):
+        self.db = db
+        self.after_months = after_months
+        self.batch_size = batch_size
+
+    def cutoff(self):
+        """First instant that stays hot: the start of the month after_months ago"""
+        return _month_start(datetime.now(), self.after_months)
+
+    def run(self):
+        """Move every closed month before the cutoff; returns an ArchiveReport"""
+        report = ArchiveReport()
+        report.moved = {"transactions": 0, "transaction_items": 0}
+        started = time.perf_counter()
+        cutoff = self.cutoff()
+
+        conn = self.db.get_connection()
+        cursor = conn.cursor()
+        try:
+            tx_columns = _shared_columns(cursor, "transactions", "transactions_archive")
+            item_columns = _shared_columns(cursor, "transaction_items", "transaction_items_archive")
+            # Any remaining foreign key into transactions (other than the items,
+            # which move along) keeps the referenced sale hot
+            cursor.execute("""
+                SELECT TABLE_NAME, COLUMN_NAME FROM information_schema.KEY_COLUMN_USAGE
+                WHERE REFERENCED_TABLE_SCHEMA = DATABASE() AND REFERENCED_TABLE_NAME = 'transactions'
+                  AND TABLE_NAME <> 'transaction_items'
+            """)
+            unreferenced = " ".join(
+                f"AND NOT EXISTS (SELECT 1 FROM {ref_table} r WHERE r.{ref_column} = t.transaction_id)"
+                for ref_table, ref_column in cursor.fetchall()
+            )
+
+            while True:
+                cursor.execute(f"""
+                    SELECT t.transaction_id FROM transactions t
+                    WHERE t.transaction_date < %s {unreferenced}
+                    ORDER BY t.transaction_id
+                    LIMIT %s
+                    FOR UPDATE
+                """, (cutoff, self.batch_size))
+                ids = [row[0] for row in cursor.fetchall()]
+                if not ids:
+                    conn.commit()
+                    break
+
+                placeholders = ", ".join(["%s"] * len(ids))
+                params = tuple(ids)
+                cursor.execute(f"""
+                    INSERT INTO transactions_archive ({tx_columns})
+                    SELECT {tx_columns} FROM transactions WHERE transaction_id IN ({placeholders})
+                """, params)
+                cursor.execute(f"""
+                    INSERT INTO transaction_items_archive ({item_columns})
+                    SELECT {item_columns} FROM transaction_items WHERE transaction_id IN ({placeholders})
+                """, params)
+                report.moved["transaction_items"] += cursor.rowcount
+                cursor.execute(f"DELETE FROM transaction_items WHERE transaction_id IN ({placeholders})", params)
+                cursor.execute(f"DELETE FROM transactions WHERE transaction_id IN ({placeholders})", params)
+                conn.commit()
+                report.moved["transactions"] += len(ids)
+        except mysql.connector.Error as e:
+            conn.rollback()
+            print(f"Transaction archive warning: {e}")
+        finally:
+            cursor.close()
+            conn.close()
+
+        report.elapsed = time.perf_counter() - started
+        return report
@@ -1,17 +1,61 @@
 from decimal import Decimal
 import mysql.connector
-import hashlib
+import mysql.connector.pooling
+import threading
+import time
 from datetime import datetime
+from loyalty_tiers import LoyaltyTierEngine
+from query_log import instrument
+import auth
+import data_lifecycle
+import metrics
+import model_events
+
+_POOLED = metrics.DB_CONNECTIONS.labels(source="pool")
+_DIRECT = metrics.DB_CONNECTIONS.labels(source="direct")
+
+
+# Active-only views the model layer reads through: (view, table, extra filter).
+# MySQL has no partial indexes, so each view is backed by an (is_active, ...) index.
+ACTIVE_VIEWS = [
+    ("active_products", "products", ""),
+    ("active_customers", "customers", ""),
+    ("active_staff", "users", "AND role != 'customer'"),
+]
+
+# Days between automatic stock_snapshots; whether one is due is checked at
+# start-up and on product writes, at most once per SNAPSHOT_CHECK_SECONDS
+SNAPSHOT_INTERVAL_DAYS = 7
+SNAPSHOT_CHECK_SECONDS = 3600
+# stock_movements reason for a product's first balance (models.MOVEMENT_*)
+MOVEMENT_INITIAL = "initial"
+
+
+# The one out-of-stock rule, for reports and alerts alike (stock can go below
+# zero when oversold till sales sync late)
+def is_out_of_stock(stock):
+    return stock <= 0
+
+
+def out_of_stock_sql(alias=None):
+    """is_out_of_stock as a SQL predicate on products (optionally alias-qualified)"""
+    return f"{alias}.stock <= 0" if alias else "stock <= 0"
 
 
 class Database:
+    POOL_SIZE = 8
+
     def __init__(self,
                  host="localhost",
                  user="root",
                  password="12345",
-                 database="testtechhaven"):
+                 database="testtechhaven",
+                 pool_size=POOL_SIZE):
         # Save DB name separately
         self.db_name = database
+        self.pool_size = pool_size
+        self.pool = None
+        self._pool_lock = threading.Lock()
 
         # Base config (no database) – used to create DB if missing
         self.config_base = {
@@ -38,6 +82,11 @@ class Database:
         # 3) Run migrations for soft delete columns
         self.run_migrations()
 
+        # 4) Keep stock snapshots coming while the app stays open
+        self._next_snapshot_check = time.monotonic() + SNAPSHOT_CHECK_SECONDS
+        self._snapshot_lock = threading.Lock()
+        model_events.subscribe(model_events.PRODUCTS_CHANGED, self._on_products_changed)
+
     # ----------------------------------------------------------------------
     # AUTO-CREATE DATABASE
     # ----------------------------------------------------------------------
@@ -51,12 +100,46 @@ class Database:
         conn.close()
 
     def get_connection(self):
-        """Get a connection to the already-created database."""
-        return mysql.connector.connect(**self.config)
+        """
+        Get a connection to the already-created database.
+        Connections come from a pool; close() hands them back (the session is
+        reset, so uncommitted work is rolled back as with a real disconnect).
+        Every statement is recorded by the query log (see query_log.py).
+        """
+        if self.pool is None:
+            with self._pool_lock:
+                if self.pool is None:
+                    self.pool = mysql.connector.pooling.MySQLConnectionPool(
+                        pool_name=f"techhaven_{self.db_name}",
+                        pool_size=self.pool_size,
+                        pool_reset_session=True,
+                        **self.config
+                    )
+                    self._register_pool_metrics()
+        started = time.perf_counter()
+        try:
+            conn = self.pool.get_connection()
+            _POOLED.inc()
+        except mysql.connector.errors.PoolError:
+            # Pool exhausted (e.g. nested connections under load) - don't fail the caller
+            metrics.DB_POOL_EXHAUSTED.inc()
+            conn = mysql.connector.connect(**self.config)
+            _DIRECT.inc()
+        metrics.DB_ACQUIRE_SECONDS.observe(time.perf_counter() - started)
+        return instrument(conn)
+
+    def _register_pool_metrics(self):
+        pool = self.pool
+        metrics.gauge("techhaven_db_pool_size", "Configured connection pool size",
+                      function=lambda: pool.pool_size)
+        # The connector has no public idle count; _cnx_queue holds the idle connections
+        metrics.gauge("techhaven_db_pool_idle", "Idle connections in the pool",
+                      function=lambda: pool._cnx_queue.qsize())
 
     # ---------- PASSWORD HASHING ----------
     def hash_password(self, password: str) -> str:
-        return hashlib.sha256(password.encode()).hexdigest()
+        """Salted scrypt hash (see auth.py); legacy SHA-256 rows are upgraded at login"""
+        return auth.hash_password(password)
 
     # ---------- INITIAL SCHEMA / SEED DATA ----------
     def init_database(self):
@@ -107,7 +190,10 @@ class Database:
                 low_stock_threshold INT DEFAULT 10,
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                 is_active TINYINT(1) DEFAULT 1,
-                deleted_at TIMESTAMP NULL DEFAULT NULL
+                deleted_at TIMESTAMP NULL DEFAULT NULL,
+                sku VARCHAR(64) NULL UNIQUE,
+                stock_headroom INT AS (stock - low_stock_threshold) STORED,
+                INDEX idx_products_headroom (is_active, stock_headroom)
             ) ENGINE=InnoDB
         """)
 
@@ -122,6 +208,9 @@ class Database:
                 payment_method VARCHAR(50),
                 transaction_type VARCHAR(20) DEFAULT 'sale',
                 transaction_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                idempotency_key VARCHAR(64) NULL UNIQUE,
+                INDEX idx_transactions_customer_date (customer_id, transaction_date),
+                INDEX idx_transactions_date (transaction_date),
                 CONSTRAINT fk_transactions_customer
                     FOREIGN KEY (customer_id) REFERENCES customers(customer_id)
                     ON DELETE SET NULL,
@@ -139,6 +228,7 @@ class Database:
                 quantity INT NOT NULL,
                 unit_price DECIMAL(10,2) NOT NULL,
                 subtotal DECIMAL(10,2) NOT NULL,
+                returned_quantity INT NOT NULL DEFAULT 0,
                 CONSTRAINT fk_items_transaction
                     FOREIGN KEY (transaction_id) REFERENCES transactions(transaction_id)
                     ON DELETE CASCADE,
@@ -154,6 +244,7 @@ class Database:
                 product_id INT,
                 quantity INT NOT NULL,
                 added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                UNIQUE KEY uq_cart_customer_product (customer_id, product_id),
                 CONSTRAINT fk_cart_customer
                     FOREIGN KEY (customer_id) REFERENCES customers(customer_id)
                     ON DELETE CASCADE,
@@ -172,15 +263,124 @@ class Database:
                 refund_amount DECIMAL(10,2),
                 processed_by INT,
                 status VARCHAR(50) DEFAULT 'pending',
-                CONSTRAINT fk_returns_original
-                    FOREIGN KEY (original_transaction_id) REFERENCES transactions(transaction_id),
-                CONSTRAINT fk_returns_return
-                    FOREIGN KEY (return_transaction_id) REFERENCES transactions(transaction_id),
+                -- Plain indexes, not foreign keys: old sales move to transactions_archive
+                INDEX fk_returns_original (original_transaction_id),
+                INDEX fk_returns_return (return_transaction_id),
                 CONSTRAINT fk_returns_staff
                     FOREIGN KEY (processed_by) REFERENCES users(user_id)
             ) ENGINE=InnoDB
         """)
 
+        # Append-only loyalty points ledger; balance_after is the running balance
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS loyalty_ledger (
+                entry_id INT AUTO_INCREMENT PRIMARY KEY,
+                customer_id INT NOT NULL,
+                delta INT NOT NULL,
+                balance_after INT NOT NULL,
+                reason VARCHAR(50) NOT NULL,
+                transaction_id INT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                INDEX idx_ledger_customer_created (customer_id, created_at),
+                INDEX fk_ledger_transaction (transaction_id),
+                CONSTRAINT fk_ledger_customer
+                    FOREIGN KEY (customer_id) REFERENCES customers(customer_id)
+            ) ENGINE=InnoDB
+        """)
+
+        # Lifetime order aggregates per customer, maintained at checkout/refund
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS customer_order_stats (
+                customer_id INT PRIMARY KEY,
+                order_count INT NOT NULL DEFAULT 0,
+                lifetime_value DECIMAL(12,2) NOT NULL DEFAULT 0,
+                last_purchase_at TIMESTAMP NULL DEFAULT NULL,
+                CONSTRAINT fk_order_stats_customer
+                    FOREIGN KEY (customer_id) REFERENCES customers(customer_id)
+                    ON DELETE CASCADE
+            ) ENGINE=InnoDB
+        """)
+
+        # Append-only stock ledger, one row per change to products.stock.
+        # No foreign key, so ledger history never pins a product in the hot table.
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS stock_movements (
+                movement_id BIGINT AUTO_INCREMENT PRIMARY KEY,
+                product_id INT NOT NULL,
+                delta INT NOT NULL,
+                balance_after INT NOT NULL,
+                reason VARCHAR(20) NOT NULL,
+                reference_id INT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                INDEX idx_movements_product_created (product_id, created_at, movement_id),
+                INDEX idx_movements_created (created_at)
+            ) ENGINE=InnoDB
+        """)
+
+        # Units sold per product per day (forecasting rollup, refreshed incrementally)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS product_daily_sales (
+                product_id INT NOT NULL,
+                sales_date DATE NOT NULL,
+                units INT NOT NULL,
+                revenue DECIMAL(12,2) NOT NULL,
+                PRIMARY KEY (product_id, sales_date),
+                INDEX idx_daily_sales_date (sales_date)
+            ) ENGINE=InnoDB
+        """)
+
+        # Periodic copies of every product's stock (and price) for point-in-time queries
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS stock_snapshots (
+                snapshot_at TIMESTAMP NOT NULL,
+                product_id INT NOT NULL,
+                stock INT NOT NULL,
+                price DECIMAL(10,2) NOT NULL,
+                PRIMARY KEY (snapshot_at, product_id)
+            ) ENGINE=InnoDB
+        """)
+
+        # Low-stock alerts; open_product_id allows one unresolved alert per product.
+        # No foreign key, so alert history never pins a product in the hot table.
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS inventory_alerts (
+                alert_id INT AUTO_INCREMENT PRIMARY KEY,
+                product_id INT NOT NULL,
+                alert_type VARCHAR(20) NOT NULL,
+                stock_level INT NOT NULL,
+                threshold INT NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                acknowledged_by INT NULL,
+                acknowledged_at TIMESTAMP NULL DEFAULT NULL,
+                resolved_at TIMESTAMP NULL DEFAULT NULL,
+                open_product_id INT AS (IF(resolved_at IS NULL, product_id, NULL)) STORED,
+                UNIQUE KEY uq_alerts_open_product (open_product_id),
+                INDEX idx_alerts_product_created (product_id, created_at)
+            ) ENGINE=InnoDB
+        """)
+
+        # Bulk refund (product recall) jobs; last_transaction_id is the resume checkpoint
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS recall_jobs (
+                job_id INT AUTO_INCREMENT PRIMARY KEY,
+                product_id INT NOT NULL,
+                reason TEXT,
+                processed_by INT NULL,
+                refund_method VARCHAR(50),
+                status VARCHAR(20) DEFAULT 'running',
+                last_transaction_id INT NOT NULL DEFAULT 0,
+                refunded_transactions INT NOT NULL DEFAULT 0,
+                refunded_units INT NOT NULL DEFAULT 0,
+                refunded_amount DECIMAL(12,2) NOT NULL DEFAULT 0,
+                started_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                finished_at TIMESTAMP NULL DEFAULT NULL,
+                CONSTRAINT fk_recall_product
+                    FOREIGN KEY (product_id) REFERENCES products(product_id),
+                CONSTRAINT fk_recall_staff
+                    FOREIGN KEY (processed_by) REFERENCES users(user_id)
+            ) ENGINE=InnoDB
+        """)
+
         cursor.execute("""
             CREATE TABLE IF NOT EXISTS services (
                 service_id INT AUTO_INCREMENT PRIMARY KEY,
@@ -252,8 +452,21 @@ class Database:
             
             # Pending discount column for customers
             ("customers", "pending_discount", "DECIMAL(10,2) DEFAULT 0.00"),
+            
+            # Supplier SKU (natural key for bulk import)
+            ("products", "sku", "VARCHAR(64) NULL UNIQUE"),
+            
+            # Per-line returned quantity (return eligibility)
+            ("transaction_items", "returned_quantity", "INT NOT NULL DEFAULT 0"),
+            
+            # Client-generated key so replayed checkouts are not recorded twice
+            ("transactions", "idempotency_key", "VARCHAR(64) NULL UNIQUE"),
+            
+            # Low-stock check as an indexable column (stock_headroom <= 0)
+            ("products", "stock_headroom", "INT AS (stock - low_stock_threshold) STORED"),
         ]
         
+        added = set()
         for table, column, definition in migrations:
             try:
                 cursor.execute(f"""
@@ -261,6 +474,7 @@ class Database:
                     ADD COLUMN {column} {definition}
                 """)
                 conn.commit()
+                added.add((table, column))
                 print(f"✓ Added column {column} to {table}")
             except mysql.connector.Error as e:
                 if e.errno == 1060:  # Duplicate column error
@@ -268,6 +482,66 @@ class Database:
                 else:
                     print(f"Migration warning for {table}.{column}: {e}")
         
+        # Secondary indexes for existing databases (new ones get them from CREATE TABLE)
+        index_migrations = [
+            # Per-customer order history, newest first (keyset pagination)
+            ("transactions", "idx_transactions_customer_date", "customer_id, transaction_date", "INDEX"),
+            
+            # Date-range reports and the transaction archiver
+            ("transactions", "idx_transactions_date", "transaction_date", "INDEX"),
+            
+            # One cart line per customer/product (single-statement cart upsert)
+            ("shopping_cart", "uq_cart_customer_product", "customer_id, product_id", "UNIQUE INDEX"),
+            
+            # Soft delete: active listings (newest first) and deleted-records views
+            ("products", "idx_products_active", "is_active, product_id", "INDEX"),
+            ("products", "idx_products_active_deleted", "is_active, deleted_at", "INDEX"),
+            ("customers", "idx_customers_active", "is_active, customer_id", "INDEX"),
+            ("customers", "idx_customers_active_deleted", "is_active, deleted_at", "INDEX"),
+            ("users", "idx_users_active_role", "is_active, role", "INDEX"),
+            ("users", "idx_users_active_deleted", "is_active, deleted_at", "INDEX"),
+            
+            # Low-stock lookups
+            ("products", "idx_products_headroom", "is_active, stock_headroom", "INDEX"),
+        ]
+        
+        # Duplicate cart lines would block the unique cart index
+        self.merge_duplicate_cart_lines(cursor)
+        conn.commit()
+        
+        for table, index, columns, kind in index_migrations:
+            try:
+                cursor.execute(f"CREATE {kind} {index} ON {table} ({columns})")
+                conn.commit()
+                print(f"✓ Added index {index} to {table}")
+            except mysql.connector.Error as e:
+                if e.errno == 1061:  # Duplicate key name
+                    pass  # Index already exists, ignore
+                else:
+                    print(f"Migration warning for index {table}.{index}: {e}")
+        
+        # Foreign keys into transactions from rows that outlive a sale's move to
+        # the archive (their backing indexes stay)
+        dropped_foreign_keys = [
+            ("returns", "fk_returns_original"),
+            ("returns", "fk_returns_return"),
+            ("loyalty_ledger", "fk_ledger_transaction"),
+        ]
+        for table, constraint in dropped_foreign_keys:
+            try:
+                cursor.execute(f"ALTER TABLE {table} DROP FOREIGN KEY {constraint}")
+                conn.commit()
+                print(f"✓ Dropped foreign key {constraint} from {table}")
+            except mysql.connector.Error as e:
+                if e.errno == 1091:  # Can't drop - already gone
+                    pass
+                else:
+                    print(f"Migration warning for {table}.{constraint}: {e}")
+        
+        # transactions_archive / transaction_items_archive + all_* views
+        data_lifecycle.ensure_transaction_archive(cursor)
+        conn.commit()
+        
         # Update existing records to be active if is_active is NULL
         try:
             cursor.execute("UPDATE products SET is_active = 1 WHERE is_active IS NULL")
@@ -277,20 +551,275 @@ class Database:
         except mysql.connector.Error:
             pass
         
+        if ("transaction_items", "returned_quantity") in added:
+            self.backfill_returned_quantities(cursor)
+        self.backfill_loyalty_ledger(cursor)
+        self.backfill_order_stats(cursor)
+        self.backfill_inventory_alerts(cursor)
+        self.backfill_stock_ledger(cursor)
+        self.snapshot_stock_if_due(cursor)
+        self.link_customer_accounts(cursor)
+        self.create_active_views(cursor)
+        conn.commit()
+        
         cursor.close()
         conn.close()
 
+    # ----------------------------------------------------------------------
+    # ONE-OFF RETURNED QUANTITY BACKFILL
+    # ----------------------------------------------------------------------
+    def backfill_returned_quantities(self, cursor):
+        """
+        Derive returned_quantity from refunds recorded before the column existed.
+        Old refund lines only carry product_id, so quantities are matched per
+        (original transaction, product) and capped at the quantity sold.
+        """
+        try:
+            cursor.execute("""
+                UPDATE transaction_items ti
+                JOIN (
+                    SELECT r.original_transaction_id, ri.product_id, SUM(-ri.quantity) AS returned
+                    FROM returns r
+                    JOIN transaction_items ri ON ri.transaction_id = r.return_transaction_id
+                    GROUP BY r.original_transaction_id, ri.product_id
+                ) done ON done.original_transaction_id = ti.transaction_id
+                      AND done.product_id = ti.product_id
+                SET ti.returned_quantity = LEAST(ti.quantity, done.returned)
+            """)
+            print(f"✓ Backfilled returned quantities on {cursor.rowcount} sale lines")
+        except mysql.connector.Error as e:
+            print(f"Returned quantity backfill warning: {e}")
+
+    # ----------------------------------------------------------------------
+    # ONE-OFF LOYALTY LEDGER BACKFILL
+    # ----------------------------------------------------------------------
+    def backfill_loyalty_ledger(self, cursor):
+        """
+        Seed loyalty_ledger from existing sales/refunds the first time it is empty.
+        Past redemptions and clamped refunds were never recorded, so one
+        'backfill_adjustment' row per customer reconciles the ledger with
+        customers.loyalty_points.
+        """
+        try:
+            cursor.execute("SELECT 1 FROM loyalty_ledger LIMIT 1")
+            if cursor.fetchone():
+                return
+
+            # Same accrual rule as Transaction.create_transaction / process_return
+            cursor.execute("""
+                INSERT INTO loyalty_ledger
+                    (customer_id, delta, balance_after, reason, transaction_id, created_at)
+                SELECT customer_id, delta,
+                       SUM(delta) OVER (PARTITION BY customer_id
+                                        ORDER BY transaction_date, transaction_id),
+                       reason, transaction_id, transaction_date
+                FROM (
+                    SELECT customer_id, transaction_id, transaction_date,
+                           CASE WHEN transaction_type = 'sale'
+                                THEN FLOOR(total_amount / 10)
+                                ELSE -FLOOR(ABS(total_amount) / 10) END AS delta,
+                           CASE WHEN transaction_type = 'sale'
+                                THEN 'purchase' ELSE 'refund' END AS reason
+                    FROM transactions
+                    WHERE customer_id IS NOT NULL
+                      AND transaction_type IN ('sale', 'refund')
+                ) history
+                WHERE delta <> 0
+            """)
+            backfilled = cursor.rowcount
+
+            cursor.execute("""
+                INSERT INTO loyalty_ledger (customer_id, delta, balance_after, reason)
+                SELECT c.customer_id,
+                       c.loyalty_points - COALESCE(l.balance, 0),
+                       c.loyalty_points,
+                       'backfill_adjustment'
+                FROM customers c
+                LEFT JOIN (
+                    SELECT customer_id, SUM(delta) AS balance
+                    FROM loyalty_ledger GROUP BY customer_id
+                ) l ON l.customer_id = c.customer_id
+                WHERE c.loyalty_points <> COALESCE(l.balance, 0)
+            """)
+            if backfilled or cursor.rowcount:
+                print(f"✓ Backfilled loyalty ledger ({backfilled} entries, {cursor.rowcount} adjustments)")
+        except mysql.connector.Error as e:
+            print(f"Loyalty ledger backfill warning: {e}")
+
+    # ----------------------------------------------------------------------
+    # ONE-OFF CUSTOMER ORDER STATS BACKFILL
+    # ----------------------------------------------------------------------
+    def backfill_order_stats(self, cursor):
+        """Seed customer_order_stats from transaction history the first time it is empty"""
+        try:
+            cursor.execute("SELECT 1 FROM customer_order_stats LIMIT 1")
+            if cursor.fetchone():
+                return
+
+            # Same rules as models.record_order_stats: sales count, refunds reduce value
+            cursor.execute("""
+                INSERT INTO customer_order_stats
+                    (customer_id, order_count, lifetime_value, last_purchase_at)
+                SELECT customer_id,
+                       SUM(transaction_type = 'sale'),
+                       SUM(total_amount),
+                       MAX(CASE WHEN transaction_type = 'sale' THEN transaction_date END)
+                FROM transactions
+                WHERE customer_id IS NOT NULL
+                  AND transaction_type IN ('sale', 'refund')
+                GROUP BY customer_id
+            """)
+            if cursor.rowcount:
+                print(f"✓ Backfilled order stats for {cursor.rowcount} customers")
+        except mysql.connector.Error as e:
+            print(f"Order stats backfill warning: {e}")
+
+    def backfill_inventory_alerts(self, cursor):
+        """Open an alert for products already low at start-up (later ones come from product writes)"""
+        try:
+            # The unique open_product_id key makes this a no-op for products already alerted
+            cursor.execute(f"""
+                INSERT IGNORE INTO inventory_alerts (product_id, alert_type, stock_level, threshold)
+                SELECT product_id, IF({out_of_stock_sql()}, 'out_of_stock', 'low_stock'), stock, low_stock_threshold
+                FROM products
+                WHERE is_active = 1 AND stock_headroom <= 0
+            """)
+            if cursor.rowcount:
+                print(f"✓ Opened {cursor.rowcount} inventory alerts")
+        except mysql.connector.Error as e:
+            print(f"Inventory alert backfill warning: {e}")
+
+    # ----------------------------------------------------------------------
+    # STOCK LEDGER
+    # ----------------------------------------------------------------------
+    def backfill_stock_ledger(self, cursor):
+        """Seed an opening balance per product the first time stock_movements is empty"""
+        try:
+            # Earlier versions seeded these rows with their own reason code
+            cursor.execute("UPDATE stock_movements SET reason = %s WHERE reason = 'opening'",
+                           (MOVEMENT_INITIAL,))
+            cursor.execute("SELECT 1 FROM stock_movements LIMIT 1")
+            if cursor.fetchall():
+                return
+            cursor.execute("""
+                INSERT INTO stock_movements (product_id, delta, balance_after, reason)
+                SELECT product_id, stock, stock, %s FROM products
+            """, (MOVEMENT_INITIAL,))
+            if cursor.rowcount:
+                print(f"✓ Recorded opening stock for {cursor.rowcount} products")
+        except mysql.connector.Error as e:
+            print(f"Stock ledger backfill warning: {e}")
+
+    def take_stock_snapshot(self, cursor):
+        """Copy every product's stock and price into stock_snapshots (one statement, one NOW())"""
+        cursor.execute("""
+            INSERT INTO stock_snapshots (snapshot_at, product_id, stock, price)
+            SELECT NOW(), product_id, stock, price FROM products
+        """)
+        return cursor.rowcount
+
+    def snapshot_stock_if_due(self, cursor):
+        try:
+            cursor.execute("""
+                SELECT MAX(snapshot_at) >= NOW() - INTERVAL %s DAY FROM stock_snapshots
+            """, (SNAPSHOT_INTERVAL_DAYS,))
+            recent = cursor.fetchone()[0]
+            if not recent:
+                self.take_stock_snapshot(cursor)
+        except mysql.connector.Error as e:
+            print(f"Stock snapshot warning: {e}")
+
+    def _on_products_changed(self, product_ids=None):
+        """Stock was written: take a snapshot if one is due (checked at most hourly)"""
+        with self._snapshot_lock:
+            if time.monotonic() < self._next_snapshot_check:
+                return
+            self._next_snapshot_check = time.monotonic() + SNAPSHOT_CHECK_SECONDS
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        try:
+            self.snapshot_stock_if_due(cursor)
+            conn.commit()
+        finally:
+            cursor.close()
+            conn.close()
+
+    # ----------------------------------------------------------------------
+    # ACTIVE-ONLY VIEWS
+    # ----------------------------------------------------------------------
+    def create_active_views(self, cursor):
+        """(Re)create the active-only views; rebuilt each start so new columns show up"""
+        for view, table, extra in ACTIVE_VIEWS:
+            try:
+                cursor.execute(f"""
+                    CREATE OR REPLACE VIEW {view} AS
+                    SELECT * FROM {table} WHERE is_active = 1 {extra}
+                """)
+            except mysql.connector.Error as e:
+                print(f"View warning for {view}: {e}")
+
+    # ----------------------------------------------------------------------
+    # CUSTOMER ACCOUNT LINKS
+    # ----------------------------------------------------------------------
+    def link_customer_accounts(self, cursor):
+        """Set customers.user_id for profiles that were only matched to their login by email"""
+        try:
+            cursor.execute("""
+                UPDATE customers c
+                JOIN users u ON u.email = c.email AND u.role = 'customer'
+                SET c.user_id = u.user_id
+                WHERE c.user_id IS NULL
+                  AND NOT EXISTS (SELECT 1 FROM (SELECT DISTINCT user_id FROM customers) linked
+                                  WHERE linked.user_id = u.user_id)
+            """)
+            if cursor.rowcount:
+                print(f"✓ Linked {cursor.rowcount} customer profiles to their logins")
+        except mysql.connector.Error as e:
+            print(f"Customer link warning: {e}")
+
+    # ----------------------------------------------------------------------
+    # DUPLICATE CART LINE MERGE
+    # ----------------------------------------------------------------------
+    def merge_duplicate_cart_lines(self, cursor):
+        """Fold repeated (customer, product) cart rows into the oldest one, summing quantities"""
+        try:
+            cursor.execute("""
+                SELECT customer_id, product_id, MIN(cart_id), SUM(quantity)
+                FROM shopping_cart
+                GROUP BY customer_id, product_id
+                HAVING COUNT(*) > 1
+            """)
+            duplicates = cursor.fetchall()
+            for customer_id, product_id, keep_id, quantity in duplicates:
+                cursor.execute("UPDATE shopping_cart SET quantity = %s WHERE cart_id = %s",
+                               (quantity, keep_id))
+                cursor.execute("""
+                    DELETE FROM shopping_cart
+                    WHERE customer_id <=> %s AND product_id <=> %s AND cart_id <> %s
+                """, (customer_id, product_id, keep_id))
+            if duplicates:
+                print(f"✓ Merged duplicate cart lines for {len(duplicates)} customer/product pairs")
+        except mysql.connector.Error as e:
+            print(f"Cart merge warning: {e}")
+
     # ---------- AUTH & REGISTRATION HELPERS ----------
     def authenticate_user(self, username, password):
+        """Blocking login check (throttled, rehashes legacy rows); user dict or None"""
+        return auth.get_authenticator(self).authenticate(username, password).user
+
+    def get_login_row(self, username):
+        """(user dict, stored password hash) for an ACTIVE username, or None"""
         conn = self.get_connection()
         cursor = conn.cursor()
-        hashed_password = self.hash_password(password)
 
-        # Only authenticate ACTIVE users
+        # A customer's profile id comes along via customers.user_id
+        # (indexed by fk_customers_user) - no second lookup
         cursor.execute(
-            "SELECT user_id, username, full_name, email, role "
-            "FROM users WHERE username = %s AND password = %s AND is_active = 1",
-            (username, hashed_password)
+            "SELECT u.user_id, u.username, u.full_name, u.email, u.role, c.customer_id, u.password "
+            "FROM users u "
+            "LEFT JOIN customers c ON c.user_id = u.user_id AND c.is_active = 1 "
+            "WHERE u.username = %s AND u.is_active = 1",
+            (username,)
         )
         row = cursor.fetchone()
         cursor.close()
@@ -303,9 +832,31 @@ class Database:
                 "full_name": row[2],
                 "email": row[3],
                 "role": row[4],
-            }
+                "customer_id": row[5],
+            }, row[6]
         return None
 
+    def get_password_hash(self, user_id):
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute("SELECT password FROM users WHERE user_id = %s", (user_id,))
+        row = cursor.fetchone()
+        cursor.close()
+        conn.close()
+        return row[0] if row else None
+
+    def replace_password_hash(self, user_id, old_hash, new_hash):
+        """Swap a stored hash only if it is still the one that was verified"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute("UPDATE users SET password = %s WHERE user_id = %s AND password = %s",
+                       (new_hash, user_id, old_hash))
+        replaced = cursor.rowcount > 0
+        conn.commit()
+        cursor.close()
+        conn.close()
+        return replaced
+
     def register_customer(self, username, password, full_name, email, contact, address, customer_type="regular"):
         """Register a new customer (user + customer record)"""
         try:
@@ -342,42 +893,8 @@ class Database:
         conn = self.get_connection()
         cursor = conn.cursor()
 
-        cursor.execute(
-            "SELECT loyalty_points, customer_type FROM customers WHERE customer_id = %s AND is_active = 1",
-            (customer_id,)
-        )
-        result = cursor.fetchone()
-
-        if result is not None:
-            points = result[0] or 0
-            current_type = result[1]
-
-            # Determine what type they qualify for based on points
-            if points >= 1000:
-                qualified_type = "vip"
-            elif points >= 500:
-                qualified_type = "premium"
-            else:
-                qualified_type = "regular"
-            
-            # Define priority levels (higher = better)
-            priority = {
-                "regular": 0,
-                "student": 1,
-                "premium": 2,
-                "vip": 3
-            }
-            
-            current_priority = priority.get(current_type, 0)
-            qualified_priority = priority.get(qualified_type, 0)
-            
-            # Only upgrade if qualified type has HIGHER priority than current
-            if qualified_priority > current_priority:
-                cursor.execute(
-                    "UPDATE customers SET customer_type = %s WHERE customer_id = %s",
-                    (qualified_type, customer_id)
-                )
-                conn.commit()
+        LoyaltyTierEngine(self).recalculate_customer(cursor, customer_id)
+        conn.commit()
 
         cursor.close()
         conn.close()
@@ -0,0 +1,184 @@
+import math
+from datetime import date, timedelta
+from typing import NamedTuple, Optional
+import mysql.connector
+from models import Product
+
+# =============================================================================
+# REORDER FORECASTING
+# Per-product demand from sales history:
+#   * product_daily_sales is a rollup of units sold per product per day. It is
+#     refreshed incrementally: only days from the last rolled-up day onwards
+#     are re-aggregated (one GROUP BY over the transaction_date index), so the
+#     full sales history is read once, on the first run.
+#   * The last HISTORY_DAYS of the rollup become one fixed-length daily series
+#     per product; velocity is an exponentially weighted daily mean and
+#     seasonality a day-of-week factor, damped for products with little data.
+#   * Days of cover walks the stock forward through the seasonal daily demand;
+#     the reorder quantity covers lead time + review period plus safety stock.
+# =============================================================================
+HISTORY_DAYS = 84           # 12 full weeks for the day-of-week pattern
+VELOCITY_HALF_LIFE = 14.0   # days; recent sales weigh more
+ROLLUP_RETENTION_DAYS = 400
+LEAD_TIME_DAYS = 7
+REVIEW_DAYS = 14
+SERVICE_Z = 1.65            # ~95% cycle service level
+SEASONALITY_FULL_UNITS = 50  # units in the window before weekday factors count fully
+MAX_COVER_DAYS = 365
+
+
+class ReorderSuggestion(NamedTuple):
+    product_id: int
+    name: str
+    stock: int
+    daily_velocity: float
+    days_of_cover: Optional[float]  # None = no recent demand
+    reorder_point: int
+    reorder_qty: int
+
+
+def _weighted_velocity(series, half_life=VELOCITY_HALF_LIFE):
+    """Exponentially weighted mean of a daily series (oldest first)"""
+    decay = 0.5 ** (1.0 / half_life)
+    weight, total, weights = 1.0, 0.0, 0.0
+    for units in reversed(series):
+        total += weight * units
+        weights += weight
+        weight *= decay
+    return total / weights if weights else 0.0
+
+
+def _weekday_factors(series, start):
+    """Day-of-week demand factors (Monday = 0), 1.0 everywhere without enough data"""
+    total = sum(series)
+    if total <= 0:
+        return [1.0] * 7
+    sums, counts = [0.0] * 7, [0] * 7
+    for offset, units in enumerate(series):
+        weekday = (start + timedelta(days=offset)).weekday()
+        sums[weekday] += units
+        counts[weekday] += 1
+    mean = total / len(series)
+    damping = min(1.0, total / SEASONALITY_FULL_UNITS)
+    return [1.0 + ((sums[w] / counts[w]) / mean - 1.0) * damping if counts[w] else 1.0
+            for w in range(7)]
+
+
+def _std_dev(values):
+    if len(values) < 2:
+        return 0.0
+    mean = sum(values) / len(values)
+    return math.sqrt(sum((v - mean) ** 2 for v in values) / (len(values) - 1))
+
+
+class ReorderForecaster:
+    def __init__(self, db, lead_time_days=LEAD_TIME_DAYS, review_days=REVIEW_DAYS, service_z=SERVICE_Z):
+        self.db = db
+        self.product_model = Product(db)
+        self.lead_time_days = lead_time_days
+        self.review_days = review_days
+        self.service_z = service_z
+
+    # ---------------------------------------------------
+    # Daily rollup
+    # ---------------------------------------------------
+    def refresh(self, full=False):
+        """Bring product_daily_sales up to date; returns the first day re-aggregated"""
+        conn = self.db.get_connection()
+        cursor = conn.cursor()
+        try:
+            start = None
+            if not full:
+                cursor.execute("SELECT MAX(sales_date) FROM product_daily_sales")
+                start = cursor.fetchall()[0][0]
+            if start is None:
+                start = date.today() - timedelta(days=ROLLUP_RETENTION_DAYS)
+            # The last rolled-up day may have been partial, so it is re-aggregated too
+            cursor.execute("""
+                INSERT INTO product_daily_sales (product_id, sales_date, units, revenue)
+                SELECT ti.product_id, DATE(t.transaction_date), SUM(ti.quantity), SUM(ti.subtotal)
+                FROM transactions t
+                JOIN transaction_items ti ON ti.transaction_id = t.transaction_id
+                WHERE t.transaction_date >= %s AND t.transaction_type = 'sale'
+                GROUP BY ti.product_id, DATE(t.transaction_date)
+                ON DUPLICATE KEY UPDATE units = VALUES(units), revenue = VALUES(revenue)
+            """, (start,))
+            cursor.execute("DELETE FROM product_daily_sales WHERE sales_date < %s",
+                           (date.today() - timedelta(days=ROLLUP_RETENTION_DAYS),))
+            conn.commit()
+            return start
+        except mysql.connector.Error as e:
+            conn.rollback()
+            print(f"Sales rollup warning: {e}")
+            return None
+        finally:
+            cursor.close()
+            conn.close()
+
+    def _daily_series(self, start, days):
+        """{product_id: [units per day]} for `days` days from `start` (missing days are 0)"""
+        conn = self.db.get_connection()
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT product_id, sales_date, units FROM product_daily_sales
+            WHERE sales_date >= %s AND sales_date < %s
+        """, (start, start + timedelta(days=days)))
+        series = {}
+        for product_id, sales_date, units in cursor.fetchall():
+            series.setdefault(product_id, [0] * days)[(sales_date - start).days] = int(units)
+        cursor.close()
+        conn.close()
+        return series
+
+    # ---------------------------------------------------
+    # Forecast
+    # ---------------------------------------------------
+    def forecast(self, refresh=True):
+        """A ReorderSuggestion per active product, soonest stock-out first"""
+        if refresh:
+            self.refresh()
+        today = date.today()
+        # Complete days only: today's partial sales would read as a slump
+        start = today - timedelta(days=HISTORY_DAYS)
+        series = self._daily_series(start, HISTORY_DAYS)
+
+        results = []
+        for product in self.product_model.get_all_products():
+            daily = series.get(product.product_id, [0] * HISTORY_DAYS)
+            results.append(self._project(product, daily, start, today))
+        results.sort(key=lambda s: (s.days_of_cover is None, s.days_of_cover or 0, s.name))
+        return results
+
+    def suggestions(self, refresh=True):
+        """Only the products that should be reordered now"""
+        return [s for s in self.forecast(refresh) if s.reorder_qty > 0]
+
+    def _project(self, product, daily, start, today):
+        velocity = _weighted_velocity(daily)
+        factors = _weekday_factors(daily, start)
+        horizon = self.lead_time_days + self.review_days
+
+        def demand(offset):
+            return velocity * factors[(today + timedelta(days=offset)).weekday()]
+
+        days_of_cover = None
+        if velocity > 0:
+            remaining = max(product.stock, 0)
+            days_of_cover = float(MAX_COVER_DAYS)
+            for offset in range(MAX_COVER_DAYS):
+                need = demand(offset)
+                if need >= remaining:
+                    days_of_cover = offset + (remaining / need if need else 0.0)
+                    break
+                remaining -= need
+
+        safety = self.service_z * _std_dev(daily[-28:]) * math.sqrt(self.lead_time_days)
+        reorder_point = math.ceil(sum(demand(d) for d in range(self.lead_time_days)) + safety)
+        reorder_qty = 0
+        if velocity > 0 and product.stock <= reorder_point:
+            target = sum(demand(d) for d in range(horizon)) + safety
+            reorder_qty = max(0, math.ceil(target - product.stock))
+
+        return ReorderSuggestion(product.product_id, product.name, product.stock, round(velocity, 2),
+                                 None if days_of_cover is None else round(days_of_cover, 1),
+                                 reorder_point, reorder_qty)
@@ -0,0 +1,49 @@
+from PyQt6.QtCore import QObject, pyqtSignal
+import metrics
+import model_events
+from models import InventoryAlerts
+
+
+class AlertMonitor(QObject):
+    """Process-wide low-stock monitor.
+
+    Listens for product writes (checkouts, returns, stock edits, imports) and
+    re-evaluates thresholds for just the touched products, so alerts are
+    raised the moment stock crosses a threshold without any periodic scan.
+    Admin windows connect to the signals to be notified.
+    """
+    # Emitted with the InventoryAlertRows that were raised or escalated
+    alerts_raised = pyqtSignal(list)
+    # Emitted with the product IDs whose alerts were resolved
+    alerts_resolved = pyqtSignal(list)
+
+    def __init__(self, db):
+        super().__init__()
+        self.alert_model = InventoryAlerts(db)
+        model_events.subscribe(model_events.PRODUCTS_CHANGED, self._on_products_changed)
+
+    def open_alerts(self):
+        return self.alert_model.get_open_alerts()
+
+    def acknowledge(self, alert_id, user_id):
+        return self.alert_model.acknowledge(alert_id, user_id)
+
+    def _on_products_changed(self, product_ids=None):
+        raised, resolved = self.alert_model.evaluate(product_ids)
+        for alert in raised:
+            metrics.INVENTORY_ALERTS.labels(type=alert.alert_type).inc()
+        if raised:
+            self.alerts_raised.emit(raised)
+        if resolved:
+            self.alerts_resolved.emit(resolved)
+
+
+_monitor = None
+
+
+def get_alert_monitor(db):
+    """Return the single AlertMonitor for this process"""
+    global _monitor
+    if _monitor is None:
+        _monitor = AlertMonitor(db)
+    return _monitor
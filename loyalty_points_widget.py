@@ -3,6 +3,7 @@ from PyQt6.QtGui import QFont, QIntValidator
 from PyQt6.QtCore import Qt
 from datetime import datetime
 from models import Customer
+from loyalty_tiers import DEFAULT_TIER_THRESHOLDS
 from decimal import Decimal
 
 
@@ -10,7 +11,7 @@ from decimal import Decimal
 # 1️⃣ Loyalty Gradient Card
 # ==========================================================
 class LoyaltyCardWidget(QWidget):
-    def __init__(self, db, customer_id):
+    def __init__(self, db, customer_id, customer=None):
         super().__init__()
         self.db = db
         self.customer_id = customer_id
@@ -49,22 +50,18 @@ class LoyaltyCardWidget(QWidget):
         card_layout.addWidget(self.value_label)
 
         layout.addWidget(card)
-        self.refresh()
+        self.refresh(customer)
 
-    def refresh(self):
-        c = self.customer_model.get_customer(self.customer_id)
+    def refresh(self, customer=None):
+        c = customer or self.customer_model.get_customer(self.customer_id)
         if not c:
             return
 
         points = int(c[7])
         self.points_label.setText(f"{points:,} points")
 
-        if points >= 1000:
-            tier = "VIP"
-        elif points >= 500:
-            tier = "Premium"
-        else:
-            tier = "Regular"
+        tier = self.customer_model.tier_engine.qualified_type(points)
+        tier = "VIP" if tier == "vip" else tier.title()
 
         self.tier_label.setText(f"Member Tier: {tier}")
         self.value_label.setText(f"Points Value: ${points/10:.2f}")
@@ -74,17 +71,25 @@ class LoyaltyCardWidget(QWidget):
 # 2️⃣ Membership Tiers Widget
 # ==========================================================
 class MembershipTierWidget(QWidget):
-    def __init__(self):
+    MEDALS = ["🥇", "🥈", "🥉"]
+
+    def __init__(self, thresholds=DEFAULT_TIER_THRESHOLDS):
         super().__init__()
 
         group = QGroupBox("Membership Tiers")
         layout = QVBoxLayout(group)
 
-        tiers = [
-            "🥉 Regular — 0 to 499 points",
-            "🥈 Premium — 500 to 999 points",
-            "🥇 VIP — 1000+ points",
-        ]
+        # Build the tier list from the same thresholds the tier engine uses
+        ordered = sorted(thresholds, key=lambda t: t[1], reverse=True) + [("regular", 0)]
+        tiers = []
+        upper = None
+        for index, (customer_type, minimum) in enumerate(ordered):
+            name = "VIP" if customer_type == "vip" else customer_type.title()
+            medal = self.MEDALS[min(index, len(self.MEDALS) - 1)]
+            points = f"{minimum}+" if upper is None else f"{minimum} to {upper - 1}"
+            tiers.append(f"{medal} {name} — {points} points")
+            upper = minimum
+        tiers.reverse()
 
         for t in tiers:
             lbl = QLabel(t)
@@ -99,7 +104,7 @@ class MembershipTierWidget(QWidget):
 # 3️⃣ Redeem Points Widget
 # ==========================================================
 class RedeemPointsWidget(QWidget):
-    def __init__(self, db, customer_id):
+    def __init__(self, db, customer_id, customer=None):
         super().__init__()
         self.db = db
         self.customer_id = customer_id
@@ -162,13 +167,13 @@ class RedeemPointsWidget(QWidget):
         main = QVBoxLayout(self)
         main.addWidget(group)
 
-        self.refresh()
+        self.refresh(customer)
 
     # ---------------------------------------------------
     # Refresh max available points
     # ---------------------------------------------------
-    def refresh(self):
-        c = self.customer_model.get_customer(self.customer_id)
+    def refresh(self, customer=None):
+        c = customer or self.customer_model.get_customer(self.customer_id)
         if c:
             self.max_points = int(c[7])  # loyalty_points column
         else:
@@ -242,54 +247,70 @@ class RedeemPointsWidget(QWidget):
 # 4️⃣ Points History Widget  (REQUIRED!)
 # ==========================================================
 class PointsHistoryWidget(QWidget):
-    def __init__(self, db, customer_id):
+    PAGE_SIZE = 50
+
+    REASON_LABELS = {
+        "purchase": "Purchase",
+        "refund": "Refund",
+        "redemption": "Redeemed",
+        "adjustment": "Adjustment",
+        "backfill_adjustment": "Balance carried over",
+    }
+
+    def __init__(self, db, customer_id, first_page=None):
         super().__init__()
         self.db = db
         self.customer_id = customer_id
+        self.customer_model = Customer(db)
+        self.last_entry = None
 
         group = QGroupBox("📊 Points History")
         layout = QVBoxLayout(group)
 
-        self.table = QTableWidget(0, 3)
-        self.table.setHorizontalHeaderLabels(["Date", "Transaction", "Points Earned"])
+        self.table = QTableWidget(0, 4)
+        self.table.setHorizontalHeaderLabels(["Date", "Activity", "Points", "Balance"])
         self.table.horizontalHeader().setStretchLastSection(True)
         self.table.setMinimumHeight(200)
 
         layout.addWidget(self.table)
 
+        self.load_more_btn = QPushButton("Load More")
+        self.load_more_btn.clicked.connect(lambda: self.load_more())
+        layout.addWidget(self.load_more_btn)
+
         main = QVBoxLayout(self)
         main.addWidget(group)
 
-        self.refresh()
+        self.refresh(first_page)
 
-    def refresh(self):
+    def refresh(self, first_page=None):
         self.table.setRowCount(0)
+        self.last_entry = None
+        self.load_more(first_page)
+
+    def load_more(self, entries=None):
+        """Append the next page of ledger entries (or an already fetched first page)"""
+        if entries is None:
+            entries = self.customer_model.get_loyalty_history(
+                self.customer_id, limit=self.PAGE_SIZE, before=self.last_entry
+            )
 
-        conn = self.db.get_connection()
-        cursor = conn.cursor()
-
-        cursor.execute("""
-            SELECT t.transaction_date,
-                   SUM(ti.quantity * 5) AS points_earned
-            FROM transactions t
-            JOIN transaction_items ti ON t.transaction_id = ti.transaction_id
-            WHERE t.customer_id = %s
-            GROUP BY t.transaction_id
-            ORDER BY t.transaction_date DESC
-        """, (self.customer_id,))
-
-        rows = cursor.fetchall()
-        conn.close()
-
-        for row_index, row in enumerate(rows):
-            date_value = row[0]
+        for entry in entries:
+            row_index = self.table.rowCount()
+            date_value = entry.created_at
             if hasattr(date_value, "strftime"):
                 date_value = date_value.strftime("%Y-%m-%d")
 
-            points = row[1] or 0
+            activity = self.REASON_LABELS.get(entry.reason, entry.reason.title())
+            if entry.transaction_id:
+                activity += f" #{entry.transaction_id}"
 
             self.table.insertRow(row_index)
             self.table.setItem(row_index, 0, QTableWidgetItem(str(date_value)))
-            self.table.setItem(row_index, 1, QTableWidgetItem("Purchase"))
-            self.table.setItem(row_index, 2, QTableWidgetItem(str(points)))
+            self.table.setItem(row_index, 1, QTableWidgetItem(activity))
+            self.table.setItem(row_index, 2, QTableWidgetItem(f"{entry.delta:+d}"))
+            self.table.setItem(row_index, 3, QTableWidgetItem(str(entry.balance_after)))
 
+        if entries:
+            self.last_entry = entries[-1]
+        self.load_more_btn.setVisible(len(entries) == self.PAGE_SIZE)
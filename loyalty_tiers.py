@@ -0,0 +1,157 @@
+import sys
+import time
+from typing import NamedTuple, Optional
+
+# =============================================================================
+# LOYALTY TIER ENGINE
+# Tiers are earned by points and never downgraded. Thresholds are data, not
+# code: pass your own (customer_type, minimum_points) pairs to the engine.
+# =============================================================================
+DEFAULT_TIER_THRESHOLDS = (
+    ("vip", 1000),
+    ("premium", 500),
+)
+
+# Higher = better. Tiers that are not earned by points (student) still rank.
+TIER_PRIORITY = {
+    "regular": 0,
+    "student": 1,
+    "premium": 2,
+    "vip": 3,
+}
+
+
+class TierChange(NamedTuple):
+    customer_id: int
+    full_name: str
+    loyalty_points: int
+    old_type: Optional[str]
+    new_type: str
+
+
+class LoyaltyTierEngine:
+    """Recompute customer_type from loyalty_points, set-based, in SQL"""
+
+    def __init__(self, db, thresholds=None, priority=None):
+        self.db = db
+        thresholds = thresholds or DEFAULT_TIER_THRESHOLDS
+        # Highest threshold first so the CASE picks the best tier
+        self.thresholds = tuple(sorted(thresholds, key=lambda t: t[1], reverse=True))
+        self.priority = priority or TIER_PRIORITY
+
+    def qualified_type(self, points):
+        """Tier earned by a points balance ('regular' if none)"""
+        for customer_type, minimum in self.thresholds:
+            if points >= minimum:
+                return customer_type
+        return "regular"
+
+    # ---------------------------------------------------
+    # SQL building blocks
+    # ---------------------------------------------------
+    def _qualified_sql(self):
+        """CASE expression yielding the earned tier, or NULL when below every threshold"""
+        whens = " ".join("WHEN loyalty_points >= %s THEN %s" for _ in self.thresholds)
+        params = []
+        for customer_type, minimum in self.thresholds:
+            params.extend([minimum, customer_type])
+        return f"(CASE {whens} END)", params
+
+    def _upgrade_condition(self):
+        """WHERE fragment: earned tier ranks above the current one (unknown types rank lowest)"""
+        qualified, params = self._qualified_sql()
+        ranked = [t for t, _ in sorted(self.priority.items(), key=lambda kv: kv[1])]
+        field_list = ", ".join(["%s"] * len(ranked))
+        condition = (f"{qualified} IS NOT NULL "
+                     f"AND FIELD({qualified}, {field_list}) > FIELD(customer_type, {field_list})")
+        return condition, params + params + ranked + ranked
+
+    # ---------------------------------------------------
+    # Per-checkout (inside the caller's transaction)
+    # ---------------------------------------------------
+    def recalculate_customer(self, cursor, customer_id):
+        """Upgrade one customer using the caller's cursor; returns True if upgraded"""
+        qualified, q_params = self._qualified_sql()
+        condition, c_params = self._upgrade_condition()
+        cursor.execute(f"""
+            UPDATE customers
+            SET customer_type = {qualified}
+            WHERE customer_id = %s AND is_active = 1 AND {condition}
+        """, tuple(q_params + [customer_id] + c_params))
+        return cursor.rowcount > 0
+
+    # ---------------------------------------------------
+    # Batch job
+    # ---------------------------------------------------
+    def recalculate_all(self, dry_run=False, chunk_size=50000):
+        """
+        Recompute tiers for every active customer.
+        Work is split into primary-key ranges so each chunk is one short UPDATE
+        (no long-held locks on a large table). With dry_run=True nothing is
+        written and the list of TierChange that WOULD be applied is returned;
+        otherwise the number of upgraded customers is returned.
+        """
+        conn = self.db.get_connection()
+        cursor = conn.cursor()
+
+        cursor.execute("SELECT MIN(customer_id), MAX(customer_id) FROM customers")
+        low, high = cursor.fetchone()
+        if low is None:
+            conn.close()
+            return [] if dry_run else 0
+
+        qualified, q_params = self._qualified_sql()
+        condition, c_params = self._upgrade_condition()
+        changes = []
+        upgraded = 0
+
+        try:
+            for start in range(low, high + 1, chunk_size):
+                end = start + chunk_size - 1
+                if dry_run:
+                    cursor.execute(f"""
+                        SELECT customer_id, full_name, loyalty_points, customer_type, {qualified}
+                        FROM customers
+                        WHERE customer_id BETWEEN %s AND %s AND is_active = 1 AND {condition}
+                    """, tuple(q_params + [start, end] + c_params))
+                    changes.extend(TierChange._make(row) for row in cursor.fetchall())
+                else:
+                    cursor.execute(f"""
+                        UPDATE customers
+                        SET customer_type = {qualified}
+                        WHERE customer_id BETWEEN %s AND %s AND is_active = 1 AND {condition}
+                    """, tuple(q_params + [start, end] + c_params))
+                    upgraded += cursor.rowcount
+                    conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+        return changes if dry_run else upgraded
+
+
+# =============================================================================
+# Command line:  python loyalty_tiers.py [--dry-run]
+# Prints the diff (dry run) or upgrades tiers, with timing for benchmarking.
+# =============================================================================
+if __name__ == "__main__":
+    from database import Database
+
+    dry_run = "--dry-run" in sys.argv
+    engine = LoyaltyTierEngine(Database())
+
+    started = time.perf_counter()
+    result = engine.recalculate_all(dry_run=dry_run)
+    elapsed = time.perf_counter() - started
+
+    if dry_run:
+        for change in result[:50]:
+            print(f"{change.customer_id:>8}  {change.full_name:<30} "
+                  f"{change.loyalty_points:>7} pts  {change.old_type} -> {change.new_type}")
+        if len(result) > 50:
+            print(f"... and {len(result) - 50} more")
+        print(f"{len(result)} customers would be upgraded ({elapsed:.2f}s)")
+    else:
+        print(f"{result} customers upgraded ({elapsed:.2f}s)")
@@ -4,13 +4,23 @@ from PyQt6.QtCore import Qt, QTimer
 from PyQt6.QtGui import QPixmap, QFont, QPalette, QColor
 from database import Database
 from auth_window import LoginWindow
+from inventory_alerts import get_alert_monitor
+import ui_profiler
+import metrics
 from decimal import Decimal
 
 class TechHavenApp:
     def __init__(self):
         self.app = QApplication(sys.argv)
+        if ui_profiler.enabled():
+            # TECHHAVEN_UI_PROFILE=1 (or a trace path): stall/method/widget profiling
+            ui_profiler.install(self.app)
+        # TECHHAVEN_METRICS_PORT / TECHHAVEN_METRICS_FILE: Prometheus-style exporters
+        metrics.start_from_environment()
         self.setup_app_style()
         self.db = Database()
+        # Low-stock alerts are evaluated on every product write from start-up
+        get_alert_monitor(self.db)
         
     def setup_app_style(self):
         """Setup global application styling"""
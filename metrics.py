@@ -0,0 +1,323 @@
+import bisect
+import functools
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# =============================================================================
+# METRICS
+# A small Prometheus-style registry (counters, gauges, histograms with labels)
+# exported in the text exposition format over a local HTTP endpoint and/or a
+# periodically rewritten file. Hot-path cost is one dict lookup and one locked
+# add per observation; label children can be bound once at import time.
+#
+#   TECHHAVEN_METRICS_PORT=9464      serve http://127.0.0.1:9464/metrics
+#   TECHHAVEN_METRICS_FILE=path.prom rewrite the file every ..._INTERVAL s (15)
+# =============================================================================
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+               for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+        if not self.labelnames:
+            self._children[()] = self._new_child()
+
+    def labels(self, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def _default(self):
+        return self._children[()]
+
+    def collect(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for key, child in sorted(self._children.items()):
+            lines.extend(child.expose(self.name, self.labelnames, key))
+        return lines
+
+
+# ---------------------------------------------------
+# Counter / Gauge / Histogram
+# ---------------------------------------------------
+class _Value:
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount=1):
+        with self._lock:
+            self.value -= amount
+
+    def set(self, value):
+        self.value = float(value)
+
+    def expose(self, name, labelnames, key):
+        return [f"{name}{_format_labels(labelnames, key)} {self.value:g}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount=1):
+        self._default().inc(amount)
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name, documentation, labelnames=(), function=None):
+        self.function = function
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _Value()
+
+    def set(self, value):
+        self._default().set(value)
+
+    def inc(self, amount=1):
+        self._default().inc(amount)
+
+    def dec(self, amount=1):
+        self._default().dec(amount)
+
+    def collect(self):
+        if self.function is not None:
+            try:
+                self._default().set(self.function())
+            except Exception:
+                pass
+        return super().collect()
+
+
+class _HistogramChild:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    def time(self):
+        return _Timer(self)
+
+    def expose(self, name, labelnames, key):
+        with self._lock:
+            counts = list(self.counts)
+            total = self.sum
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), counts):
+            cumulative += count
+            le = "+Inf" if bound == float("inf") else f"{bound:g}"
+            lines.append(f"{name}_bucket{_format_labels(labelnames, key, ('le', le))} {cumulative}")
+        lines.append(f"{name}_sum{_format_labels(labelnames, key)} {total:g}")
+        lines.append(f"{name}_count{_format_labels(labelnames, key)} {cumulative}")
+        return lines
+
+
+class _Timer:
+    def __init__(self, child):
+        self.child = child
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.child.observe(time.perf_counter() - self.started)
+        return False
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value):
+        self._default().observe(value)
+
+    def time(self):
+        return self._default().time()
+
+
+# ---------------------------------------------------
+# Registry + exporters
+# ---------------------------------------------------
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=(), function=None):
+        return self._register(Gauge(name, documentation, labelnames, function))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def exposition(self):
+        """All metrics in the Prometheus text format"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in sorted(metrics, key=lambda m: m.name):
+            lines.extend(metric.collect())
+        return "\n".join(lines) + "\n"
+
+    def write_file(self, path):
+        # Write + rename so scrapers never read a half-written file
+        temporary = f"{path}.tmp"
+        with open(temporary, "w", encoding="utf-8") as f:
+            f.write(self.exposition())
+        os.replace(temporary, path)
+
+
+registry = MetricsRegistry()
+counter = registry.counter
+gauge = registry.gauge
+histogram = registry.histogram
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+        body = registry.exposition().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # Keep scrapes out of the console
+
+
+def start_http_server(port, host="127.0.0.1"):
+    """Serve /metrics on a daemon thread; returns the server"""
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True, name="metrics-http").start()
+    return server
+
+
+def start_file_dump(path, interval=15.0):
+    """Rewrite `path` every `interval` seconds on a daemon thread"""
+    def loop():
+        while True:
+            try:
+                registry.write_file(path)
+            except OSError as e:
+                print(f"Metrics dump warning: {e}")
+            time.sleep(interval)
+
+    threading.Thread(target=loop, daemon=True, name="metrics-dump").start()
+
+
+def timed(histogram_child):
+    """Decorator observing a function's duration into a (bound) histogram"""
+    def decorate(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                histogram_child.observe(time.perf_counter() - started)
+        return wrapper
+    return decorate
+
+
+def start_from_environment():
+    """Start the exporters configured through TECHHAVEN_METRICS_* (no-op if unset)"""
+    port = os.environ.get("TECHHAVEN_METRICS_PORT")
+    if port:
+        try:
+            start_http_server(int(port))
+            print(f"✓ Metrics on http://127.0.0.1:{port}/metrics")
+        except OSError as e:
+            print(f"Metrics endpoint warning: {e}")
+    path = os.environ.get("TECHHAVEN_METRICS_FILE")
+    if path:
+        start_file_dump(path, float(os.environ.get("TECHHAVEN_METRICS_INTERVAL", "15")))
+
+
+# =============================================================================
+# APPLICATION METRICS
+# =============================================================================
+CHECKOUTS = counter("techhaven_checkouts_total", "Completed sales recorded in the database", ["channel"])
+CHECKOUT_REPLAYS = counter("techhaven_checkout_replays_total",
+                           "Checkout attempts answered with an already recorded sale", ["channel"])
+CHECKOUT_FAILURES = counter("techhaven_checkout_failures_total", "Checkouts that raised an error", ["channel"])
+CHECKOUT_SECONDS = histogram("techhaven_checkout_seconds", "Time to record a sale in the database", ["channel"])
+
+REFUNDS = counter("techhaven_refunds_total", "Refund transactions", ["source", "status"])
+REFUND_AMOUNT = counter("techhaven_refund_amount_total", "Refunded value, in dollars", ["source"])
+REFUND_SECONDS = histogram("techhaven_refund_seconds", "Time to process a refund", ["source"])
+
+REPORT_SECONDS = histogram("techhaven_report_seconds", "Report generation time", ["report"],
+                           buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60))
+
+DB_CONNECTIONS = counter("techhaven_db_connections_total", "Connections handed out", ["source"])
+DB_ACQUIRE_SECONDS = histogram("techhaven_db_connection_acquire_seconds", "Time to obtain a DB connection",
+                               buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.5, 1))
+DB_POOL_EXHAUSTED = counter("techhaven_db_pool_exhausted_total",
+                            "Requests that found the pool empty and opened a direct connection")
+
+CACHE_REQUESTS = counter("techhaven_cache_requests_total", "Cache lookups", ["cache", "result"])
+
+TILL_SYNCED = counter("techhaven_till_synced_sales_total", "Queued till sales synced to the database")
+TILL_SYNC_FAILED = counter("techhaven_till_failed_sales_total", "Queued till sales rejected by the database")
+
+INVENTORY_ALERTS = counter("techhaven_inventory_alerts_total", "Low/out-of-stock alerts raised", ["type"])
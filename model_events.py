@@ -0,0 +1,41 @@
+"""Publish/subscribe hooks for model-layer writes.
+
+The model layer stays free of Qt: it publishes plain events here after a
+commit, and UI-side stores (e.g. the catalog store) subscribe and turn them
+into Qt signals.
+"""
+
+PRODUCTS_CHANGED = "products_changed"
+
+_subscribers = {}
+
+
+def subscribe(event, callback):
+    """Register callback(**payload) for an event"""
+    callbacks = _subscribers.setdefault(event, [])
+    if callback not in callbacks:
+        callbacks.append(callback)
+
+
+def unsubscribe(event, callback):
+    callbacks = _subscribers.get(event, [])
+    if callback in callbacks:
+        callbacks.remove(callback)
+
+
+def publish(event, **payload):
+    """Notify every subscriber; a failing subscriber never breaks the write path"""
+    for callback in list(_subscribers.get(event, [])):
+        try:
+            callback(**payload)
+        except Exception as e:
+            print(f"Event handler error ({event}): {e}")
+
+
+def products_changed(product_ids=None):
+    """Announce that the given products (or all products, if None) were written"""
+    if product_ids is not None:
+        product_ids = sorted({int(pid) for pid in product_ids})
+        if not product_ids:
+            return
+    publish(PRODUCTS_CHANGED, product_ids=product_ids)
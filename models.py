@@ -1,9 +1,536 @@
 from decimal import Decimal
 from datetime import datetime
-from database import Database
+from typing import NamedTuple, Optional
+import time
+import uuid
+import mysql.connector
+from database import Database, MOVEMENT_INITIAL, is_out_of_stock, out_of_stock_sql
+from query_registry import registry, define
+import metrics
+import model_events
+from loyalty_tiers import LoyaltyTierEngine
+from data_lifecycle import transaction_tables
 import csv
 import io
 
+# =============================================================================
+# ROW RECORDS
+# Typed rows returned by the model layer. NamedTuple keeps __slots__ = () so a
+# row costs no more than a plain tuple, and the field order matches the old
+# positional layout (product[4] is still stock) so existing callers keep working.
+# =============================================================================
+PRODUCT_COLUMNS = ("product_id", "name", "description", "price", "stock",
+                   "category", "low_stock_threshold")
+CUSTOMER_COLUMNS = ("customer_id", "user_id", "full_name", "email", "contact",
+                    "address", "customer_type", "loyalty_points", "pending_discount")
+TRANSACTION_COLUMNS = ("transaction_id", "customer_id", "staff_id", "total_amount",
+                       "discount", "tax", "payment_method", "transaction_type",
+                       "transaction_date")
+TRANSACTION_ITEM_COLUMNS = ("item_id", "transaction_id", "product_id", "quantity",
+                            "unit_price", "subtotal")
+LOYALTY_LEDGER_COLUMNS = ("entry_id", "customer_id", "delta", "balance_after", "reason",
+                          "transaction_id", "created_at")
+STOCK_MOVEMENT_COLUMNS = ("movement_id", "product_id", "delta", "balance_after", "reason",
+                          "reference_id", "created_at")
+INVENTORY_ALERT_COLUMNS = ("alert_id", "product_id", "alert_type", "stock_level", "threshold",
+                           "created_at", "acknowledged_by", "acknowledged_at")
+
+
+def select_columns(columns, alias=None):
+    """Build an explicit column list (optionally table-qualified) for a SELECT"""
+    if alias:
+        return ", ".join(f"{alias}.{col}" for col in columns)
+    return ", ".join(columns)
+
+
+class ProductRow(NamedTuple):
+    product_id: int
+    name: str
+    description: Optional[str]
+    price: Decimal
+    stock: int
+    category: Optional[str]
+    low_stock_threshold: int
+
+
+class CustomerRow(NamedTuple):
+    customer_id: int
+    user_id: Optional[int]
+    full_name: str
+    email: str
+    contact: Optional[str]
+    address: Optional[str]
+    customer_type: str
+    loyalty_points: int
+    pending_discount: Decimal
+
+
+class TransactionRow(NamedTuple):
+    transaction_id: int
+    customer_id: Optional[int]
+    staff_id: Optional[int]
+    total_amount: Decimal
+    discount: Decimal
+    tax: Decimal
+    payment_method: Optional[str]
+    transaction_type: str
+    transaction_date: datetime
+    customer_name: Optional[str] = None
+    staff_name: Optional[str] = None
+
+
+class TransactionItemRow(NamedTuple):
+    item_id: int
+    transaction_id: int
+    product_id: int
+    quantity: int
+    unit_price: Decimal
+    subtotal: Decimal
+    product_name: Optional[str] = None
+
+
+class ReturnableItemRow(NamedTuple):
+    item_id: int
+    product_id: int
+    product_name: str
+    quantity: int
+    returned_quantity: int
+    remaining: int
+    unit_price: Decimal
+    subtotal: Decimal
+
+
+class OrderStatsRow(NamedTuple):
+    customer_id: int
+    order_count: int
+    lifetime_value: Decimal
+    last_purchase_at: Optional[datetime]
+
+
+class LoyaltyEntryRow(NamedTuple):
+    entry_id: int
+    customer_id: int
+    delta: int
+    balance_after: int
+    reason: str
+    transaction_id: Optional[int]
+    created_at: datetime
+
+
+class StockMovementRow(NamedTuple):
+    movement_id: int
+    product_id: int
+    delta: int
+    balance_after: int
+    reason: str
+    reference_id: Optional[int]
+    created_at: datetime
+
+
+class InventoryAlertRow(NamedTuple):
+    alert_id: int
+    product_id: int
+    alert_type: str
+    stock_level: int
+    threshold: int
+    created_at: datetime
+    acknowledged_by: Optional[int]
+    acknowledged_at: Optional[datetime]
+    product_name: Optional[str] = None
+
+
+class CustomerSessionBundle(NamedTuple):
+    """Everything the customer window shows on open, loaded together at login"""
+    customer: CustomerRow
+    order_stats: OrderStatsRow
+    cart_items: list
+    loyalty_history: list
+
+
+def _rows(record_cls, rows):
+    """Wrap fetched tuples in a record class"""
+    make = record_cls._make
+    return [make(row) for row in rows]
+
+
+def _row(record_cls, row):
+    return record_cls._make(row) if row else None
+
+
+# =============================================================================
+# NAMED QUERIES
+# Fixed-shape statements used by the models, defined once and executed by name
+# through the query registry (prepared on the connection, timed per name).
+# Statements whose shape varies per call (IN lists, multi-row VALUES) stay
+# inline next to their callers. Active-only reads go through the
+# active_products / active_customers / active_staff views (database.ACTIVE_VIEWS).
+# Sales older than data_lifecycle.ARCHIVE_AFTER_MONTHS live in
+# transactions_archive / transaction_items_archive; the "*_archived" queries
+# are the fallbacks for lookups that miss the hot tables.
+# =============================================================================
+_CUSTOMER = select_columns(CUSTOMER_COLUMNS)
+_PRODUCT = select_columns(PRODUCT_COLUMNS)
+_TRANSACTION_WITH_NAMES = f"""
+    SELECT {select_columns(TRANSACTION_COLUMNS, 't')},
+           CASE WHEN c.is_active = 0 THEN CONCAT(c.full_name, ' (Deleted)') ELSE c.full_name END as customer_name,
+           CASE WHEN u.is_active = 0 THEN CONCAT(u.full_name, ' (Inactive)') ELSE u.full_name END as staff_name
+    FROM {{table}} t
+    LEFT JOIN customers c ON t.customer_id = c.customer_id
+    LEFT JOIN users u ON t.staff_id = u.user_id
+    WHERE t.transaction_id = %s
+"""
+_CUSTOMER_HISTORY = f"""
+    SELECT {select_columns(TRANSACTION_COLUMNS, 't')}, NULL AS customer_name,
+           u.full_name AS staff_name
+    FROM {{table}} t
+    LEFT JOIN users u ON t.staff_id = u.user_id
+    WHERE t.customer_id = %s {{keyset}}
+    ORDER BY t.transaction_date DESC, t.transaction_id DESC
+    LIMIT %s
+"""
+_LOYALTY_HISTORY = f"""
+    SELECT {select_columns(LOYALTY_LEDGER_COLUMNS)} FROM loyalty_ledger
+    WHERE customer_id = %s {{keyset}}
+    ORDER BY created_at DESC, entry_id DESC
+    LIMIT %s
+"""
+
+# ---- Customers ----
+define("customer.insert", """
+    INSERT INTO customers (full_name, email, contact, address, customer_type, is_active)
+    VALUES (%s, %s, %s, %s, %s, 1)
+""")
+define("customer.update", """
+    UPDATE customers
+    SET full_name=%s, email=%s, contact=%s, address=%s, customer_type=%s
+    WHERE customer_id=%s AND is_active = 1
+""")
+define("customer.all_active", f"SELECT {_CUSTOMER} FROM active_customers ORDER BY customer_id DESC")
+define("customer.all", f"SELECT {_CUSTOMER} FROM customers ORDER BY is_active DESC, customer_id DESC")
+define("customer.get", f"SELECT {_CUSTOMER} FROM customers WHERE customer_id=%s")
+define("customer.get_active", f"SELECT {_CUSTOMER} FROM active_customers WHERE customer_id=%s")
+_HISTORY_KEYSET = """
+      AND (t.transaction_date < %s OR (t.transaction_date = %s AND t.transaction_id < %s))"""
+define("customer.history", _CUSTOMER_HISTORY.format(table="transactions", keyset=""))
+define("customer.history_after", _CUSTOMER_HISTORY.format(table="transactions", keyset=_HISTORY_KEYSET))
+define("customer.history_archived", _CUSTOMER_HISTORY.format(table="transactions_archive", keyset=""))
+define("customer.history_archived_after", _CUSTOMER_HISTORY.format(table="transactions_archive",
+                                                                   keyset=_HISTORY_KEYSET))
+define("customer.order_stats", """
+    SELECT customer_id, order_count, lifetime_value, last_purchase_at
+    FROM customer_order_stats WHERE customer_id = %s
+""")
+define("customer.loyalty_balance", "SELECT loyalty_points FROM customers WHERE customer_id = %s")
+define("loyalty.history", _LOYALTY_HISTORY.format(keyset=""))
+define("loyalty.history_after", _LOYALTY_HISTORY.format(keyset="""
+      AND (created_at < %s OR (created_at = %s AND entry_id < %s))"""))
+
+# ---- Products ----
+define("product.insert", """
+    INSERT INTO products (name, description, price, stock, category, low_stock_threshold, is_active)
+    VALUES (%s, %s, %s, %s, %s, %s, 1)
+""")
+define("product.update", """
+    UPDATE products
+    SET name=%s, description=%s, price=%s, stock=%s, category=%s, low_stock_threshold=%s
+    WHERE product_id=%s AND is_active = 1
+""")
+define("product.all_active", f"SELECT {_PRODUCT} FROM active_products ORDER BY product_id DESC")
+define("product.all", f"SELECT {_PRODUCT} FROM products ORDER BY is_active DESC, product_id DESC")
+define("product.get", f"SELECT {_PRODUCT} FROM products WHERE product_id=%s")
+define("product.get_active", f"SELECT {_PRODUCT} FROM active_products WHERE product_id=%s")
+# stock_headroom = stock - low_stock_threshold (indexed generated column)
+define("product.low_stock", f"SELECT {_PRODUCT} FROM active_products WHERE stock_headroom <= 0")
+define("product.adjust_stock", "UPDATE products SET stock = stock + %s WHERE product_id = %s")
+define("product.lock_stock", "SELECT stock FROM products WHERE product_id = %s FOR UPDATE")
+
+# ---- Sales ----
+define("sale.find_by_key", "SELECT transaction_id FROM transactions WHERE idempotency_key = %s")
+define("sale.insert", """
+    INSERT INTO transactions (customer_id, staff_id, total_amount, discount, tax, payment_method,
+                              transaction_type, idempotency_key)
+    VALUES (%s, %s, %s, %s, %s, %s, 'sale', %s)
+""")
+define("sale.insert_item", """
+    INSERT INTO transaction_items (transaction_id, product_id, quantity, unit_price, subtotal)
+    VALUES (%s, %s, %s, %s, %s)
+""")
+# LEFT JOIN: archived items have no foreign key, so their product may be gone
+_TRANSACTION_ITEMS = f"""
+    SELECT {select_columns(TRANSACTION_ITEM_COLUMNS, 'ti')},
+           CASE WHEN p.product_id IS NULL THEN CONCAT('Product #', ti.product_id, ' (Archived)')
+                WHEN p.is_active = 0 THEN CONCAT(p.name, ' (Discontinued)') ELSE p.name END as product_name
+    FROM {{table}} ti
+    LEFT JOIN products p ON ti.product_id = p.product_id
+    WHERE ti.transaction_id = %s
+"""
+define("transaction.get", _TRANSACTION_WITH_NAMES.format(table="transactions"))
+define("transaction.get_archived", _TRANSACTION_WITH_NAMES.format(table="transactions_archive"))
+define("transaction.items", _TRANSACTION_ITEMS.format(table="transaction_items"))
+define("transaction.items_archived", _TRANSACTION_ITEMS.format(table="transaction_items_archive"))
+define("transaction.returnable_items", """
+    SELECT ti.item_id, ti.product_id,
+           CASE WHEN p.is_active = 0 THEN CONCAT(p.name, ' (Discontinued)') ELSE p.name END as product_name,
+           ti.quantity, ti.returned_quantity, ti.quantity - ti.returned_quantity,
+           ti.unit_price, ti.subtotal
+    FROM transaction_items ti
+    JOIN products p ON ti.product_id = p.product_id
+    WHERE ti.transaction_id = %s
+    ORDER BY ti.item_id
+""")
+# Day ranges are half-open on the raw column so idx_transactions_date is usable
+define("transaction.daily_sales", """
+    SELECT COUNT(*), SUM(total_amount)
+    FROM transactions
+    WHERE transaction_date >= %s AND transaction_date < %s + INTERVAL 1 DAY
+      AND transaction_type = 'sale'
+""")
+_SALES_BY_DATE_RANGE = f"""
+    SELECT {select_columns(TRANSACTION_COLUMNS)} FROM {{table}}
+    WHERE transaction_date >= %s AND transaction_date < %s + INTERVAL 1 DAY
+      AND transaction_type = 'sale'
+    ORDER BY transaction_date DESC
+"""
+define("transaction.by_date_range", _SALES_BY_DATE_RANGE.format(table="transactions"))
+define("transaction.by_date_range_all", _SALES_BY_DATE_RANGE.format(table="all_transactions"))
+
+# ---- Stock ledger ----
+_STOCK_MOVEMENTS = f"""
+    SELECT {select_columns(STOCK_MOVEMENT_COLUMNS)} FROM stock_movements
+    WHERE product_id = %s {{keyset}}
+    ORDER BY created_at DESC, movement_id DESC
+    LIMIT %s
+"""
+define("stock.movements", _STOCK_MOVEMENTS.format(keyset=""))
+define("stock.movements_after", _STOCK_MOVEMENTS.format(keyset="""
+      AND (created_at < %s OR (created_at = %s AND movement_id < %s))"""))
+define("stock.at", """
+    SELECT balance_after FROM stock_movements
+    WHERE product_id = %s AND created_at <= %s
+    ORDER BY created_at DESC, movement_id DESC
+    LIMIT 1
+""")
+define("stock.snapshot_before", "SELECT MAX(snapshot_at) FROM stock_snapshots WHERE snapshot_at <= %s")
+define("stock.snapshot_levels", "SELECT product_id, stock, price FROM stock_snapshots WHERE snapshot_at = %s")
+# Last balance per product among the movements after a snapshot, up to the moment.
+# LEFT JOIN: a product archived since (products_archive) still held that stock,
+# its price is NULL here and filled in by StockLedger.stock_levels_at
+_STOCK_LEVELS_SINCE = """
+    SELECT m.product_id, m.balance_after, p.price
+    FROM stock_movements m
+    JOIN (SELECT product_id, MAX(movement_id) AS movement_id FROM stock_movements
+          WHERE {since} created_at <= %s
+          GROUP BY product_id) latest ON latest.movement_id = m.movement_id
+    LEFT JOIN products p ON p.product_id = m.product_id
+"""
+define("stock.levels_since", _STOCK_LEVELS_SINCE.format(since="created_at > %s AND"))
+define("stock.levels_until", _STOCK_LEVELS_SINCE.format(since=""))
+
+# ---- Inventory report ----
+# Same status rules as the CASE in generate_inventory_status_report
+define("report.inventory_summary", f"""
+    SELECT COUNT(*),
+           COALESCE(SUM({out_of_stock_sql()}), 0),
+           COALESCE(SUM(NOT ({out_of_stock_sql()}) AND stock_headroom <= 0), 0),
+           COALESCE(SUM(price * stock), 0)
+    FROM active_products
+""")
+
+# ---- Inventory alerts ----
+define("alert.open", f"""
+    SELECT {select_columns(INVENTORY_ALERT_COLUMNS, 'a')}, p.name
+    FROM inventory_alerts a
+    JOIN products p ON a.product_id = p.product_id
+    WHERE a.resolved_at IS NULL
+    ORDER BY a.alert_type = 'out_of_stock' DESC, a.created_at DESC
+""")
+define("alert.acknowledge", """
+    UPDATE inventory_alerts SET acknowledged_by = %s, acknowledged_at = NOW()
+    WHERE alert_id = %s AND acknowledged_at IS NULL
+""")
+
+# ---- Shopping cart ----
+# Insert or add to the customer's line in one statement. The SELECT yields no
+# row unless the product is active and the new total (existing line + added
+# units) still fits the stock, so rowcount 0 = rejected.
+define("cart.upsert", """
+    INSERT INTO shopping_cart (customer_id, product_id, quantity)
+    SELECT %s, p.product_id, %s
+    FROM products p
+    LEFT JOIN shopping_cart c ON c.customer_id = %s AND c.product_id = p.product_id
+    WHERE p.product_id = %s AND p.is_active = 1 AND p.stock >= COALESCE(c.quantity, 0) + %s
+    ON DUPLICATE KEY UPDATE quantity = shopping_cart.quantity + VALUES(quantity)
+""")
+# Explicit quantity edit: absolute, but only for an active product with the stock
+define("cart.set", """
+    INSERT INTO shopping_cart (customer_id, product_id, quantity)
+    SELECT %s, p.product_id, %s
+    FROM products p
+    WHERE p.product_id = %s AND p.is_active = 1 AND p.stock >= %s
+    ON DUPLICATE KEY UPDATE quantity = VALUES(quantity)
+""")
+define("cart.availability", """
+    SELECT p.is_active, p.stock, COALESCE(c.quantity, 0), p.name
+    FROM products p
+    LEFT JOIN shopping_cart c ON c.product_id = p.product_id AND c.customer_id = %s
+    WHERE p.product_id = %s
+""")
+define("cart.items", f"""
+    SELECT c.cart_id, c.quantity, {select_columns(PRODUCT_COLUMNS, 'p')}
+    FROM shopping_cart c
+    JOIN products p ON c.product_id = p.product_id
+    WHERE c.customer_id = %s AND p.is_active = 1
+""")
+define("cart.clear", "DELETE FROM shopping_cart WHERE customer_id=%s")
+
+
+# =============================================================================
+# LOYALTY LEDGER
+# =============================================================================
+def _apply_loyalty_delta(cursor, customer_id, delta, reason, transaction_id=None):
+    """
+    Change a customer's points and append the matching loyalty_ledger row.
+    Runs inside the caller's DB transaction; the balance is read FOR UPDATE so
+    concurrent writers serialise and balance_after stays exact. Deductions are
+    clamped so the balance never drops below zero. Returns the applied delta.
+    """
+    cursor.execute("SELECT loyalty_points FROM customers WHERE customer_id = %s FOR UPDATE",
+                   (customer_id,))
+    row = cursor.fetchone()
+    if row is None:
+        return 0
+
+    current = row[0] or 0
+    applied = max(int(delta), -current)
+    if applied == 0:
+        return 0
+
+    balance = current + applied
+    cursor.execute("UPDATE customers SET loyalty_points = %s WHERE customer_id = %s",
+                   (balance, customer_id))
+    cursor.execute('''
+        INSERT INTO loyalty_ledger (customer_id, delta, balance_after, reason, transaction_id)
+        VALUES (%s, %s, %s, %s, %s)
+    ''', (customer_id, applied, balance, reason, transaction_id))
+    return applied
+
+
+# =============================================================================
+# CUSTOMER ORDER STATS
+# Lifetime aggregates per customer, kept in step with transactions so order
+# history screens never have to scan a customer's whole purchase history.
+# =============================================================================
+def record_order_stats(cursor, rows):
+    """
+    Apply (customer_id, orders, amount) deltas inside the caller's DB transaction.
+    Sales pass orders=1 and their total; refunds pass orders=0 and a negative amount.
+    """
+    rows = [row for row in rows if row[0]]
+    if not rows:
+        return
+    cursor.execute(f'''
+        INSERT INTO customer_order_stats (customer_id, order_count, lifetime_value, last_purchase_at)
+        VALUES {", ".join(["(%s, %s, %s, IF(%s > 0, CURRENT_TIMESTAMP, NULL))"] * len(rows))}
+        ON DUPLICATE KEY UPDATE
+            order_count = order_count + VALUES(order_count),
+            lifetime_value = lifetime_value + VALUES(lifetime_value),
+            last_purchase_at = COALESCE(VALUES(last_purchase_at), last_purchase_at)
+    ''', tuple(value for customer_id, orders, amount in rows
+               for value in (customer_id, orders, amount, orders)))
+
+
+# =============================================================================
+# STOCK MOVEMENTS
+# Append-only stock ledger: every change to products.stock writes a
+# stock_movements row (delta + resulting balance) in the same DB transaction.
+# balance_after makes "stock at time T" a single index seek, and periodic
+# stock_snapshots bound how much of the ledger a catalog-wide
+# point-in-time query has to read (see StockLedger).
+# =============================================================================
+MOVEMENT_SALE = "sale"
+MOVEMENT_RETURN = "return"
+MOVEMENT_RECALL = "recall"
+MOVEMENT_ADJUSTMENT = "adjustment"
+MOVEMENT_IMPORT = "import"
+# MOVEMENT_INITIAL (first balance) comes from database.py, which also seeds it
+
+
+def record_stock_movements(cursor, deltas, reason, reference_id=None):
+    """
+    Append ledger rows for stock changes the caller has just applied in its DB
+    transaction. deltas is [(product_id, delta)]; repeated products are summed
+    so balance_after (read back from products) is exact.
+    """
+    totals = {}
+    for product_id, delta in deltas:
+        totals[product_id] = totals.get(product_id, 0) + int(delta)
+    rows = [(product_id, delta) for product_id, delta in totals.items() if delta]
+    if not rows:
+        return
+    derived = " UNION ALL ".join(["SELECT %s AS product_id, %s AS delta"] * len(rows))
+    cursor.execute(f'''
+        INSERT INTO stock_movements (product_id, delta, balance_after, reason, reference_id)
+        SELECT p.product_id, d.delta, p.stock, %s, %s
+        FROM ({derived}) d
+        JOIN products p ON p.product_id = d.product_id
+    ''', (reason, reference_id, *(value for row in rows for value in row)))
+
+
+def apply_stock_deltas(cursor, deltas, reason, reference_id=None):
+    """Change stock by [(product_id, delta)] and record the movements (caller commits)"""
+    deltas = list(deltas)
+    for product_id, delta in deltas:
+        registry.execute(cursor, "product.adjust_stock", (int(delta), product_id))
+    record_stock_movements(cursor, deltas, reason, reference_id)
+
+
+# =============================================================================
+# IDEMPOTENT CHECKOUT
+# Clients create one key per order (per checkout dialog) and send it with every
+# attempt. The UNIQUE index on transactions.idempotency_key guarantees a replay
+# - double click, retry after a timeout, commit whose reply was lost - returns
+# the original transaction instead of charging the customer twice.
+# =============================================================================
+DUPLICATE_KEY_ERRNO = 1062
+# Lock wait timeout, deadlock, can't connect, server gone away, lost connection
+TRANSIENT_ERRNOS = {1205, 1213, 2003, 2006, 2013, 2055}
+CHECKOUT_ATTEMPTS = 4
+CHECKOUT_BACKOFF = 0.2  # seconds, doubled after each failed attempt
+
+
+def new_idempotency_key():
+    return uuid.uuid4().hex
+
+
+# Metric children bound once so the checkout/refund paths skip the label lookup
+_CHECKOUT_REPLAYS_ONLINE = metrics.CHECKOUT_REPLAYS.labels(channel="online")
+_CHECKOUT_FAILURES_DIRECT = metrics.CHECKOUT_FAILURES.labels(channel="direct")
+_CHECKOUT_FAILURES_ONLINE = metrics.CHECKOUT_FAILURES.labels(channel="online")
+# channel -> (sales, replays, seconds) children, counted by count_sale once the
+# sale is committed: direct = staff POS, online = customer checkout,
+# till = offline till queue sync
+_SALE_METRICS = {
+    channel: (metrics.CHECKOUTS.labels(channel=channel),
+              metrics.CHECKOUT_REPLAYS.labels(channel=channel),
+              metrics.CHECKOUT_SECONDS.labels(channel=channel))
+    for channel in ("direct", "online", "till")
+}
+
+
+def count_sale(channel, created, seconds):
+    """Checkout metrics for a committed record_sale (created/seconds as it returned)"""
+    sales, replays, duration = _SALE_METRICS[channel]
+    if created:
+        sales.inc()
+        duration.observe(seconds)
+    else:
+        replays.inc()
+_REFUNDS_OK = metrics.REFUNDS.labels(source="return", status="ok")
+_REFUNDS_FAILED = metrics.REFUNDS.labels(source="return", status="failed")
+_REFUND_AMOUNT = metrics.REFUND_AMOUNT.labels(source="return")
+_REFUND_SECONDS = metrics.REFUND_SECONDS.labels(source="return")
+
+
 class User:
     def __init__(self, user_id, username, full_name, role):
         self.user_id = user_id
@@ -14,14 +541,12 @@ class User:
 class Customer:
     def __init__(self, db: Database):
         self.db = db
+        self.tier_engine = LoyaltyTierEngine(db)
 
     def add_customer(self, full_name, email, contact, address, customer_type='regular'):
         conn = self.db.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('''
-            INSERT INTO customers (full_name, email, contact, address, customer_type, is_active)
-            VALUES (%s, %s, %s, %s, %s, 1)
-        ''', (full_name, email, contact, address, customer_type))
+        cursor = registry.execute(conn, "customer.insert",
+                                  (full_name, email, contact, address, customer_type))
         conn.commit()
         customer_id = cursor.lastrowid
         conn.close()
@@ -29,73 +554,91 @@ class Customer:
     
     def update_customer(self, customer_id, full_name, email, contact, address, customer_type):
         conn = self.db.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('''
-            UPDATE customers 
-            SET full_name=%s, email=%s, contact=%s, address=%s, customer_type=%s
-            WHERE customer_id=%s AND is_active = 1
-        ''', (full_name, email, contact, address, customer_type, customer_id))
+        registry.execute(conn, "customer.update",
+                         (full_name, email, contact, address, customer_type, customer_id))
         conn.commit()
         conn.close()
     
     def get_all_customers(self):
         """Get all ACTIVE customers only"""
         conn = self.db.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('SELECT * FROM customers WHERE is_active = 1 ORDER BY customer_id DESC')
-        customers = cursor.fetchall()
+        customers = _rows(CustomerRow, registry.fetchall(conn, "customer.all_active"))
         conn.close()
         return customers
     
     def get_all_customers_including_deleted(self):
         """Get ALL customers including soft-deleted (for admin purposes)"""
         conn = self.db.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('SELECT * FROM customers ORDER BY is_active DESC, customer_id DESC')
-        customers = cursor.fetchall()
+        customers = _rows(CustomerRow, registry.fetchall(conn, "customer.all"))
         conn.close()
         return customers
     
     def get_customer(self, customer_id):
         """Get customer by ID (includes inactive for transaction history purposes)"""
         conn = self.db.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('SELECT * FROM customers WHERE customer_id=%s', (customer_id,))
-        customer = cursor.fetchone()
+        customer = _row(CustomerRow, registry.fetchone(conn, "customer.get", (customer_id,)))
         conn.close()
         return customer
     
     def get_active_customer(self, customer_id):
         """Get only ACTIVE customer by ID"""
         conn = self.db.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('SELECT * FROM customers WHERE customer_id=%s AND is_active = 1', (customer_id,))
-        customer = cursor.fetchone()
+        customer = _row(CustomerRow, registry.fetchone(conn, "customer.get_active", (customer_id,)))
         conn.close()
         return customer
     
-    def get_customer_history(self, customer_id):
+    def get_customer_history(self, customer_id, limit=50, before=None):
+        """
+        One page of a customer's transactions, newest first.
+        Pass the last TransactionRow of the previous page as `before` to get the
+        next page (keyset pagination on the (customer_id, transaction_date) index).
+        """
         conn = self.db.get_connection()
-        cursor = conn.cursor()
-
-        cursor.execute("""
-            SELECT 
-                t.transaction_id,
-                t.transaction_date,
-                t.total_amount,
-                t.payment_method,
-                u.full_name AS staff_name
-            FROM transactions t
-            LEFT JOIN users u ON t.staff_id = u.user_id
-            WHERE t.customer_id = %s
-            ORDER BY t.transaction_date DESC
-        """, (customer_id,))
-
-        result = cursor.fetchall()
-        cursor.close()
+        history = self._history_page(conn, "customer.history", customer_id, limit, before)
+        if len(history) < limit:
+            # Hot rows ran out; older orders continue in the archive
+            history += self._history_page(conn, "customer.history_archived", customer_id,
+                                          limit - len(history), history[-1] if history else before)
         conn.close()
-
-        return result
+        return history
+    
+    def _history_page(self, conn, query, customer_id, limit, before):
+        if before is None:
+            rows = registry.fetchall(conn, query, (customer_id, limit))
+        else:
+            rows = registry.fetchall(conn, f"{query}_after", (
+                customer_id, before.transaction_date, before.transaction_date, before.transaction_id, limit
+            ))
+        return _rows(TransactionRow, rows)
+    
+    def get_order_stats(self, customer_id):
+        """Cached lifetime aggregates (zeros for a customer who never ordered)"""
+        conn = self.db.get_connection()
+        stats = _row(OrderStatsRow, registry.fetchone(conn, "customer.order_stats", (customer_id,)))
+        conn.close()
+        return stats or OrderStatsRow(customer_id, 0, Decimal("0.00"), None)
+    
+    def get_session_bundle(self, customer_id, history_limit=50):
+        """
+        Profile, order stats, cart and the first loyalty history page on one
+        connection, so opening the customer window costs a single checkout
+        from the pool instead of one per widget. None if the customer is gone.
+        """
+        conn = self.db.get_connection()
+        customer = _row(CustomerRow, registry.fetchone(conn, "customer.get_active", (customer_id,)))
+        if customer is None:
+            conn.close()
+            return None
+        stats = _row(OrderStatsRow, registry.fetchone(conn, "customer.order_stats", (customer_id,)))
+        cart_items = registry.fetchall(conn, "cart.items", (customer_id,))
+        history = _rows(LoyaltyEntryRow, registry.fetchall(conn, "loyalty.history", (customer_id, history_limit)))
+        conn.close()
+        return CustomerSessionBundle(
+            customer,
+            stats or OrderStatsRow(customer_id, 0, Decimal("0.00"), None),
+            cart_items,
+            history,
+        )
     
     # =========================================================================
     # SOFT DELETE - Mark customer as inactive instead of hard delete
@@ -193,28 +736,27 @@ class Customer:
         conn = self.db.get_connection()
         cursor = conn.cursor()
         
-        cursor.execute("""
-            UPDATE customers 
-            SET loyalty_points = loyalty_points + %s
-            WHERE customer_id = %s AND is_active = 1
-        """, (points_to_add, customer_id))
+        cursor.execute("SELECT 1 FROM customers WHERE customer_id = %s AND is_active = 1", (customer_id,))
+        if cursor.fetchone():
+            _apply_loyalty_delta(cursor, customer_id, points_to_add, 'adjustment')
+            # Auto-upgrade customer type based on points (same transaction)
+            self.tier_engine.recalculate_customer(cursor, customer_id)
         
         conn.commit()
         conn.close()
-        
-        # Auto-upgrade customer type based on points
-        self.db.auto_upgrade_customer_type(customer_id)
     
     def redeem_loyalty_points(self, customer_id, points_to_redeem):
         """Redeem loyalty points for discount"""
         conn = self.db.get_connection()
         cursor = conn.cursor()
         
-        # Check current points
-        cursor.execute("SELECT loyalty_points FROM customers WHERE customer_id=%s AND is_active = 1", (customer_id,))
+        # Check current points (locked until commit)
+        cursor.execute("SELECT loyalty_points FROM customers WHERE customer_id=%s AND is_active = 1 FOR UPDATE",
+                       (customer_id,))
         result = cursor.fetchone()
         
         if not result or result[0] < points_to_redeem:
+            conn.rollback()
             conn.close()
             return False, "Insufficient loyalty points"
         
@@ -222,17 +764,41 @@ class Customer:
         discount = points_to_redeem / 10
         
         # Deduct points AND save pending discount
+        _apply_loyalty_delta(cursor, customer_id, -points_to_redeem, 'redemption')
         cursor.execute("""
             UPDATE customers 
-            SET loyalty_points = loyalty_points - %s,
-                pending_discount = pending_discount + %s
+            SET pending_discount = pending_discount + %s
             WHERE customer_id = %s
-        """, (points_to_redeem, discount, customer_id))
+        """, (discount, customer_id))
         
         conn.commit()
         conn.close()
         
         return True, discount
+    
+    def get_loyalty_balance(self, customer_id):
+        """Current points balance (single-row primary key read)"""
+        conn = self.db.get_connection()
+        row = registry.fetchone(conn, "customer.loyalty_balance", (customer_id,))
+        conn.close()
+        return int(row[0] or 0) if row else 0
+    
+    def get_loyalty_history(self, customer_id, limit=50, before=None):
+        """
+        One page of ledger entries, newest first.
+        Pass the last LoyaltyEntryRow of the previous page as `before` to get the
+        next page (keyset pagination on the (customer_id, created_at) index).
+        """
+        conn = self.db.get_connection()
+        if before is None:
+            rows = registry.fetchall(conn, "loyalty.history", (customer_id, limit))
+        else:
+            rows = registry.fetchall(conn, "loyalty.history_after", (
+                customer_id, before.created_at, before.created_at, before.entry_id, limit
+            ))
+        entries = _rows(LoyaltyEntryRow, rows)
+        conn.close()
+        return entries
 
 
 class Product:
@@ -242,25 +808,27 @@ class Product:
     def add_product(self, name, description, price, stock, category, low_stock_threshold=10):
         conn = self.db.get_connection()
         cursor = conn.cursor()
-        cursor.execute('''
-            INSERT INTO products (name, description, price, stock, category, low_stock_threshold, is_active)
-            VALUES (%s, %s, %s, %s, %s, %s, 1)
-        ''', (name, description, price, stock, category, low_stock_threshold))
-        conn.commit()
+        registry.execute(cursor, "product.insert",
+                         (name, description, price, stock, category, low_stock_threshold))
         product_id = cursor.lastrowid
+        record_stock_movements(cursor, [(product_id, stock)], MOVEMENT_INITIAL)
+        conn.commit()
         conn.close()
+        model_events.products_changed([product_id])
         return product_id
     
     def update_product(self, product_id, name, description, price, stock, category, low_stock_threshold):
         conn = self.db.get_connection()
         cursor = conn.cursor()
-        cursor.execute('''
-            UPDATE products 
-            SET name=%s, description=%s, price=%s, stock=%s, category=%s, low_stock_threshold=%s
-            WHERE product_id=%s AND is_active = 1
-        ''', (name, description, price, stock, category, low_stock_threshold, product_id))
+        # The edit sets an absolute stock level; the ledger needs the difference
+        row = registry.fetchone(cursor, "product.lock_stock", (product_id,))
+        registry.execute(cursor, "product.update",
+                         (name, description, price, stock, category, low_stock_threshold, product_id))
+        if row is not None and cursor.rowcount:
+            record_stock_movements(cursor, [(product_id, int(stock) - row[0])], MOVEMENT_ADJUSTMENT)
         conn.commit()
         conn.close()
+        model_events.products_changed([product_id])
     
     # =========================================================================
     # SOFT DELETE - Mark product as inactive instead of hard delete
@@ -296,6 +864,7 @@ class Product:
             
             conn.commit()
             conn.close()
+            model_events.products_changed([product_id])
             return True, f"Product '{product_name}' has been deactivated successfully!"
             
         except Exception as e:
@@ -317,6 +886,7 @@ class Product:
             
             conn.commit()
             conn.close()
+            model_events.products_changed([product_id])
             return True, "Product restored successfully!"
             
         except Exception as e:
@@ -327,62 +897,259 @@ class Product:
     def get_all_products(self):
         """Get all ACTIVE products only"""
         conn = self.db.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('SELECT * FROM products WHERE is_active = 1 ORDER BY product_id DESC')
-        products = cursor.fetchall()
+        products = _rows(ProductRow, registry.fetchall(conn, "product.all_active"))
         conn.close()
         return products
     
     def get_all_products_including_deleted(self):
         """Get ALL products including soft-deleted (for admin purposes)"""
         conn = self.db.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('SELECT * FROM products ORDER BY is_active DESC, product_id DESC')
-        products = cursor.fetchall()
+        products = _rows(ProductRow, registry.fetchall(conn, "product.all"))
         conn.close()
         return products
     
     def get_product(self, product_id):
         """Get product by ID (includes inactive for transaction history purposes)"""
         conn = self.db.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('SELECT * FROM products WHERE product_id=%s', (product_id,))
-        product = cursor.fetchone()
+        product = _row(ProductRow, registry.fetchone(conn, "product.get", (product_id,)))
         conn.close()
         return product
     
     def get_active_product(self, product_id):
         """Get only ACTIVE product by ID"""
         conn = self.db.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('SELECT * FROM products WHERE product_id=%s AND is_active = 1', (product_id,))
-        product = cursor.fetchone()
+        product = _row(ProductRow, registry.fetchone(conn, "product.get_active", (product_id,)))
         conn.close()
         return product
     
     def get_low_stock_products(self):
         """Get low stock products (ACTIVE only)"""
         conn = self.db.get_connection()
+        products = _rows(ProductRow, registry.fetchall(conn, "product.low_stock"))
+        conn.close()
+        return products
+    
+    def get_products_by_ids(self, product_ids):
+        """Get ACTIVE products for the given IDs (used for incremental cache refresh)"""
+        product_ids = list(product_ids)
+        if not product_ids:
+            return []
+        conn = self.db.get_connection()
         cursor = conn.cursor()
-        cursor.execute('SELECT * FROM products WHERE stock <= low_stock_threshold AND is_active = 1')
-        products = cursor.fetchall()
+        placeholders = ", ".join(["%s"] * len(product_ids))
+        cursor.execute(f'''
+            SELECT {select_columns(PRODUCT_COLUMNS)} FROM active_products
+            WHERE product_id IN ({placeholders})
+        ''', tuple(product_ids))
+        products = _rows(ProductRow, cursor.fetchall())
         conn.close()
         return products
     
     def update_stock(self, product_id, quantity_change):
         conn = self.db.get_connection()
         cursor = conn.cursor()
-        cursor.execute('''
-            UPDATE products SET stock = stock + %s WHERE product_id = %s
-        ''', (quantity_change, product_id))
+        apply_stock_deltas(cursor, [(product_id, quantity_change)], MOVEMENT_ADJUSTMENT)
         conn.commit()
         conn.close()
+        model_events.products_changed([product_id])
+
+# =============================================================================
+# INVENTORY ALERTS
+# Thresholds are evaluated only for products a write just touched (the
+# products_changed event), never by scanning the catalog. inventory_alerts
+# holds at most one open alert per product (unique open_product_id), so
+# repeated sales of a low product update that alert instead of adding rows;
+# it is resolved once stock is back above the threshold.
+# =============================================================================
+ALERT_LOW_STOCK = "low_stock"
+ALERT_OUT_OF_STOCK = "out_of_stock"
+
+
+class InventoryAlerts:
+    def __init__(self, db: Database):
+        self.db = db
+
+    @staticmethod
+    def classify(stock, threshold, is_active=1):
+        """Alert type for a stock level, or None when no alert is due"""
+        if not is_active or stock > threshold:
+            return None
+        return ALERT_OUT_OF_STOCK if is_out_of_stock(stock) else ALERT_LOW_STOCK
+
+    def evaluate(self, product_ids=None):
+        """
+        Re-check the given products (None = every low product plus every open
+        alert, via the stock_headroom index). Returns (raised, resolved): new or
+        changed InventoryAlertRows, and the product IDs whose alerts closed.
+        """
+        if product_ids is None:
+            scope, params = "p.stock_headroom <= 0 OR a.alert_id IS NOT NULL", ()
+        else:
+            product_ids = list(product_ids)
+            if not product_ids:
+                return [], []
+            scope = f"p.product_id IN ({', '.join(['%s'] * len(product_ids))})"
+            params = tuple(product_ids)
+
+        conn = self.db.get_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute(f'''
+                SELECT p.product_id, p.name, p.stock, p.low_stock_threshold, p.is_active,
+                       a.alert_id, a.alert_type
+                FROM products p
+                LEFT JOIN inventory_alerts a ON a.open_product_id = p.product_id
+                WHERE {scope}
+            ''', params)
+
+            changed, resolved = [], []
+            for product_id, name, stock, threshold, is_active, alert_id, open_type in cursor.fetchall():
+                alert_type = self.classify(stock, threshold, is_active)
+                if alert_type is None:
+                    if alert_id is not None:
+                        resolved.append(product_id)
+                elif alert_type != open_type:
+                    # New alert, or low <-> out of stock
+                    changed.append((product_id, name, alert_type, stock, threshold))
+
+            if changed:
+                cursor.execute(f'''
+                    INSERT INTO inventory_alerts (product_id, alert_type, stock_level, threshold)
+                    VALUES {", ".join(["(%s, %s, %s, %s)"] * len(changed))}
+                    ON DUPLICATE KEY UPDATE
+                        alert_type = VALUES(alert_type),
+                        stock_level = VALUES(stock_level),
+                        threshold = VALUES(threshold),
+                        acknowledged_by = NULL,
+                        acknowledged_at = NULL
+                ''', tuple(value for product_id, _, alert_type, stock, threshold in changed
+                           for value in (product_id, alert_type, stock, threshold)))
+            if resolved:
+                cursor.execute(f'''
+                    UPDATE inventory_alerts SET resolved_at = NOW()
+                    WHERE open_product_id IN ({", ".join(["%s"] * len(resolved))})
+                ''', tuple(resolved))
+            conn.commit()
+
+            raised = []
+            if changed:
+                names = {row[0]: row[1] for row in changed}
+                cursor.execute(f'''
+                    SELECT {select_columns(INVENTORY_ALERT_COLUMNS)} FROM inventory_alerts
+                    WHERE open_product_id IN ({", ".join(["%s"] * len(changed))})
+                ''', tuple(names))
+                raised = [InventoryAlertRow(*row, product_name=names.get(row[1]))
+                          for row in cursor.fetchall()]
+            return raised, resolved
+        except mysql.connector.Error as e:
+            conn.rollback()
+            print(f"Inventory alert warning: {e}")
+            return [], []
+        finally:
+            cursor.close()
+            conn.close()
+
+    def get_open_alerts(self):
+        """Unresolved alerts, out-of-stock first, newest first"""
+        conn = self.db.get_connection()
+        alerts = _rows(InventoryAlertRow, registry.fetchall(conn, "alert.open"))
+        conn.close()
+        return alerts
+
+    def acknowledge(self, alert_id, user_id):
+        conn = self.db.get_connection()
+        cursor = registry.execute(conn, "alert.acknowledge", (user_id, alert_id))
+        acknowledged = cursor.rowcount > 0
+        conn.commit()
+        conn.close()
+        return acknowledged
+
+class StockLedger:
+    """Read side of the stock ledger: movement history and point-in-time stock"""
+    def __init__(self, db: Database):
+        self.db = db
+
+    def get_movements(self, product_id, limit=50, before=None):
+        """One page of a product's movements, newest first (before = last row of the previous page)"""
+        conn = self.db.get_connection()
+        if before is None:
+            rows = registry.fetchall(conn, "stock.movements", (product_id, limit))
+        else:
+            rows = registry.fetchall(conn, "stock.movements_after", (
+                product_id, before.created_at, before.created_at, before.movement_id, limit
+            ))
+        movements = _rows(StockMovementRow, rows)
+        conn.close()
+        return movements
+
+    def stock_at(self, product_id, moment):
+        """Stock of one product at a moment: the balance of its last movement (one index seek)"""
+        conn = self.db.get_connection()
+        row = registry.fetchone(conn, "stock.at", (product_id, moment))
+        conn.close()
+        return row[0] if row else 0
+
+    def stock_levels_at(self, moment):
+        """
+        {product_id: (stock, price)} at a moment: the latest snapshot taken
+        before it, updated with the last movement per product since then, so
+        only the ledger rows after that snapshot are read.
+        """
+        conn = self.db.get_connection()
+        snapshot = registry.fetchone(conn, "stock.snapshot_before", (moment,))
+        snapshot_at = snapshot[0] if snapshot else None
+        levels = {}
+        if snapshot_at is None:
+            rows = registry.fetchall(conn, "stock.levels_until", (moment,))
+        else:
+            levels = {product_id: (stock, price) for product_id, stock, price
+                      in registry.fetchall(conn, "stock.snapshot_levels", (snapshot_at,))}
+            rows = registry.fetchall(conn, "stock.levels_since", (snapshot_at, moment))
+        archived = [product_id for product_id, _, price in rows if price is None and product_id not in levels]
+        archived_prices = self._archived_prices(conn, archived) if archived else {}
+        conn.close()
+        for product_id, stock, price in rows:
+            # Snapshot price where there is one; products added since use today's
+            if price is None:
+                price = archived_prices.get(product_id, Decimal("0.00"))
+            levels[product_id] = (stock, levels.get(product_id, (0, price))[1])
+        return levels
+
+    def _archived_prices(self, conn, product_ids):
+        """{product_id: price} from products_archive (empty until the archiver has run)"""
+        cursor = conn.cursor()
+        try:
+            cursor.execute(f"""
+                SELECT product_id, price FROM products_archive
+                WHERE product_id IN ({", ".join(["%s"] * len(product_ids))})
+            """, tuple(product_ids))
+            return dict(cursor.fetchall())
+        except mysql.connector.Error:
+            return {}
+        finally:
+            cursor.close()
+
+    def inventory_value_at(self, moment):
+        """Value of the stock on hand at a moment (negative balances count as zero)"""
+        return sum((max(stock, 0) * price for stock, price in self.stock_levels_at(moment).values()),
+                   Decimal("0.00"))
+
+    def take_snapshot(self):
+        """Snapshot every product's stock now; returns the number of rows written"""
+        conn = self.db.get_connection()
+        cursor = conn.cursor()
+        written = self.db.take_stock_snapshot(cursor)
+        conn.commit()
+        conn.close()
+        return written
 
 class Transaction:
     def __init__(self, db: Database):
         self.db = db
+        self.tier_engine = LoyaltyTierEngine(db)
     
-    def create_transaction(self, customer_id, staff_id, items, payment_method, discount=0):
+    def create_transaction(self, customer_id, staff_id, items, payment_method, discount=0,
+                           idempotency_key=None, clear_pending_discount=False):
         """
         discount = discount rate (e.g. 0.15 for 15%) – can be float or Decimal.
         All internal money calculations are done with Decimal.
@@ -390,7 +1157,86 @@ class Transaction:
         conn = self.db.get_connection()
         cursor = conn.cursor()
         
-        # ---- Calculate totals using Decimal everywhere ----
+        try:
+            transaction_id, created, seconds = self.record_sale(cursor, customer_id, staff_id, items,
+                                                                payment_method, discount, idempotency_key,
+                                                                clear_pending_discount)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            _CHECKOUT_FAILURES_DIRECT.inc()
+            raise
+        finally:
+            conn.close()
+        count_sale("direct", created, seconds)
+        model_events.products_changed(item['product_id'] for item in items)
+        
+        return transaction_id
+    
+    def checkout(self, idempotency_key, customer_id, staff_id, items, payment_method, discount=0,
+                 clear_pending_discount=False, max_attempts=CHECKOUT_ATTEMPTS):
+        """
+        Idempotent create_transaction. Transient DB errors are retried with
+        exponential backoff; replaying a key returns the existing sale.
+        Returns (transaction_id, created).
+        """
+        if not idempotency_key:
+            raise ValueError("checkout requires an idempotency key")
+        if max_attempts < 1:
+            raise ValueError("checkout needs max_attempts >= 1")
+        
+        delay = CHECKOUT_BACKOFF
+        for attempt in range(1, max_attempts + 1):
+            conn = None
+            try:
+                conn = self.db.get_connection()
+                cursor = conn.cursor()
+                transaction_id, created, seconds = self.record_sale(cursor, customer_id, staff_id, items,
+                                                                    payment_method, discount, idempotency_key,
+                                                                    clear_pending_discount)
+                conn.commit()
+                count_sale("online", created, seconds)
+                break
+            except mysql.connector.Error as e:
+                if conn is not None:
+                    try:
+                        conn.rollback()
+                    except mysql.connector.Error:
+                        pass
+                if e.errno == DUPLICATE_KEY_ERRNO:
+                    # A concurrent attempt with the same key committed first
+                    existing = self.get_transaction_by_key(idempotency_key)
+                    if existing:
+                        _CHECKOUT_REPLAYS_ONLINE.inc()
+                        return existing, False
+                    _CHECKOUT_FAILURES_ONLINE.inc()
+                    raise
+                if e.errno not in TRANSIENT_ERRNOS or attempt == max_attempts:
+                    _CHECKOUT_FAILURES_ONLINE.inc()
+                    raise
+            finally:
+                if conn is not None:
+                    try:
+                        conn.close()
+                    except mysql.connector.Error:
+                        pass
+            time.sleep(delay)
+            delay *= 2
+        
+        if created:
+            model_events.products_changed(item['product_id'] for item in items)
+        return transaction_id, created
+    
+    def get_transaction_by_key(self, idempotency_key):
+        conn = self.db.get_connection()
+        cursor = conn.cursor()
+        transaction_id = self.find_by_idempotency_key(cursor, idempotency_key)
+        conn.close()
+        return transaction_id
+    
+    @staticmethod
+    def compute_totals(items, discount=0):
+        """(subtotal, discount_amount, tax, total) for a sale, using Decimal everywhere"""
         subtotal = Decimal("0.00")
         for item in items:
             price = Decimal(str(item['price']))       # supports float, Decimal, or str
@@ -403,74 +1249,79 @@ class Transaction:
         
         tax = (subtotal - discount_amount) * Decimal("0.10")  # 10% tax
         total = subtotal - discount_amount + tax
+        return subtotal, discount_amount, tax, total
+    
+    def find_by_idempotency_key(self, cursor, idempotency_key):
+        row = registry.fetchone(cursor, "sale.find_by_key", (idempotency_key,))
+        return row[0] if row else None
+    
+    def record_sale(self, cursor, customer_id, staff_id, items, payment_method, discount=0,
+                    idempotency_key=None, clear_pending_discount=False):
+        """
+        Write a complete sale using the caller's cursor (the caller commits,
+        then passes created/seconds to count_sale). With an idempotency_key, a
+        sale that was already recorded is not written again.
+        Returns (transaction_id, created, seconds spent writing).
+        """
+        started = time.perf_counter()
+        if idempotency_key:
+            existing = self.find_by_idempotency_key(cursor, idempotency_key)
+            if existing:
+                return existing, False, time.perf_counter() - started
+        
+        subtotal, discount_amount, tax, total = self.compute_totals(items, discount)
         
         # ---- Create transaction ----
-        cursor.execute('''
-            INSERT INTO transactions (customer_id, staff_id, total_amount, discount, tax, payment_method, transaction_type)
-            VALUES (%s, %s, %s, %s, %s, %s, %s)
-        ''', (customer_id, staff_id, total, discount_amount, tax, payment_method, 'sale'))
+        registry.execute(cursor, "sale.insert", (customer_id, staff_id, total, discount_amount, tax,
+                                                 payment_method, idempotency_key))
         
         transaction_id = cursor.lastrowid
         
-        # ---- Add transaction items and update stock ----
+        # ---- Add transaction items ----
         for item in items:
             price = Decimal(str(item['price']))
             qty   = Decimal(str(item['quantity']))
             line_subtotal = qty * price
             
-            cursor.execute('''
-                INSERT INTO transaction_items (transaction_id, product_id, quantity, unit_price, subtotal)
-                VALUES (%s, %s, %s, %s, %s)
-            ''', (transaction_id, item['product_id'], int(qty), price, line_subtotal))
-            
-            # Update product stock (can safely use int here)
-            cursor.execute('''
-                UPDATE products SET stock = stock - %s WHERE product_id = %s
-            ''', (int(qty), item['product_id']))
+            registry.execute(cursor, "sale.insert_item",
+                             (transaction_id, item['product_id'], int(qty), price, line_subtotal))
+        
+        # ---- Update product stock + stock ledger (can safely use int here) ----
+        apply_stock_deltas(cursor, [(item['product_id'], -int(item['quantity'])) for item in items],
+                           MOVEMENT_SALE, transaction_id)
         
         # ---- Update customer loyalty points (1 point per $10 spent) ----
         if customer_id:
             points = int(total / Decimal("10"))
-            cursor.execute('''
-                UPDATE customers SET loyalty_points = loyalty_points + %s WHERE customer_id = %s
-            ''', (points, customer_id))
-        
-        conn.commit()
-        conn.close()
-        
-        # Auto-upgrade customer type if applicable
-        if customer_id:
-            self.db.auto_upgrade_customer_type(customer_id)
+            _apply_loyalty_delta(cursor, customer_id, points, 'purchase', transaction_id)
+            record_order_stats(cursor, [(customer_id, 1, total)])
+            # Auto-upgrade customer type if applicable (same transaction)
+            self.tier_engine.recalculate_customer(cursor, customer_id)
+            
+            # Redeemed-points discount is used up by this purchase
+            if clear_pending_discount:
+                cursor.execute("UPDATE customers SET pending_discount = 0.00 WHERE customer_id = %s",
+                               (customer_id,))
         
-        return transaction_id
+        return transaction_id, True, time.perf_counter() - started
 
     
     def get_transaction(self, transaction_id):
         """Get transaction with customer/staff names (works even if they're soft-deleted)"""
         conn = self.db.get_connection()
-        cursor = conn.cursor()
         
         # Get transaction details - joins work even with soft-deleted records
-        cursor.execute('''
-            SELECT t.*, 
-                   CASE WHEN c.is_active = 0 THEN CONCAT(c.full_name, ' (Deleted)') ELSE c.full_name END as customer_name,
-                   CASE WHEN u.is_active = 0 THEN CONCAT(u.full_name, ' (Inactive)') ELSE u.full_name END as staff_name
-            FROM transactions t
-            LEFT JOIN customers c ON t.customer_id = c.customer_id
-            LEFT JOIN users u ON t.staff_id = u.user_id
-            WHERE t.transaction_id = %s
-        ''', (transaction_id,))
-        transaction = cursor.fetchone()
+        transaction = _row(TransactionRow, registry.fetchone(conn, "transaction.get", (transaction_id,)))
+        suffix = ""
+        if transaction is None:
+            # Sales past the archive horizon
+            transaction = _row(TransactionRow, registry.fetchone(conn, "transaction.get_archived",
+                                                                 (transaction_id,)))
+            suffix = "_archived"
         
         # Get transaction items - product names preserved even if soft-deleted
-        cursor.execute('''
-            SELECT ti.*, 
-                   CASE WHEN p.is_active = 0 THEN CONCAT(p.name, ' (Discontinued)') ELSE p.name END as product_name
-            FROM transaction_items ti
-            JOIN products p ON ti.product_id = p.product_id
-            WHERE ti.transaction_id = %s
-        ''', (transaction_id,))
-        items = cursor.fetchall()
+        items = _rows(TransactionItemRow, registry.fetchall(conn, f"transaction.items{suffix}",
+                                                            (transaction_id,)))
         
         conn.close()
         return transaction, items
@@ -480,25 +1331,17 @@ class Transaction:
             date = datetime.now().strftime('%Y-%m-%d')
         
         conn = self.db.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('''
-            SELECT COUNT(*), SUM(total_amount)
-            FROM transactions
-            WHERE DATE(transaction_date) = %s AND transaction_type = 'sale'
-        ''', (date,))
-        result = cursor.fetchone()
+        result = registry.fetchone(conn, "transaction.daily_sales", (date, date))
         conn.close()
         return result
     
     def get_sales_by_date_range(self, start_date, end_date):
         conn = self.db.get_connection()
         cursor = conn.cursor()
-        cursor.execute('''
-            SELECT * FROM transactions
-            WHERE DATE(transaction_date) BETWEEN %s AND %s AND transaction_type = 'sale'
-            ORDER BY transaction_date DESC
-        ''', (start_date, end_date))
-        transactions = cursor.fetchall()
+        source, _ = transaction_tables(cursor, start_date)
+        cursor.close()
+        query = "transaction.by_date_range" if source == "transactions" else "transaction.by_date_range_all"
+        transactions = _rows(TransactionRow, registry.fetchall(conn, query, (start_date, end_date)))
         conn.close()
         return transactions
 
@@ -507,26 +1350,86 @@ class ReturnRefund:
     def __init__(self, db: Database):
         self.db = db
     
+    def get_returnable_items(self, transaction_id):
+        """
+        Original sale plus, per line, sold / already returned / remaining quantity.
+        Returns (TransactionRow, [ReturnableItemRow]) or (None, []) if not found.
+        """
+        conn = self.db.get_connection()
+        
+        transaction = _row(TransactionRow, registry.fetchone(conn, "transaction.get", (transaction_id,)))
+        if not transaction:
+            conn.close()
+            return None, []
+        
+        items = _rows(ReturnableItemRow, registry.fetchall(conn, "transaction.returnable_items", (transaction_id,)))
+        
+        conn.close()
+        return transaction, items
+    
     def process_return(self, original_transaction_id, items_to_return, reason, processed_by, refund_method="Original Payment"):
-        """Process a return/refund transaction"""
+        """
+        Process a return/refund transaction.
+        Each item is {'item_id', 'quantity'} (item_id of the original sale line;
+        'product_id' alone is accepted for older callers). Returned quantities are
+        reserved with a conditional UPDATE, so concurrent or repeated refunds of
+        the same line can never exceed what was sold.
+        """
+        started = time.perf_counter()
         conn = self.db.get_connection()
         cursor = conn.cursor()
         
         try:
             # Get original transaction details
-            cursor.execute("SELECT * FROM transactions WHERE transaction_id = %s", (original_transaction_id,))
+            cursor.execute("SELECT customer_id FROM transactions WHERE transaction_id = %s AND transaction_type = 'sale'",
+                           (original_transaction_id,))
             original_trans = cursor.fetchone()
             
             if not original_trans:
                 return False, "Original transaction not found"
+            customer_id = original_trans[0]
             
-            # ---- Calculate refund amount using Decimal ----
-            refund_amount = Decimal("0.00")
+            # ---- Reserve returned quantities (atomic per line) ----
+            lines = []
             for item in items_to_return:
-                price = Decimal(str(item['price']))
-                qty   = Decimal(str(item['quantity']))
-                refund_amount += qty * price
+                qty = int(item['quantity'])
+                if qty <= 0:
+                    continue
+                
+                item_id = item.get('item_id')
+                if item_id is None:
+                    cursor.execute('''
+                        SELECT item_id FROM transaction_items
+                        WHERE transaction_id = %s AND product_id = %s AND returned_quantity + %s <= quantity
+                        ORDER BY item_id LIMIT 1
+                    ''', (original_transaction_id, item['product_id'], qty))
+                    found = cursor.fetchone()
+                    if not found:
+                        conn.rollback()
+                        return False, "Return quantity exceeds what remains returnable"
+                    item_id = found[0]
+                
+                cursor.execute('''
+                    UPDATE transaction_items
+                    SET returned_quantity = returned_quantity + %s
+                    WHERE item_id = %s AND transaction_id = %s
+                      AND returned_quantity + %s <= quantity
+                ''', (qty, item_id, original_transaction_id, qty))
+                if cursor.rowcount == 0:
+                    conn.rollback()
+                    return False, "Return quantity exceeds what remains returnable (already refunded?)"
+                
+                # Price comes from the original sale line, not from the caller
+                cursor.execute("SELECT product_id, unit_price FROM transaction_items WHERE item_id = %s", (item_id,))
+                product_id, price = cursor.fetchone()
+                lines.append((product_id, qty, Decimal(str(price))))
             
+            if not lines:
+                conn.rollback()
+                return False, "No items to return"
+            
+            # ---- Calculate refund amount using Decimal ----
+            refund_amount = sum((qty * price for _, qty, price in lines), Decimal("0.00"))
             refund_tax = refund_amount * Decimal("0.10")
             total_refund = refund_amount + refund_tax
             
@@ -534,24 +1437,22 @@ class ReturnRefund:
             cursor.execute('''
                 INSERT INTO transactions (customer_id, staff_id, total_amount, discount, tax, payment_method, transaction_type)
                 VALUES (%s, %s, %s, %s, %s, %s, %s)
-            ''', (original_trans[1], processed_by, -total_refund, 0, -refund_tax, refund_method, 'refund'))
+            ''', (customer_id, processed_by, -total_refund, 0, -refund_tax, refund_method, 'refund'))
             
             refund_transaction_id = cursor.lastrowid
             
-            # Add refund items & restore stock
-            for item in items_to_return:
-                price = Decimal(str(item['price']))
-                qty   = Decimal(str(item['quantity']))
+            # Add refund items
+            for product_id, qty, price in lines:
                 line_subtotal = qty * price
                 
                 cursor.execute('''
                     INSERT INTO transaction_items (transaction_id, product_id, quantity, unit_price, subtotal)
                     VALUES (%s, %s, %s, %s, %s)
-                ''', (refund_transaction_id, item['product_id'], -int(qty), price, -line_subtotal))
-                
-                cursor.execute('''
-                    UPDATE products SET stock = stock + %s WHERE product_id = %s
-                ''', (int(qty), item['product_id']))
+                ''', (refund_transaction_id, product_id, -qty, price, -line_subtotal))
+            
+            # Restore stock + stock ledger
+            apply_stock_deltas(cursor, [(product_id, qty) for product_id, qty, _ in lines],
+                               MOVEMENT_RETURN, refund_transaction_id)
             
             # Record return in returns table
             cursor.execute('''
@@ -560,19 +1461,21 @@ class ReturnRefund:
             ''', (original_transaction_id, refund_transaction_id, reason, total_refund, processed_by, 'completed'))
             
             # Deduct loyalty points if applicable
-            if original_trans[1]:  # if customer_id exists
+            if customer_id:
                 points_to_deduct = int(total_refund / Decimal("10"))
-                cursor.execute('''
-                    UPDATE customers 
-                    SET loyalty_points = GREATEST(0, loyalty_points - %s)
-                    WHERE customer_id = %s
-                ''', (points_to_deduct, original_trans[1]))
+                _apply_loyalty_delta(cursor, customer_id, -points_to_deduct, 'refund', refund_transaction_id)
+                record_order_stats(cursor, [(customer_id, 0, -total_refund)])
             
             conn.commit()
+            _REFUND_SECONDS.observe(time.perf_counter() - started)
+            _REFUNDS_OK.inc()
+            _REFUND_AMOUNT.inc(float(total_refund))
+            model_events.products_changed(product_id for product_id, _, _ in lines)
             return True, f"Refund processed successfully. Transaction ID: {refund_transaction_id}"
             
         except Exception as e:
             conn.rollback()
+            _REFUNDS_FAILED.inc()
             return False, f"Refund failed: {str(e)}"
         finally:
             conn.close()
@@ -595,11 +1498,15 @@ class ReturnRefund:
         conn.close()
         return returns
 
+INVENTORY_STATUSES = ("Out of Stock", "Low Stock", "In Stock")
+
+
 class ReportGenerator:
     """Generate comprehensive business reports"""
     def __init__(self, db: Database):
         self.db = db
     
+    @metrics.timed(metrics.REPORT_SECONDS.labels(report="daily_sales"))
     def generate_daily_sales_report(self, date=None):
         """Generate detailed daily sales report"""
         if date is None:
@@ -607,31 +1514,36 @@ class ReportGenerator:
         
         conn = self.db.get_connection()
         cursor = conn.cursor()
+        # Days past the archive horizon read the hot + archive views
+        transactions_table, items_table = transaction_tables(cursor, date)
         
         # Get all transactions for the day - handles soft-deleted records
-        cursor.execute('''
-            SELECT t.*, 
+        cursor.execute(f'''
+            SELECT {select_columns(TRANSACTION_COLUMNS, 't')}, 
                    CASE WHEN c.is_active = 0 THEN CONCAT(c.full_name, ' (Deleted)') ELSE COALESCE(c.full_name, 'Walk-in') END as customer_name,
                    CASE WHEN u.is_active = 0 THEN CONCAT(u.full_name, ' (Inactive)') ELSE u.full_name END as staff_name
-            FROM transactions t
+            FROM {transactions_table} t
             LEFT JOIN customers c ON t.customer_id = c.customer_id
             LEFT JOIN users u ON t.staff_id = u.user_id
-            WHERE DATE(t.transaction_date) = %s AND t.transaction_type = 'sale'
+            WHERE t.transaction_date >= %s AND t.transaction_date < %s + INTERVAL 1 DAY
+              AND t.transaction_type = 'sale'
             ORDER BY t.transaction_date DESC
-        ''', (date,))
-        transactions = cursor.fetchall()
+        ''', (date, date))
+        transactions = _rows(TransactionRow, cursor.fetchall())
         
         # Calculate totals
         total_sales = sum(t[3] for t in transactions)
         total_transactions = len(transactions)
-        total_items_sold = 0
         
-        for trans in transactions:
-            cursor.execute('''
-                SELECT SUM(quantity) FROM transaction_items WHERE transaction_id = %s
-            ''', (trans[0],))
-            result = cursor.fetchone()
-            total_items_sold += result[0] if result[0] else 0
+        # Items sold for the whole day in one query
+        cursor.execute(f'''
+            SELECT COALESCE(SUM(ti.quantity), 0)
+            FROM {transactions_table} t
+            JOIN {items_table} ti ON ti.transaction_id = t.transaction_id
+            WHERE t.transaction_date >= %s AND t.transaction_date < %s + INTERVAL 1 DAY
+              AND t.transaction_type = 'sale'
+        ''', (date, date))
+        total_items_sold = cursor.fetchone()[0]
         
         conn.close()
         
@@ -644,20 +1556,22 @@ class ReportGenerator:
             'transactions': transactions
         }
     
+    @metrics.timed(metrics.REPORT_SECONDS.labels(report="revenue_by_customer_type"))
     def generate_revenue_by_customer_type_report(self, start_date, end_date):
         """Generate revenue breakdown by customer type"""
         conn = self.db.get_connection()
         cursor = conn.cursor()
+        transactions_table, _ = transaction_tables(cursor, start_date)
         
-        cursor.execute('''
+        cursor.execute(f'''
             SELECT 
                 COALESCE(c.customer_type, 'walk-in') as customer_type,
                 COUNT(t.transaction_id) as transaction_count,
                 SUM(t.total_amount) as total_revenue,
                 AVG(t.total_amount) as average_transaction
-            FROM transactions t
+            FROM {transactions_table} t
             LEFT JOIN customers c ON t.customer_id = c.customer_id
-            WHERE DATE(t.transaction_date) BETWEEN %s AND %s 
+            WHERE t.transaction_date >= %s AND t.transaction_date < %s + INTERVAL 1 DAY
                 AND t.transaction_type = 'sale'
             GROUP BY customer_type
             ORDER BY total_revenue DESC
@@ -672,48 +1586,54 @@ class ReportGenerator:
             'breakdown': results
         }
     
+    @metrics.timed(metrics.REPORT_SECONDS.labels(report="inventory_status"))
     def generate_inventory_status_report(self):
         """Generate comprehensive inventory status report (ACTIVE products only)"""
         conn = self.db.get_connection()
         cursor = conn.cursor()
+        # Summary and list read from one snapshot, so the counts match the rows
+        cursor.execute("START TRANSACTION WITH CONSISTENT SNAPSHOT, READ ONLY")
+        
+        # Counts and value aggregated by the server
+        total_products, out_of_stock, low_stock, total_value = registry.fetchone(
+            conn, "report.inventory_summary")
+        in_stock = total_products - out_of_stock - low_stock
         
         # Get all ACTIVE products with status
-        cursor.execute('''
+        cursor.execute(f'''
             SELECT 
-                p.*,
+                {select_columns(PRODUCT_COLUMNS, 'p')},
                 CASE 
-                    WHEN p.stock = 0 THEN 'Out of Stock'
+                    WHEN {out_of_stock_sql('p')} THEN 'Out of Stock'
                     WHEN p.stock <= p.low_stock_threshold THEN 'Low Stock'
                     ELSE 'In Stock'
                 END as status
-            FROM products p
-            WHERE p.is_active = 1
+            FROM active_products p
             ORDER BY 
                 CASE 
-                    WHEN p.stock = 0 THEN 1
+                    WHEN {out_of_stock_sql('p')} THEN 1
                     WHEN p.stock <= p.low_stock_threshold THEN 2
                     ELSE 3
                 END, p.name
         ''')
         
         products = cursor.fetchall()
-        
-        # Calculate totals
-        total_products = len(products)
-        out_of_stock = len([p for p in products if p[4] == 0])
-        low_stock = len([p for p in products if 0 < p[4] <= p[6]])
-        in_stock = total_products - out_of_stock - low_stock
-        total_value = sum(p[3] * p[4] for p in products)
-        
+        conn.commit()
         conn.close()
         
+        # Pre-bucketed per status (rows arrive grouped by status) so a filter is a lookup
+        by_status = {status: [] for status in INVENTORY_STATUSES}
+        for product in products:
+            by_status[product[-1]].append(product)
+        
         return {
-            'total_products': total_products,
-            'out_of_stock': out_of_stock,
-            'low_stock': low_stock,
-            'in_stock': in_stock,
+            'total_products': int(total_products),
+            'out_of_stock': int(out_of_stock),
+            'low_stock': int(low_stock),
+            'in_stock': int(in_stock),
             'total_inventory_value': total_value,
-            'products': products
+            'products': products,
+            'by_status': by_status
         }
     
     def export_report_to_csv(self, report_data, report_type):
@@ -750,7 +1670,7 @@ class ReportGenerator:
             writer.writerow([])
             writer.writerow(['Product ID', 'Name', 'Category', 'Price', 'Stock', 'Status'])
             for prod in report_data['products']:
-                # Handle the status column which is now at a different index due to is_active/deleted_at columns
+                # Status is appended after the product columns
                 status = prod[-1] if isinstance(prod[-1], str) else 'Unknown'
                 writer.writerow([prod[0], prod[1], prod[5], f"${prod[3]:.2f}", prod[4], status])
         
@@ -760,81 +1680,81 @@ class Cart:
     def __init__(self, db: Database):
         self.db = db
     
-    def add_to_cart(self, customer_id, product_id, quantity):
-        conn = self.db.get_connection()
-        cursor = conn.cursor()
-        
-        # Check if product is active
-        cursor.execute('SELECT is_active FROM products WHERE product_id = %s', (product_id,))
-        product = cursor.fetchone()
-        if not product or product[0] != 1:
-            conn.close()
-            return False, "Product is no longer available"
-        
-        # Check if item already in cart
-        cursor.execute('''
-            SELECT cart_id, quantity FROM shopping_cart 
-            WHERE customer_id=%s AND product_id=%s
-        ''', (customer_id, product_id))
-        existing = cursor.fetchone()
-        
-        if existing:
-            # Update quantity
-            cursor.execute('''
-                UPDATE shopping_cart SET quantity = quantity + %s
-                WHERE cart_id = %s
-            ''', (quantity, existing[0]))
-        else:
-            # Add new item
-            cursor.execute('''
-                INSERT INTO shopping_cart (customer_id, product_id, quantity)
-                VALUES (%s, %s, %s)
-            ''', (customer_id, product_id, quantity))
-        
-        conn.commit()
-        conn.close()
-        return True, "Added to cart"
-    
     def get_cart_items(self, customer_id):
         """Get cart items (only ACTIVE products)"""
         conn = self.db.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('''
-            SELECT c.cart_id, c.quantity, p.*
-            FROM shopping_cart c
-            JOIN products p ON c.product_id = p.product_id
-            WHERE c.customer_id = %s AND p.is_active = 1
-        ''', (customer_id,))
-        items = cursor.fetchall()
+        items = registry.fetchall(conn, "cart.items", (customer_id,))
         conn.close()
         return items
     
-    def update_cart_item(self, cart_id, quantity):
+    def save_cart(self, customer_id, quantities, cleared=False, added=None):
+        """
+        Persist coalesced cart edits in one DB transaction; used by
+        cart_session.CartSession. quantities maps product_id -> quantity set
+        explicitly (0 removes the line), added maps product_id -> units added
+        on top of whatever the line holds, so adds from another window are
+        not overwritten; cleared=True empties the cart first.
+        Lines the product can no longer back (inactive, not enough stock) are
+        not written. Returns (success, message, rejected product IDs).
+        """
         conn = self.db.get_connection()
         cursor = conn.cursor()
-        if quantity > 0:
-            cursor.execute('UPDATE shopping_cart SET quantity=%s WHERE cart_id=%s', (quantity, cart_id))
-        else:
-            cursor.execute('DELETE FROM shopping_cart WHERE cart_id=%s', (cart_id,))
-        conn.commit()
-        conn.close()
+        try:
+            if cleared:
+                registry.execute(cursor, "cart.clear", (customer_id,))
+            
+            removed = [product_id for product_id, quantity in quantities.items() if quantity <= 0]
+            if removed and not cleared:
+                cursor.execute(f"""
+                    DELETE FROM shopping_cart
+                    WHERE customer_id = %s AND product_id IN ({", ".join(["%s"] * len(removed))})
+                """, (customer_id, *removed))
+            
+            problems = {}
+            for product_id, quantity in quantities.items():
+                if quantity > 0:
+                    registry.execute(cursor, "cart.set", (customer_id, quantity, product_id, quantity))
+                    if cursor.rowcount == 0:
+                        # Also 0 when the line already held that quantity
+                        problem = self._rejection(cursor, customer_id, product_id, quantity)
+                        if problem:
+                            problems[product_id] = problem
+            for product_id, units in (added or {}).items():
+                registry.execute(cursor, "cart.upsert", (customer_id, units, customer_id, product_id, units))
+                if cursor.rowcount == 0:
+                    problems[product_id] = self._rejection(cursor, customer_id, product_id, units, added=True)
+            
+            conn.commit()
+            if problems:
+                return False, "; ".join(problems.values()), list(problems)
+            return True, "Cart saved", []
+        except Exception as e:
+            conn.rollback()
+            return False, f"Could not save cart: {str(e)}", []
+        finally:
+            conn.close()
     
-    def clear_cart(self, customer_id):
-        conn = self.db.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('DELETE FROM shopping_cart WHERE customer_id=%s', (customer_id,))
-        conn.commit()
-        conn.close()
+    def _rejection(self, cursor, customer_id, product_id, quantity, added=False):
+        """Why a line was not written, or None if it fits (added: quantity goes on top of the line)"""
+        availability = registry.fetchone(cursor, "cart.availability", (customer_id, product_id))
+        if not availability or availability[0] != 1:
+            return f"{availability[3] if availability else 'A product'} is no longer available"
+        _, stock, in_cart, name = availability
+        wanted = in_cart + quantity if added else quantity
+        if wanted <= stock:
+            return None
+        return f"Only {stock} of {name} in stock ({in_cart} in your cart)"
 
 class StaffManagement:
     def __init__(self, db: Database):
         self.db = db
     
     def add_staff(self, username, password, full_name, email, role):
+        """Blocking (hashes the password): call it off the Qt thread, e.g. Authenticator.run"""
         try:
+            hashed_password = self.db.hash_password(password)
             conn = self.db.get_connection()
             cursor = conn.cursor()
-            hashed_password = self.db.hash_password(password)
             cursor.execute('''
                 INSERT INTO users (username, password, full_name, email, role, is_active)
                 VALUES (%s, %s, %s, %s, %s, 1)
@@ -851,8 +1771,7 @@ class StaffManagement:
         cursor = conn.cursor()
         cursor.execute("""
             SELECT user_id, username, full_name, email, role 
-            FROM users 
-            WHERE role != 'customer' AND is_active = 1
+            FROM active_staff
         """)
         staff = cursor.fetchall()
         conn.close()
@@ -932,13 +1851,13 @@ class StaffManagement:
             return False, f"Failed to restore staff: {str(e)}"
     
     def update_staff(self, user_id, full_name, email, role, new_password=None):
-        """Update staff member details"""
+        """Update staff member details (blocking when new_password hashes: call it off the Qt thread)"""
         try:
+            hashed_password = self.db.hash_password(new_password) if new_password else None
             conn = self.db.get_connection()
             cursor = conn.cursor()
             
             if new_password:
-                hashed_password = self.db.hash_password(new_password)
                 cursor.execute('''
                     UPDATE users 
                     SET full_name=%s, email=%s, role=%s, password=%s
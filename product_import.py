@@ -0,0 +1,249 @@
+import csv
+import json
+import os
+import time
+from decimal import Decimal, InvalidOperation
+from typing import NamedTuple, Optional
+import model_events
+from models import record_stock_movements, MOVEMENT_IMPORT
+
+# =============================================================================
+# BULK PRODUCT IMPORT
+# Supplier catalogs (CSV or JSON Lines) keyed by SKU. Rows are validated,
+# de-duplicated (last occurrence wins) and written as multi-row
+# INSERT ... ON DUPLICATE KEY UPDATE statements, one commit per chunk.
+# Optional fields a row leaves out (or empty) get defaults on new products
+# and are left untouched on existing ones, so a price-only update keeps stock.
+# Stock levels set by the import are recorded in the stock ledger as the
+# difference from the level before the chunk.
+# =============================================================================
+IMPORT_FIELDS = ("sku", "name", "description", "price", "stock", "category",
+                 "low_stock_threshold")
+# Values for optional fields a new product's row did not supply
+IMPORT_DEFAULTS = {"description": None, "stock": 0, "category": None, "low_stock_threshold": 10}
+DEFAULT_CHUNK_SIZE = 1000
+
+
+class ImportRowError(NamedTuple):
+    line: int
+    sku: Optional[str]
+    message: str
+
+
+class ImportReport:
+    """Outcome of one import run"""
+
+    def __init__(self):
+        self.total_rows = 0
+        self.inserted = 0
+        self.updated = 0
+        self.duplicates = 0
+        self.errors = []
+        self.elapsed = 0.0
+
+    @property
+    def written(self):
+        return self.inserted + self.updated
+
+    @property
+    def rows_per_second(self):
+        return self.written / self.elapsed if self.elapsed else 0.0
+
+    def summary(self):
+        return (f"{self.total_rows} rows read: {self.inserted} added, {self.updated} updated, "
+                f"{self.duplicates} duplicate SKUs merged, {len(self.errors)} errors "
+                f"({self.rows_per_second:,.0f} rows/s)")
+
+
+# ---------------------------------------------------
+# Reading
+# ---------------------------------------------------
+def read_rows(path):
+    """Yield (line_number, dict) from a .csv or .jsonl/.ndjson file"""
+    extension = os.path.splitext(path)[1].lower()
+    if extension in (".jsonl", ".ndjson"):
+        with open(path, encoding="utf-8") as f:
+            for line_number, line in enumerate(f, start=1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError as e:
+                    yield line_number, ValueError(f"Invalid JSON: {e.msg}")
+                    continue
+                yield line_number, record
+    else:
+        with open(path, encoding="utf-8-sig", newline="") as f:
+            reader = csv.DictReader(f)
+            # Header is line 1
+            for line_number, record in enumerate(reader, start=2):
+                yield line_number, record
+
+
+# ---------------------------------------------------
+# Validation
+# ---------------------------------------------------
+def validate_row(record):
+    """Return a parameter tuple in IMPORT_FIELDS order (None = optional field not supplied), or raise ValueError"""
+    if not isinstance(record, dict):
+        raise ValueError("Row is not an object")
+
+    def text(field, limit):
+        value = record.get(field)
+        value = "" if value is None else str(value).strip()
+        if len(value) > limit:
+            raise ValueError(f"{field} longer than {limit} characters")
+        return value
+
+    def integer(field):
+        value = record.get(field)
+        if value is None or str(value).strip() == "":
+            return None
+        try:
+            number = int(str(value).strip())
+        except ValueError:
+            raise ValueError(f"{field} must be a whole number")
+        if number < 0:
+            raise ValueError(f"{field} cannot be negative")
+        return number
+
+    sku = text("sku", 64)
+    if not sku:
+        raise ValueError("sku is required")
+    name = text("name", 255)
+    if not name:
+        raise ValueError("name is required")
+
+    raw_price = record.get("price")
+    try:
+        price = Decimal(str(raw_price).strip().lstrip("$"))
+    except (InvalidOperation, AttributeError):
+        raise ValueError("price must be a number")
+    if not price.is_finite() or price < 0:
+        raise ValueError("price must be zero or more")
+    price = price.quantize(Decimal("0.01"))
+
+    return (
+        sku,
+        name,
+        text("description", 65535) or None,
+        price,
+        integer("stock"),
+        text("category", 100) or None,
+        integer("low_stock_threshold"),
+    )
+
+
+# ---------------------------------------------------
+# Import engine
+# ---------------------------------------------------
+class ProductImporter:
+    def __init__(self, db, chunk_size=DEFAULT_CHUNK_SIZE):
+        self.db = db
+        self.chunk_size = chunk_size
+
+    def import_file(self, path, progress=None):
+        """
+        Import a supplier catalog file.
+        progress(done, total) is called after every chunk; return False from it
+        to cancel (already committed chunks are kept).
+        """
+        report = ImportReport()
+        started = time.perf_counter()
+
+        # Validate + dedupe by SKU (last occurrence wins)
+        rows = {}
+        lines = {}
+        for line_number, record in read_rows(path):
+            report.total_rows += 1
+            if isinstance(record, Exception):
+                report.errors.append(ImportRowError(line_number, None, str(record)))
+                continue
+            try:
+                params = validate_row(record)
+            except ValueError as e:
+                sku = record.get("sku") if isinstance(record, dict) else None
+                report.errors.append(ImportRowError(line_number, sku, str(e)))
+                continue
+            if params[0] in rows:
+                report.duplicates += 1
+                del rows[params[0]]  # Re-insert so the row keeps its latest position
+            rows[params[0]] = params
+            lines[params[0]] = line_number
+
+        self.write_rows(list(rows.values()), report, lines, progress)
+        report.elapsed = time.perf_counter() - started
+
+        if report.written:
+            # Too many rows to patch one by one - listeners reload the catalog
+            model_events.products_changed(None)
+        return report
+
+    def write_rows(self, rows, report, lines=None, progress=None):
+        lines = lines or {}
+        conn = self.db.get_connection()
+        cursor = conn.cursor()
+        total = len(rows)
+
+        try:
+            for start in range(0, total, self.chunk_size):
+                chunk = rows[start:start + self.chunk_size]
+                try:
+                    inserted, updated = self._write_chunk(cursor, chunk)
+                    conn.commit()
+                    report.inserted += inserted
+                    report.updated += updated
+                except Exception:
+                    conn.rollback()
+                    # Retry the failed chunk row by row to pinpoint the bad rows
+                    for params in chunk:
+                        try:
+                            inserted, updated = self._write_chunk(cursor, [params])
+                            conn.commit()
+                            report.inserted += inserted
+                            report.updated += updated
+                        except Exception as e:
+                            conn.rollback()
+                            report.errors.append(ImportRowError(lines.get(params[0], 0), params[0], str(e)))
+
+                if progress and progress(min(start + self.chunk_size, total), total) is False:
+                    break
+        finally:
+            conn.close()
+
+    def _write_chunk(self, cursor, chunk):
+        """Existing-stock probe, one multi-row upsert, ledger rows; returns (inserted, updated)"""
+        skus = [params[0] for params in chunk]
+        placeholders = ", ".join(["%s"] * len(skus))
+        cursor.execute(f"SELECT sku, stock FROM products WHERE sku IN ({placeholders}) FOR UPDATE",
+                       tuple(skus))
+        previous = dict(cursor.fetchall())
+        existing = len(previous)
+
+        # One upsert per set of supplied fields (normally one per file): only
+        # supplied fields are updated on existing products
+        groups = {}
+        for params in chunk:
+            supplied = tuple(field for field, value in zip(IMPORT_FIELDS, params) if value is not None)
+            groups.setdefault(supplied, []).append(params)
+
+        row_sql = "(%s, %s, %s, %s, %s, %s, %s, 1)"
+        for supplied, group in groups.items():
+            values = ", ".join([row_sql] * len(group))
+            updates = ",\n                    ".join(f"{field} = VALUES({field})" for field in supplied if field != "sku")
+            flat = [IMPORT_DEFAULTS.get(field) if value is None else value
+                    for params in group for field, value in zip(IMPORT_FIELDS, params)]
+            cursor.execute(f"""
+                INSERT INTO products (sku, name, description, price, stock, category,
+                                      low_stock_threshold, is_active)
+                VALUES {values}
+                ON DUPLICATE KEY UPDATE
+                    {updates}
+            """, tuple(flat))
+
+        cursor.execute(f"SELECT product_id, sku, stock FROM products WHERE sku IN ({placeholders})",
+                       tuple(skus))
+        record_stock_movements(cursor, [(product_id, stock - previous.get(sku, 0))
+                                        for product_id, sku, stock in cursor.fetchall()], MOVEMENT_IMPORT)
+        return len(chunk) - existing, existing
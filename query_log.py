@@ -0,0 +1,301 @@
+import atexit
+import json
+import logging
+import os
+import re
+import sys
+import threading
+import time
+import weakref
+from collections import Counter, deque
+
+# =============================================================================
+# QUERY LOG
+# Database.get_connection hands out InstrumentedConnection wrappers whose
+# cursors record every statement: normalised SQL fingerprint, rows, duration
+# (execute + fetch) and the calling model/window function. Statements slower
+# than the threshold go to the slow-query log together with their EXPLAIN
+# plan, which is captured when the connection is closed (after the caller has
+# read its results). report() / to_json() / dump() summarise the top
+# fingerprints by total time.
+# =============================================================================
+SLOW_QUERY_MS = float(os.environ.get("TECHHAVEN_SLOW_QUERY_MS", "200"))
+SLOW_LOG_SIZE = 200
+EXPLAINABLE = ("SELECT", "UPDATE", "DELETE", "WITH")
+
+logger = logging.getLogger("techhaven.slow_query")
+
+_INTERNAL_FILES = {os.path.abspath(__file__).rsplit(".", 1)[0]}
+for _module in ("query_registry", "database"):
+    _INTERNAL_FILES.add(os.path.join(os.path.dirname(os.path.abspath(__file__)), _module))
+
+_STRING = re.compile(r"'(?:[^'\\]|\\.)*'")
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_IN_LIST = re.compile(r"\bIN\s*\(\s*\?(?:\s*,\s*\?)*\s*\)", re.IGNORECASE)
+_VALUES_LIST = re.compile(r"(\(\s*\?(?:\s*,\s*\?)*\s*\))(?:\s*,\s*\(\s*\?(?:\s*,\s*\?)*\s*\))+")
+_WHITESPACE = re.compile(r"\s+")
+_fingerprints = {}
+
+
+def fingerprint(sql):
+    """Normalise a statement so calls that differ only in values/IN-list length group together"""
+    cached = _fingerprints.get(sql)
+    if cached is not None:
+        return cached
+    text = sql.replace("%s", "?")
+    text = _STRING.sub("?", text)
+    text = _NUMBER.sub("?", text)
+    text = _VALUES_LIST.sub(r"\1, ...", text)
+    text = _IN_LIST.sub("IN (?, ...)", text)
+    text = _WHITESPACE.sub(" ", text).strip()
+    if len(_fingerprints) < 5000:
+        _fingerprints[sql] = text
+    return text
+
+
+def _caller():
+    """First frame outside the DB plumbing, as 'file.py:line function'"""
+    frame = sys._getframe(2)
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if os.path.abspath(filename).rsplit(".", 1)[0] not in _INTERNAL_FILES:
+            return f"{os.path.basename(filename)}:{frame.f_lineno} {frame.f_code.co_name}"
+        frame = frame.f_back
+    return "?"
+
+
+class FingerprintStats:
+    def __init__(self, fingerprint):
+        self.fingerprint = fingerprint
+        self.calls = 0
+        self.rows = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.slow = 0
+        self.callers = Counter()
+
+    @property
+    def mean_ms(self):
+        return self.total_ms / self.calls if self.calls else 0.0
+
+    def to_dict(self, callers=5):
+        return {
+            "fingerprint": self.fingerprint,
+            "calls": self.calls,
+            "rows": self.rows,
+            "total_ms": round(self.total_ms, 3),
+            "mean_ms": round(self.mean_ms, 3),
+            "max_ms": round(self.max_ms, 3),
+            "slow": self.slow,
+            "callers": dict(self.callers.most_common(callers)),
+        }
+
+
+class QueryLog:
+    def __init__(self, slow_ms=SLOW_QUERY_MS, enabled=True):
+        self.slow_ms = slow_ms
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._stats = {}
+        self.slow_queries = deque(maxlen=SLOW_LOG_SIZE)
+
+    def record(self, sql, params, elapsed_ms, rows, caller):
+        """Add one finished statement; returns the slow-log entry if it was slow"""
+        key = fingerprint(sql)
+        with self._lock:
+            stats = self._stats.get(key)
+            if stats is None:
+                stats = self._stats[key] = FingerprintStats(key)
+            stats.calls += 1
+            stats.rows += max(rows, 0)
+            stats.total_ms += elapsed_ms
+            stats.max_ms = max(stats.max_ms, elapsed_ms)
+            stats.callers[caller] += 1
+            if elapsed_ms < self.slow_ms:
+                return None
+            stats.slow += 1
+            entry = {
+                "fingerprint": key,
+                "sql": _WHITESPACE.sub(" ", sql).strip(),
+                "params": [str(value) for value in (params or ())][:20],
+                "duration_ms": round(elapsed_ms, 3),
+                "rows": rows,
+                "caller": caller,
+                "at": time.strftime("%Y-%m-%d %H:%M:%S"),
+                "explain": None,
+            }
+            self.slow_queries.append(entry)
+        logger.warning("Slow query %.1f ms (%s rows) at %s: %s", elapsed_ms, rows, caller, key)
+        return entry
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+            self.slow_queries.clear()
+
+    # ---------------------------------------------------
+    # Reports
+    # ---------------------------------------------------
+    def top(self, n=20, key="total_ms"):
+        with self._lock:
+            stats = list(self._stats.values())
+        return sorted(stats, key=lambda s: getattr(s, key), reverse=True)[:n]
+
+    def to_json(self, n=50):
+        with self._lock:
+            slow = [dict(entry) for entry in self.slow_queries]
+        return {
+            "slow_threshold_ms": self.slow_ms,
+            "top": [stats.to_dict() for stats in self.top(n)],
+            "slow_queries": slow,
+        }
+
+    def report(self, n=20):
+        lines = [f"Top {n} statements by total time (slow threshold {self.slow_ms:g} ms)",
+                 f"{'calls':>7} {'total ms':>10} {'mean ms':>9} {'max ms':>9} {'rows':>8} {'slow':>5}  statement / top caller"]
+        for stats in self.top(n):
+            caller = stats.callers.most_common(1)[0][0] if stats.callers else "?"
+            lines.append(f"{stats.calls:>7} {stats.total_ms:>10.1f} {stats.mean_ms:>9.2f} {stats.max_ms:>9.2f} "
+                         f"{stats.rows:>8} {stats.slow:>5}  {stats.fingerprint[:100]}")
+            lines.append(f"{'':>54}  <- {caller}")
+        return "\n".join(lines)
+
+    def dump(self, path, n=50):
+        """Write the JSON report (path ending .json) or the text report"""
+        with open(path, "w", encoding="utf-8") as f:
+            if path.lower().endswith(".json"):
+                json.dump(self.to_json(n), f, indent=2, default=str)
+            else:
+                f.write(self.report(n) + "\n")
+        return path
+
+
+# Process-wide log used by Database.get_connection
+query_log = QueryLog(enabled=os.environ.get("TECHHAVEN_QUERY_LOG", "1") != "0")
+
+if os.environ.get("TECHHAVEN_QUERY_REPORT"):
+    atexit.register(query_log.dump, os.environ["TECHHAVEN_QUERY_REPORT"])
+
+
+# =============================================================================
+# WRAPPERS
+# =============================================================================
+class InstrumentedCursor:
+    """Times execute + fetch of each statement on the wrapped cursor"""
+
+    def __init__(self, cursor, connection):
+        self._cursor = cursor
+        self._log = connection.log
+        # Weak: the query registry caches cursors in a WeakKeyDictionary keyed
+        # by the connection, and a strong back-reference would keep it alive
+        self._connection = weakref.ref(connection)
+        self._pending = None
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __iter__(self):
+        return iter(self.fetchall())
+
+    def _finish(self, rows=None):
+        pending, self._pending = self._pending, None
+        if pending is None:
+            return
+        sql, params, elapsed, caller = pending
+        if rows is None:
+            rows = self._cursor.rowcount
+        entry = self._log.record(sql, params, elapsed * 1000, rows, caller)
+        connection = self._connection()
+        if entry is not None and connection is not None and sql.lstrip().upper().startswith(EXPLAINABLE):
+            connection.explain_later(entry, sql, params)
+
+    def execute(self, operation, params=None, *args, **kwargs):
+        self._finish()
+        started = time.perf_counter()
+        try:
+            result = self._cursor.execute(operation, params, *args, **kwargs)
+        finally:
+            self._pending = (operation, params, time.perf_counter() - started, _caller())
+        if not getattr(self._cursor, "with_rows", False):
+            self._finish()
+        return result
+
+    def executemany(self, operation, seq_params):
+        self._finish()
+        started = time.perf_counter()
+        try:
+            return self._cursor.executemany(operation, seq_params)
+        finally:
+            self._pending = (operation, None, time.perf_counter() - started, _caller())
+            self._finish()
+
+    def _timed_fetch(self, fetch, *args):
+        started = time.perf_counter()
+        result = fetch(*args)
+        if self._pending is not None:
+            sql, params, elapsed, caller = self._pending
+            self._pending = (sql, params, elapsed + time.perf_counter() - started, caller)
+        return result
+
+    def fetchall(self):
+        rows = self._timed_fetch(self._cursor.fetchall)
+        self._finish(len(rows))
+        return rows
+
+    def fetchone(self):
+        row = self._timed_fetch(self._cursor.fetchone)
+        if row is None:
+            self._finish()
+        return row
+
+    def fetchmany(self, size=1):
+        return self._timed_fetch(self._cursor.fetchmany, size)
+
+    def close(self):
+        self._finish()
+        return self._cursor.close()
+
+
+class InstrumentedConnection:
+    """Connection wrapper whose cursors are instrumented; EXPLAINs slow statements on close"""
+
+    def __init__(self, connection, log=query_log):
+        self._connection = connection
+        self.log = log
+        self._cursors = []
+        self._explain = []
+
+    def __getattr__(self, name):
+        return getattr(self._connection, name)
+
+    def cursor(self, *args, **kwargs):
+        cursor = InstrumentedCursor(self._connection.cursor(*args, **kwargs), self)
+        self._cursors.append(cursor)
+        return cursor
+
+    def explain_later(self, entry, sql, params):
+        self._explain.append((entry, sql, params))
+
+    def _capture_explains(self):
+        explain, self._explain = self._explain, []
+        for entry, sql, params in explain:
+            try:
+                cursor = self._connection.cursor(buffered=True)
+                cursor.execute("EXPLAIN " + sql, params)
+                columns = [column[0] for column in cursor.description]
+                entry["explain"] = [dict(zip(columns, row)) for row in cursor.fetchall()]
+                cursor.close()
+            except Exception as e:
+                entry["explain"] = f"unavailable: {e}"
+
+    def close(self):
+        for cursor in self._cursors:
+            cursor._finish()
+        self._cursors = []
+        if self._explain:
+            self._capture_explains()
+        return self._connection.close()
+
+
+def instrument(connection, log=query_log):
+    return InstrumentedConnection(connection, log) if log.enabled else connection
@@ -0,0 +1,158 @@
+import bisect
+import threading
+import time
+import weakref
+from typing import NamedTuple
+
+# =============================================================================
+# QUERY REGISTRY
+# Every named query is defined once (define()) and executed by name. On a
+# connection the statement runs through a server-side prepared cursor that is
+# cached for the life of that connection, so a statement repeated inside one
+# unit of work (one line per cart item, one row per page) is parsed once.
+# Each call is timed into a fixed-bucket latency histogram per query name.
+# =============================================================================
+# Upper bounds of the latency buckets in milliseconds (last bucket is open)
+LATENCY_BUCKETS_MS = (0.5, 1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+
+
+class Query(NamedTuple):
+    name: str
+    sql: str
+    prepared: bool
+
+
+class QueryStats:
+    """Call count and latency histogram for one named query"""
+
+    def __init__(self, name):
+        self.name = name
+        self.calls = 0
+        self.errors = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.buckets = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+
+    def record(self, elapsed_ms, failed=False):
+        self.calls += 1
+        self.errors += failed
+        self.total_ms += elapsed_ms
+        self.max_ms = max(self.max_ms, elapsed_ms)
+        self.buckets[bisect.bisect_left(LATENCY_BUCKETS_MS, elapsed_ms)] += 1
+
+    @property
+    def mean_ms(self):
+        return self.total_ms / self.calls if self.calls else 0.0
+
+    def percentile(self, fraction):
+        """Upper bound of the bucket holding the given fraction of calls"""
+        if not self.calls:
+            return 0.0
+        target = fraction * self.calls
+        seen = 0
+        for index, count in enumerate(self.buckets):
+            seen += count
+            if seen >= target:
+                return LATENCY_BUCKETS_MS[index] if index < len(LATENCY_BUCKETS_MS) else self.max_ms
+        return self.max_ms
+
+    def copy(self):
+        snapshot = QueryStats(self.name)
+        snapshot.__dict__.update(self.__dict__, buckets=list(self.buckets))
+        return snapshot
+
+
+class QueryRegistry:
+    def __init__(self):
+        self._queries = {}
+        self._stats = {}
+        self._lock = threading.Lock()
+        # connection -> {query name: prepared cursor}; entries go with the connection
+        self._prepared = weakref.WeakKeyDictionary()
+
+    # ---------------------------------------------------
+    # Definitions
+    # ---------------------------------------------------
+    def define(self, name, sql, prepared=True):
+        """Register a named query; prepared=False for statements the server can't prepare"""
+        if name in self._queries:
+            raise ValueError(f"Query '{name}' is already defined")
+        self._queries[name] = Query(name, sql, prepared)
+        self._stats[name] = QueryStats(name)
+        return name
+
+    def get(self, name):
+        return self._queries[name]
+
+    def names(self):
+        return sorted(self._queries)
+
+    # ---------------------------------------------------
+    # Execution
+    # ---------------------------------------------------
+    def _cursor(self, conn, query):
+        if not query.prepared:
+            return conn.cursor()
+        cursors = self._prepared.setdefault(conn, {})
+        cursor = cursors.get(query.name)
+        if cursor is None:
+            cursor = cursors[query.name] = conn.cursor(prepared=True)
+        return cursor
+
+    def execute(self, target, name, params=()):
+        """
+        Run a named query. target is a connection (prepared cursor, cached per
+        connection) or a cursor the caller already holds (run as-is, e.g. inside
+        a helper that shares the caller's DB transaction). Returns the cursor.
+        """
+        query = self._queries[name]
+        cursor = self._cursor(target, query) if hasattr(target, "commit") else target
+        started = time.perf_counter()
+        failed = True
+        try:
+            cursor.execute(query.sql, tuple(params))
+            failed = False
+        finally:
+            self.record(name, (time.perf_counter() - started) * 1000, failed)
+        return cursor
+
+    def fetchall(self, target, name, params=()):
+        return self.execute(target, name, params).fetchall()
+
+    def fetchone(self, target, name, params=()):
+        # Prepared cursors are unbuffered - always drain the result set
+        rows = self.execute(target, name, params).fetchall()
+        return rows[0] if rows else None
+
+    # ---------------------------------------------------
+    # Statistics
+    # ---------------------------------------------------
+    def record(self, name, elapsed_ms, failed=False):
+        with self._lock:
+            stats = self._stats.get(name)
+            if stats is None:
+                stats = self._stats[name] = QueryStats(name)
+            stats.record(elapsed_ms, failed)
+
+    def stats(self):
+        """Snapshot of per-query stats, busiest first"""
+        with self._lock:
+            snapshot = [stats.copy() for stats in self._stats.values() if stats.calls]
+        return sorted(snapshot, key=lambda stats: stats.total_ms, reverse=True)
+
+    def reset_stats(self):
+        with self._lock:
+            for name in self._stats:
+                self._stats[name] = QueryStats(name)
+
+    def report(self):
+        lines = [f"{'query':<36} {'calls':>8} {'mean ms':>9} {'p50':>7} {'p95':>7} {'max ms':>9}"]
+        for stats in self.stats():
+            lines.append(f"{stats.name:<36} {stats.calls:>8} {stats.mean_ms:>9.2f} "
+                         f"{stats.percentile(0.50):>7g} {stats.percentile(0.95):>7g} {stats.max_ms:>9.2f}")
+        return "\n".join(lines)
+
+
+# Process-wide registry used by the model layer
+registry = QueryRegistry()
+define = registry.define
@@ -6,6 +6,7 @@ from PyQt6.QtWidgets import (
 from PyQt6.QtGui import QFont
 from PyQt6.QtCore import Qt
 from datetime import datetime
+from receipt_renderer import context_from_data, render_html, write_pdf, print_html
 
 
 class ReceiptDialog(QDialog):
@@ -338,13 +339,7 @@ class ReceiptDialog(QDialog):
         dialog = QPrintDialog(printer, self)
         
         if dialog.exec() == QPrintDialog.DialogCode.Accepted:
-            # You would implement the actual printing logic here
-            from PyQt6.QtWidgets import QMessageBox
-            QMessageBox.information(
-                self, 
-                "Print", 
-                "Receipt sent to printer!\n\n(In a real implementation, this would print the receipt)"
-            )
+            print_html(render_html(context_from_data(self.transaction_data)), printer)
     
     def save_pdf(self):
         """Save receipt as PDF"""
@@ -358,13 +353,12 @@ class ReceiptDialog(QDialog):
         )
         
         if filename:
-            # You would implement PDF generation here
-            # For now, just show a message
-            QMessageBox.information(
-                self,
-                "PDF Saved",
-                f"Receipt saved as:\n{filename}\n\n(In a real implementation, this would generate a PDF file)"
-            )
+            try:
+                write_pdf([render_html(context_from_data(self.transaction_data))], filename)
+            except (OSError, KeyError, ValueError) as e:
+                QMessageBox.critical(self, "Error", f"Could not save PDF:\n{e}")
+                return
+            QMessageBox.information(self, "PDF Saved", f"Receipt saved as:\n{filename}")
     
     def email_receipt(self):
         """Email receipt to customer"""
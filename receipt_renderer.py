@@ -0,0 +1,397 @@
+import html
+import os
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from decimal import Decimal
+from string import Template
+from PyQt6.QtCore import QSizeF
+from PyQt6.QtGui import QGuiApplication, QPageSize, QPainter, QPdfWriter, QTextDocument
+from models import (
+    TRANSACTION_COLUMNS, TRANSACTION_ITEM_COLUMNS, TransactionRow, TransactionItemRow,
+    select_columns, _rows,
+)
+import metrics
+
+_CACHE_HITS = metrics.CACHE_REQUESTS.labels(cache="receipts", result="hit")
+_CACHE_MISSES = metrics.CACHE_REQUESTS.labels(cache="receipts", result="miss")
+
+# =============================================================================
+# RECEIPT TEMPLATES
+# Compiled once at import: static header/footer blocks are pre-built strings,
+# per-line layouts are format strings, and rendering is a single "".join().
+# =============================================================================
+WIDTH = 60
+RULE = "-" * WIDTH + "\n"
+DOUBLE_RULE = "=" * WIDTH + "\n"
+
+TEXT_HEADER = (
+    DOUBLE_RULE
+    + "           🏪 TECHHAVEN ELECTRONIC STORE\n"
+    + "         Your One-Stop Technology Shop\n"
+    + "     123 Tech Avenue, Tech City, TC 12345\n"
+    + "          Phone: (555) 123-4567\n"
+    + "         Email: info@techhaven.com\n"
+    + DOUBLE_RULE + "\n"
+)
+TEXT_INFO = (
+    "{reference_label}: {reference}\n"
+    "Date & Time: {date}\n"
+    "Customer: {customer}\n"
+    "Processed by: {staff}\n"
+    "Payment Method: {payment_method}\n"
+    + RULE + "\n"
+    + "ITEMS PURCHASED:\n"
+    + RULE
+    + f"{'Item':<35} {'Qty':>5} {'Price':>8} {'Total':>10}\n"
+    + RULE
+)
+TEXT_ITEM = "{name:<35.35} {quantity:>5} ${price:>7.2f} ${total:>9.2f}\n"
+TEXT_TOTALS = (
+    RULE
+    + "{subtotal_label:<50} ${subtotal:>8.2f}\n"
+    + "{discount_label:<50} ${discount:>8.2f}\n"
+    + "{tax_label:<50} ${tax:>8.2f}\n"
+    + DOUBLE_RULE
+    + "{total_label:<50} ${total:>8.2f}\n"
+    + DOUBLE_RULE + "\n"
+)
+TEXT_FOOTER = (
+    "         Thank you for shopping with TechHaven!\n"
+    "      Visit us again for all your tech needs!\n"
+    "                www.techhaven.com\n"
+    + DOUBLE_RULE
+    + "\nRETURN POLICY:\n"
+    + "Products may be returned within 30 days with receipt\n"
+    + "and in original packaging. Conditions apply.\n"
+)
+
+HTML_RECEIPT = Template("""
+<div style='font-family: Arial; font-size: 10pt;'>
+  <h2 align='center' style='color: #2196F3;'>TechHaven</h2>
+  <p align='center' style='color: #666;'>Your One-Stop Technology Shop<br>
+     123 Tech Avenue, Tech City, TC 12345<br>Phone: (555) 123-4567</p>
+  <h3 align='center'>SALES RECEIPT</h3>
+  <table width='100%'>
+    <tr><td><b>$reference_label:</b></td><td align='right'>#$transaction_id</td></tr>
+    <tr><td><b>Date &amp; Time:</b></td><td align='right'>$date</td></tr>
+    <tr><td><b>Customer:</b></td><td align='right'>$customer</td></tr>
+    <tr><td><b>Served By:</b></td><td align='right'>$staff</td></tr>
+    <tr><td><b>Payment:</b></td><td align='right'>$payment_method</td></tr>
+  </table>
+  <hr>
+  <table width='100%' cellspacing='0' cellpadding='3'>
+    <tr style='background-color: #e3f2fd;'>
+      <th align='left'>Product</th><th align='center'>Qty</th>
+      <th align='right'>Price</th><th align='right'>Total</th>
+    </tr>
+    $item_rows
+  </table>
+  <hr>
+  <table width='100%'>
+    <tr><td><b>Subtotal:</b></td><td align='right'>$$$subtotal</td></tr>
+    <tr><td><b>Discount:</b></td><td align='right'>-$$$discount</td></tr>
+    <tr><td><b>Tax (10%):</b></td><td align='right'>$$$tax</td></tr>
+    <tr><td><b>TOTAL:</b></td><td align='right'><b>$$$total</b></td></tr>
+  </table>
+  <p align='center' style='color: #666;'><i>Thank you for shopping with TechHaven!<br>
+     For returns, present this receipt within 30 days.</i></p>
+</div>
+""")
+HTML_ITEM = Template(
+    "<tr><td>$name</td><td align='center'>$quantity</td>"
+    "<td align='right'>$$$price</td><td align='right'>$$$total</td></tr>"
+)
+HTML_PAGE_BREAK = "<div style='page-break-after: always;'></div>"
+
+
+# ---------------------------------------------------
+# Receipt context (neutral form for every renderer)
+# ---------------------------------------------------
+def context_from_rows(transaction, items):
+    """Build a receipt context from Transaction.get_transaction() rows"""
+    subtotal = transaction.total_amount + transaction.discount - transaction.tax
+    return {
+        "transaction_id": transaction.transaction_id,
+        "reference_label": "Transaction ID",
+        "date": transaction.transaction_date,
+        "customer": transaction.customer_name or "Walk-in Customer",
+        "staff": transaction.staff_name or "",
+        "payment_method": transaction.payment_method or "",
+        "items": [
+            {"name": item.product_name or "", "quantity": item.quantity,
+             "price": item.unit_price, "total": item.subtotal}
+            for item in items
+        ],
+        "subtotal": subtotal,
+        "discount": transaction.discount,
+        "tax": transaction.tax,
+        "total": transaction.total_amount,
+    }
+
+
+def context_from_data(data):
+    """Build a receipt context from the dict used by ReceiptDialog"""
+    items = []
+    for item in data.get("items", []):
+        price = Decimal(str(item["price"]))
+        items.append({"name": item["name"], "quantity": item["quantity"], "price": price,
+                      "total": price * Decimal(str(item["quantity"]))})
+    return {
+        "transaction_id": int(data["transaction_id"]),
+        "reference_label": data.get("reference_label", "Transaction ID"),
+        # Printed instead of the transaction id when given (e.g. a till receipt number)
+        "reference": data.get("reference"),
+        "date": data.get("date", ""),
+        "customer": data.get("customer") or "Walk-in Customer",
+        "staff": data.get("staff", ""),
+        "payment_method": data.get("payment_method", ""),
+        "items": items,
+        "subtotal": Decimal(str(data.get("subtotal", 0))),
+        "discount": Decimal(str(data.get("discount", 0))),
+        "tax": Decimal(str(data.get("tax", 0))),
+        "total": Decimal(str(data.get("total", 0))),
+    }
+
+
+# ---------------------------------------------------
+# Renderers
+# ---------------------------------------------------
+def render_text(context):
+    reference = context.get("reference") or f"{context['transaction_id']:06d}"
+    parts = [TEXT_HEADER, TEXT_INFO.format(**dict(context, reference=reference))]
+    parts.extend(TEXT_ITEM.format(**item) for item in context["items"])
+    parts.append(TEXT_TOTALS.format(
+        subtotal_label="Subtotal:", discount_label="Discount:", tax_label="Tax (10%):",
+        total_label="TOTAL AMOUNT:", subtotal=context["subtotal"], discount=context["discount"],
+        tax=context["tax"], total=context["total"],
+    ))
+    parts.append(TEXT_FOOTER)
+    return "".join(parts)
+
+
+def render_html(context):
+    item_rows = "".join(
+        HTML_ITEM.substitute(name=html.escape(str(item["name"])), quantity=item["quantity"],
+                             price=f"{item['price']:.2f}", total=f"{item['total']:.2f}")
+        for item in context["items"]
+    )
+    return HTML_RECEIPT.substitute(
+        transaction_id=html.escape(str(context.get("reference") or context["transaction_id"])),
+        reference_label=html.escape(context["reference_label"]),
+        date=html.escape(str(context["date"])),
+        customer=html.escape(str(context["customer"])),
+        staff=html.escape(str(context["staff"])),
+        payment_method=html.escape(str(context["payment_method"])),
+        item_rows=item_rows,
+        subtotal=f"{context['subtotal']:.2f}",
+        discount=f"{context['discount']:.2f}",
+        tax=f"{context['tax']:.2f}",
+        total=f"{context['total']:.2f}",
+    )
+
+
+def ensure_gui_application():
+    """QTextDocument/QPdfWriter need a QGuiApplication; create an offscreen one when headless"""
+    app = QGuiApplication.instance()
+    if app is None:
+        os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+        app = QGuiApplication([])
+    return app
+
+
+def write_pdf(html_pages, path):
+    """Write one receipt per page into a single PDF (no window or printer needed)"""
+    ensure_gui_application()
+    writer = QPdfWriter(path)
+    writer.setPageSize(QPageSize(QPageSize.PageSizeId.A5))
+    writer.setResolution(150)
+    writer.setTitle("TechHaven Receipts")
+
+    painter = QPainter(writer)
+    page_size = QSizeF(writer.width(), writer.height())
+    try:
+        for index, page in enumerate(html_pages):
+            if index:
+                writer.newPage()
+            doc = QTextDocument()
+            doc.documentLayout().setPaintDevice(writer)
+            doc.setPageSize(page_size)
+            doc.setHtml(page)
+            doc.drawContents(painter)
+    finally:
+        painter.end()
+    return path
+
+
+def print_html(html_content, printer):
+    doc = QTextDocument()
+    doc.setHtml(html_content)
+    doc.print(printer)
+
+
+# =============================================================================
+# RECEIPT RENDERER (database-backed, cached)
+# =============================================================================
+class ReceiptRenderer:
+    """Render receipts by transaction id; rendered output is cached (LRU)"""
+
+    def __init__(self, db, cache_size=256):
+        self.db = db
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+
+    # ---------------------------------------------------
+    # Data loading
+    # ---------------------------------------------------
+    def load_contexts(self, transaction_ids):
+        """Receipt contexts for many transactions with two queries (header + items)"""
+        transaction_ids = list(transaction_ids)
+        if not transaction_ids:
+            return {}
+        placeholders = ", ".join(["%s"] * len(transaction_ids))
+        conn = self.db.get_connection()
+        cursor = conn.cursor()
+        cursor.execute(f'''
+            SELECT {select_columns(TRANSACTION_COLUMNS, 't')},
+                   CASE WHEN c.is_active = 0 THEN CONCAT(c.full_name, ' (Deleted)') ELSE c.full_name END,
+                   CASE WHEN u.is_active = 0 THEN CONCAT(u.full_name, ' (Inactive)') ELSE u.full_name END
+            FROM transactions t
+            LEFT JOIN customers c ON t.customer_id = c.customer_id
+            LEFT JOIN users u ON t.staff_id = u.user_id
+            WHERE t.transaction_id IN ({placeholders})
+        ''', tuple(transaction_ids))
+        transactions = _rows(TransactionRow, cursor.fetchall())
+
+        cursor.execute(f'''
+            SELECT {select_columns(TRANSACTION_ITEM_COLUMNS, 'ti')},
+                   CASE WHEN p.is_active = 0 THEN CONCAT(p.name, ' (Discontinued)') ELSE p.name END
+            FROM transaction_items ti
+            JOIN products p ON ti.product_id = p.product_id
+            WHERE ti.transaction_id IN ({placeholders})
+            ORDER BY ti.item_id
+        ''', tuple(transaction_ids))
+        items_by_transaction = {}
+        for item in _rows(TransactionItemRow, cursor.fetchall()):
+            items_by_transaction.setdefault(item.transaction_id, []).append(item)
+        conn.close()
+
+        return {
+            t.transaction_id: context_from_rows(t, items_by_transaction.get(t.transaction_id, []))
+            for t in transactions
+        }
+
+    # ---------------------------------------------------
+    # Cached rendering
+    # ---------------------------------------------------
+    def _cached(self, key):
+        value = self._cache.get(key)
+        if value is not None:
+            self._cache.move_to_end(key)
+            _CACHE_HITS.inc()
+        else:
+            _CACHE_MISSES.inc()
+        return value
+
+    def _store(self, key, value):
+        self._cache[key] = value
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def render(self, transaction_id, fmt="text"):
+        """Rendered 'text' or 'html' receipt, or None if the transaction does not exist"""
+        return self.render_many([transaction_id], fmt).get(transaction_id)
+
+    def render_many(self, transaction_ids, fmt="text"):
+        renderer = render_html if fmt == "html" else render_text
+        result = {}
+        missing = []
+        for transaction_id in transaction_ids:
+            cached = self._cached((transaction_id, fmt))
+            if cached is None:
+                missing.append(transaction_id)
+            else:
+                result[transaction_id] = cached
+        for transaction_id, context in self.load_contexts(missing).items():
+            rendered = renderer(context)
+            self._store((transaction_id, fmt), rendered)
+            result[transaction_id] = rendered
+        return result
+
+    def invalidate(self, transaction_id=None):
+        if transaction_id is None:
+            self._cache.clear()
+            return
+        for fmt in ("text", "html"):
+            self._cache.pop((transaction_id, fmt), None)
+
+    def save_pdf(self, transaction_id, path):
+        content = self.render(transaction_id, "html")
+        if content is None:
+            raise ValueError(f"Transaction {transaction_id} not found")
+        return write_pdf([content], path)
+
+    # ---------------------------------------------------
+    # End-of-day archiving (headless)
+    # ---------------------------------------------------
+    def archive_day(self, directory, date=None, fmt="pdf", chunk_size=500, progress=None):
+        """
+        Render every sale of a day into one archive file (multi-page PDF, HTML or text).
+        Receipts are loaded/rendered in chunks and bypass the interactive cache.
+        Returns (path, receipt_count).
+        """
+        day = datetime.strptime(date, "%Y-%m-%d") if date else datetime.now()
+        day = day.replace(hour=0, minute=0, second=0, microsecond=0)
+
+        conn = self.db.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT transaction_id FROM transactions
+            WHERE transaction_date >= %s AND transaction_date < %s AND transaction_type = 'sale'
+            ORDER BY transaction_id
+        ''', (day, day + timedelta(days=1)))
+        transaction_ids = [row[0] for row in cursor.fetchall()]
+        conn.close()
+
+        renderer = render_text if fmt == "text" else render_html
+        pages = []
+        for start in range(0, len(transaction_ids), chunk_size):
+            chunk = transaction_ids[start:start + chunk_size]
+            contexts = self.load_contexts(chunk)
+            pages.extend(renderer(contexts[tid]) for tid in chunk if tid in contexts)
+            if progress:
+                progress(len(pages), len(transaction_ids))
+
+        os.makedirs(directory, exist_ok=True)
+        extension = {"pdf": "pdf", "html": "html", "text": "txt"}[fmt]
+        path = os.path.join(directory, f"receipts_{day:%Y-%m-%d}.{extension}")
+        if fmt == "pdf":
+            write_pdf(pages, path)
+        else:
+            separator = HTML_PAGE_BREAK if fmt == "html" else "\f\n"
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(separator.join(pages))
+        return path, len(pages)
+
+
+# =============================================================================
+# Command line:  python receipt_renderer.py <directory> [YYYY-MM-DD] [pdf|html|text]
+# Headless end-of-day archive of every sale receipt.
+# =============================================================================
+if __name__ == "__main__":
+    import sys
+    import time
+    from database import Database
+
+    if len(sys.argv) < 2:
+        print("usage: python receipt_renderer.py <directory> [YYYY-MM-DD] [pdf|html|text]")
+        sys.exit(1)
+
+    archive_dir = sys.argv[1]
+    archive_date = sys.argv[2] if len(sys.argv) > 2 else None
+    archive_fmt = sys.argv[3] if len(sys.argv) > 3 else "pdf"
+
+    started = time.perf_counter()
+    archive_path, count = ReceiptRenderer(Database()).archive_day(archive_dir, archive_date, archive_fmt)
+    elapsed = time.perf_counter() - started
+    print(f"Archived {count} receipts to {archive_path} ({elapsed:.2f}s)")
@@ -1,16 +1,26 @@
+import threading
 from decimal import Decimal
 from PyQt6.QtWidgets import *
-from PyQt6.QtCore import Qt
+from PyQt6.QtCore import Qt, QTimer, pyqtSignal
 from PyQt6.QtGui import QFont
 from PyQt6.QtWidgets import QHeaderView
 from PyQt6.QtPrintSupport import QPrinter, QPrintDialog
 from database import Database
-from models import Product, Customer, Transaction, Cart
+from models import Product, Customer, Transaction, Cart, new_idempotency_key
 from datetime import datetime
 from models import ReturnRefund
 from return_refund_dialog import ReturnRefundDialog
+from catalog_store import get_catalog_store
+from receipt_renderer import ReceiptRenderer, context_from_rows, context_from_data, render_text
+from till_queue import TillQueue, InsufficientStockError
+import model_events
 
 class StaffWindow(QMainWindow):
+    # Emitted from the till sync worker thread, handled on the GUI thread
+    till_synced = pyqtSignal(object)
+    
+    TILL_SYNC_INTERVAL_MS = 5000
+    
     def __init__(self, db: Database, user):
         super().__init__()
         self.db = db
@@ -18,6 +28,10 @@ class StaffWindow(QMainWindow):
         self.product_model = Product(db)
         self.customer_model = Customer(db)
         self.transaction_model = Transaction(db)
+        self.catalog = get_catalog_store(db)
+        self.receipts = ReceiptRenderer(db)
+        self.till_queue = TillQueue(db)
+        self.till_sync_running = False
         self.cart_items = []
         self.selected_customer = None
         
@@ -25,6 +39,58 @@ class StaffWindow(QMainWindow):
         self.setMinimumSize(1280, 650)
         self.setup_ui()
         self.apply_styles()
+        self.catalog.products_changed.connect(self.on_catalog_changed)
+        self.catalog.products_reset.connect(self.on_catalog_changed)
+        
+        # Background sync of the offline till queue
+        self.till_synced.connect(self.on_till_synced)
+        self.till_timer = QTimer(self)
+        self.till_timer.timeout.connect(self.start_till_sync)
+        self.till_timer.start(self.TILL_SYNC_INTERVAL_MS)
+        self.start_till_sync()
+    
+    # ---------------------------------------------------
+    # Offline till queue
+    # ---------------------------------------------------
+    def known_stock(self, product_id):
+        """Last known central stock for a product (from the shared catalog)"""
+        product = self.catalog.get(product_id)
+        return product.stock if product else 0
+    
+    def start_till_sync(self):
+        """Push queued sales to the central DB without blocking the till"""
+        if self.till_sync_running:
+            return
+        self.till_sync_running = True
+        threading.Thread(target=self._run_till_sync, daemon=True).start()
+    
+    def _run_till_sync(self):
+        try:
+            result = self.till_queue.sync()
+        except Exception as e:
+            result = None
+            print(f"Till sync error: {e}")
+        self.till_synced.emit(result)
+    
+    def on_till_synced(self, result):
+        self.till_sync_running = False
+        if result is None:
+            return
+        if result.product_ids:
+            # Central stock changed - refresh the shared catalog on the GUI thread
+            model_events.products_changed(result.product_ids)
+        
+        pending = self.till_queue.pending_count()
+        if result.offline:
+            self.statusBar().showMessage(f"⚠️ Database unreachable - {pending} sale(s) queued on this till")
+        elif pending:
+            self.statusBar().showMessage(f"⏳ {pending} sale(s) waiting to sync")
+        elif result.synced:
+            self.statusBar().showMessage(f"✓ {result.synced} queued sale(s) synced", 5000)
+        if result.failed:
+            QMessageBox.warning(self, "Sync Problem",
+                                f"{result.failed} queued sale(s) were rejected by the database "
+                                f"and need manual review.")
     
     def setup_ui(self):
         central_widget = QWidget()
@@ -131,50 +197,7 @@ class StaffWindow(QMainWindow):
         dialog.exec()
 
     def generate_receipt_content(self, transaction, items):
-        receipt = "=" * 60 + "\n"
-        receipt += "           🏪 TECHHAVEN ELECTRONIC STORE\n"
-        receipt += "         Your One-Stop Technology Shop\n"
-        receipt += "     123 Tech Avenue, Tech City, TC 12345\n"
-        receipt += "          Phone: (555) 123-4567\n"
-        receipt += "         Email: info@techhaven.com\n"
-        receipt += "=" * 60 + "\n\n"
-        
-        receipt += f"Transaction ID: {transaction[0]:06d}\n"
-        receipt += f"Date & Time: {transaction[8]}\n"
-        receipt += f"Customer: {transaction[9] if transaction[9] else 'Walk-in Customer'}\n"
-        receipt += f"Processed by: {transaction[10]}\n"
-        receipt += f"Payment Method: {transaction[6]}\n"
-        receipt += "-" * 60 + "\n\n"
-        
-        receipt += "ITEMS PURCHASED:\n"
-        receipt += "-" * 60 + "\n"
-        receipt += f"{'Item':<35} {'Qty':>5} {'Price':>8} {'Total':>10}\n"
-        receipt += "-" * 60 + "\n"
-        
-        for item in items:
-            item_name = item[6][:35]
-            receipt += f"{item_name:<35} {item[3]:>5} ${item[4]:>7.2f} ${item[5]:>9.2f}\n"
-        
-        subtotal = transaction[3] + transaction[4] - transaction[5]
-        
-        receipt += "-" * 60 + "\n"
-        receipt += f"{'Subtotal:':<50} ${subtotal:>8.2f}\n"
-        receipt += f"{'Discount:':<50} ${transaction[4]:>8.2f}\n"
-        receipt += f"{'Tax (10%):':<50} ${transaction[5]:>8.2f}\n"
-        receipt += "=" * 60 + "\n"
-        receipt += f"{'TOTAL AMOUNT:':<50} ${transaction[3]:>8.2f}\n"
-        receipt += "=" * 60 + "\n\n"
-        
-        receipt += "         Thank you for shopping with TechHaven!\n"
-        receipt += "      Visit us again for all your tech needs!\n"
-        receipt += "                www.techhaven.com\n"
-        receipt += "=" * 60 + "\n"
-        
-        receipt += "\nRETURN POLICY:\n"
-        receipt += "Products may be returned within 30 days with receipt\n"
-        receipt += "and in original packaging. Conditions apply.\n"
-        
-        return receipt
+        return render_text(context_from_rows(transaction, items))
 
 
     def print_receipt(self, content):
@@ -276,9 +299,23 @@ class StaffWindow(QMainWindow):
         return panel
     
     def load_products(self):
-        products = self.product_model.get_all_products()
+        products = self.catalog.products()
         self.all_products = products
         self.display_products(products)
+
+    def on_catalog_changed(self, product_ids=None):
+        """Shared catalog changed (sale, return, admin edit) - re-apply current filter"""
+        self.all_products = self.catalog.products()
+        self.filter_products()
+
+    def closeEvent(self, event):
+        # Stop listening to the shared catalog once this window is gone
+        try:
+            self.catalog.products_changed.disconnect(self.on_catalog_changed)
+            self.catalog.products_reset.disconnect(self.on_catalog_changed)
+        except TypeError:
+            pass
+        super().closeEvent(event)
     
     def display_products(self, products):
         self.products_table.setRowCount(len(products))
@@ -340,10 +377,13 @@ class StaffWindow(QMainWindow):
         self.display_products(filtered)
     
     def add_to_cart(self, product):
+        # Stock minus units sold on this till that are not yet synced
+        available = self.till_queue.available(product[0], product[4])
+        
         # Check if product already in cart
         for item in self.cart_items:
             if item['product_id'] == product[0]:
-                if item['quantity'] < product[4]:
+                if item['quantity'] < available:
                     item['quantity'] += 1
                     self.update_cart_display()
                 else:
@@ -351,13 +391,17 @@ class StaffWindow(QMainWindow):
                                        "Cannot add more items than available in stock!")
                 return
         
+        if available <= 0:
+            QMessageBox.warning(self, "Stock Limit", "No stock available for this product!")
+            return
+        
         # Add new item to cart
         self.cart_items.append({
             'product_id': product[0],
             'name': product[1],
             'price': product[3],
             'quantity': 1,
-            'stock': product[4]
+            'stock': available
         })
         
         self.update_cart_display()
@@ -446,7 +490,7 @@ class StaffWindow(QMainWindow):
             self.selected_customer = None
             self.customer_label.setText("👤 Walk-in Customer")
             self.update_cart_display()
-            self.load_products()  # Refresh product stock
+            # Product stock is refreshed through the shared catalog store
     
     def apply_styles(self):
         self.setStyleSheet("""
@@ -529,7 +573,6 @@ class StaffWindow(QMainWindow):
         """Open returns/refunds dialog"""
         dialog = ReturnRefundDialog(self, self.db, self.user)
         if dialog.exec():
-            self.load_products()  # Refresh products after return
             QMessageBox.information(self, "Success", "Return processed successfully!")
 
 class CustomerSelectionDialog(QDialog):
@@ -625,6 +668,8 @@ class CheckoutDialog(QDialog):
         self.customer = customer
         self.staff = staff
         self.transaction_model = Transaction(db)
+        # One key per order - every attempt to complete it reuses the same key
+        self.order_key = new_idempotency_key()
         
         self.setWindowTitle("Checkout")
         self.setMinimumSize(600, 600)
@@ -917,42 +962,74 @@ class CheckoutDialog(QDialog):
                                    "Please enter a valid CVV (3-4 digits)!")
                 return
         
+        # Block double submits while this attempt is in progress
+        self.complete_btn.setEnabled(False)
         try:
-            # Create transaction
+            # Record the sale on the till (local journal) - synced to the DB in the background
             customer_id = self.customer[0] if self.customer else None
             discount_rate = self.discount / self.subtotal if self.subtotal > 0 else 0
             
-            transaction_id = self.transaction_model.create_transaction(
-                customer_id, self.staff['user_id'], self.cart_items, 
-                payment_method, discount_rate
-            )
-            
-            # Clear pending discount after successful purchase
-            if self.customer and self.pending_discount > 0:
-                conn = self.db.get_connection()
-                cursor = conn.cursor()
-                cursor.execute("""
-                    UPDATE customers 
-                    SET pending_discount = 0.00
-                    WHERE customer_id = %s
-                """, (self.customer[0],))
-                conn.commit()
-                cursor.close()
-                conn.close()
+            till = self.parent().till_queue
+            # A redeemed-points discount is claimed centrally now, not when the sale syncs
+            use_pending = self.customer is not None and self.pending_discount > 0
+            if use_pending:
+                claimed, message = till.claim_pending_discount(customer_id, self.pending_discount)
+                if not claimed:
+                    QMessageBox.warning(self, "Points Discount", message)
+                    self.complete_btn.setEnabled(True)
+                    return
+            try:
+                local_id, _ = till.enqueue_sale(
+                    customer_id, self.staff['user_id'], self.cart_items,
+                    payment_method, discount_rate,
+                    stock_lookup=self.parent().known_stock,
+                    idempotency_key=self.order_key
+                )
+            except Exception:
+                if use_pending:
+                    till.release_pending_discount(customer_id, self.pending_discount)
+                raise
+            self.parent().start_till_sync()
             
             # Generate and show receipt
-            self.show_receipt(transaction_id)
+            receipt_number = till.receipt_number(local_id)
+            self.show_local_receipt(receipt_number, payment_method, discount_rate)
             
             QMessageBox.information(self, "Success", 
-                                   f"Transaction completed successfully!\nTransaction ID: {transaction_id}")
+                                   f"Transaction completed successfully!\nTill Receipt: #{receipt_number}")
             self.accept()
             
+        except InsufficientStockError as e:
+            QMessageBox.warning(self, "Stock Limit", str(e))
+            self.complete_btn.setEnabled(True)
         except Exception as e:
             QMessageBox.critical(self, "Error", f"Transaction failed: {str(e)}")
+            self.complete_btn.setEnabled(True)
+    
+    def show_local_receipt(self, receipt_number, payment_method, discount_rate):
+        """Receipt for a sale recorded on the till (before it reaches the central DB)"""
+        subtotal, discount, tax, total = Transaction.compute_totals(self.cart_items, discount_rate)
+        receipt_content = render_text(context_from_data({
+            "transaction_id": 0,
+            "reference": receipt_number,
+            "reference_label": "Till Receipt",
+            "date": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "customer": self.customer[2] if self.customer else None,
+            "staff": self.staff['full_name'],
+            "payment_method": payment_method,
+            "items": self.cart_items,
+            "subtotal": subtotal,
+            "discount": discount,
+            "tax": tax,
+            "total": total,
+        }))
+        self.show_receipt_text(receipt_content)
     
     def show_receipt(self, transaction_id):
-        transaction, items = self.transaction_model.get_transaction(transaction_id)
-        
+        # Rendered (and cached) by StaffWindow's receipt renderer
+        self.show_receipt_text(self.parent().receipts.render(transaction_id))
+    
+    def show_receipt_text(self, receipt_content):
         receipt_dialog = QDialog(self)
         receipt_dialog.setWindowTitle("Receipt")
         receipt_dialog.setMinimumSize(500, 600)
@@ -963,8 +1040,6 @@ class CheckoutDialog(QDialog):
         receipt_text.setReadOnly(True)
         receipt_text.setFont(QFont("Courier New", 10))
         
-        # ✅ FIX: call StaffWindow's method, NOT CheckoutDialog
-        receipt_content = self.parent().generate_receipt_content(transaction, items)
         receipt_text.setPlainText(receipt_content)
         
         layout.addWidget(receipt_text)
@@ -1094,10 +1169,8 @@ class SalesHistoryDialog(QDialog):
         row = self.table.currentRow()
         tx_id = int(self.table.item(row, 0).text())
 
-        # Reuse your existing receipt generator
-        transaction, items = self.transaction_model.get_transaction(tx_id)
-
-        receipt_text = self.parent().generate_receipt_content(transaction, items)
+        # Reuse the window's receipt renderer (cached per transaction)
+        receipt_text = self.parent().receipts.render(tx_id)
 
         receipt_dialog = QDialog(self)
         receipt_dialog.setWindowTitle(f"Receipt #{tx_id}")
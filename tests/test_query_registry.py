@@ -0,0 +1,54 @@
+import gc
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from query_log import InstrumentedConnection, QueryLog
+from query_registry import QueryRegistry
+
+
+class FakeCursor:
+    rowcount = 0
+    with_rows = False
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def execute(self, operation, params=None):
+        pass
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    def cursor(self, *args, **kwargs):
+        return FakeCursor(self)
+
+    def commit(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class PreparedCursorCacheTest(unittest.TestCase):
+    def test_instrumented_connections_are_not_kept_alive_by_the_cache(self):
+        registry = QueryRegistry()
+        registry.define("ping", "SELECT 1")
+        log = QueryLog(enabled=True)
+
+        for _ in range(100):
+            conn = InstrumentedConnection(FakeConnection(), log)
+            registry.execute(conn, "ping")
+            conn.close()
+        del conn
+        gc.collect()
+
+        self.assertEqual(len(registry._prepared), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,317 @@
+import json
+import os
+import sqlite3
+import time
+from decimal import Decimal
+import mysql.connector
+import metrics
+from auth import LOCAL_CLIENT
+from models import Transaction, count_sale, new_idempotency_key
+
+# =============================================================================
+# OFFLINE TILL QUEUE
+# Sales are written to a local SQLite journal first (durable, sub-millisecond)
+# and synced to MySQL in batches afterwards. Each sale carries a client-made
+# idempotency key, so a sync that is retried after a timeout or crash can never
+# record the same sale twice. Units sold locally but not yet synced are held
+# as reservations so the till does not oversell its last known stock. A
+# redeemed-points discount is claimed in the central DB when the sale is
+# queued (never later), so it cannot be spent again before the sale syncs.
+# =============================================================================
+DEFAULT_QUEUE_PATH = os.environ.get(
+    "TECHHAVEN_TILL_QUEUE",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "till_queue.db"),
+)
+
+
+class InsufficientStockError(ValueError):
+    pass
+
+
+class SyncResult:
+    def __init__(self):
+        self.synced = 0
+        self.failed = 0
+        self.transaction_ids = {}
+        self.product_ids = set()
+        self.offline = False
+        self.error = None
+
+    def __bool__(self):
+        return bool(self.synced or self.failed)
+
+
+class TillQueue:
+    def __init__(self, db, path=DEFAULT_QUEUE_PATH):
+        self.db = db
+        self.path = path
+        self.transaction_model = Transaction(db)
+        self._init_journal()
+
+    # ---------------------------------------------------
+    # Local journal
+    # ---------------------------------------------------
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=10)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=FULL")
+        return conn
+
+    def _init_journal(self):
+        conn = self._connect()
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS queued_sales (
+                local_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                idempotency_key TEXT NOT NULL UNIQUE,
+                payload TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                transaction_id INTEGER,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                last_error TEXT,
+                created_at REAL NOT NULL,
+                synced_at REAL
+            );
+            CREATE INDEX IF NOT EXISTS idx_queued_status ON queued_sales (status, local_id);
+            CREATE TABLE IF NOT EXISTS stock_reservations (
+                product_id INTEGER PRIMARY KEY,
+                reserved INTEGER NOT NULL
+            );
+        """)
+        conn.commit()
+        conn.close()
+
+    def reserved(self, product_id):
+        conn = self._connect()
+        row = conn.execute("SELECT reserved FROM stock_reservations WHERE product_id = ?",
+                           (product_id,)).fetchone()
+        conn.close()
+        return row[0] if row else 0
+
+    def available(self, product_id, known_stock):
+        """Last known central stock minus units sold here but not yet synced"""
+        return known_stock - self.reserved(product_id)
+
+    def enqueue_sale(self, customer_id, staff_id, items, payment_method, discount=0,
+                     clear_pending_discount=False, stock_lookup=None, idempotency_key=None):
+        """
+        Record a sale locally. stock_lookup(product_id) -> last known stock is used
+        to refuse overselling. Enqueueing an idempotency_key that is already in the
+        journal returns the queued sale unchanged. Returns (local_id, idempotency_key).
+        """
+        key = idempotency_key or new_idempotency_key()
+        payload = json.dumps({
+            "customer_id": customer_id,
+            "staff_id": staff_id,
+            "items": [{"product_id": item["product_id"], "name": item.get("name", ""),
+                       "price": str(item["price"]), "quantity": int(item["quantity"])}
+                      for item in items],
+            "payment_method": payment_method,
+            "discount": str(discount),
+            "clear_pending_discount": bool(clear_pending_discount),
+        })
+
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("SELECT local_id FROM queued_sales WHERE idempotency_key = ?", (key,)).fetchone()
+            if row:
+                conn.rollback()
+                return row[0], key
+            for item in items:
+                product_id, qty = item["product_id"], int(item["quantity"])
+                row = conn.execute("SELECT reserved FROM stock_reservations WHERE product_id = ?",
+                                   (product_id,)).fetchone()
+                reserved = row[0] if row else 0
+                if stock_lookup is not None and reserved + qty > stock_lookup(product_id):
+                    raise InsufficientStockError(f"Not enough stock for {item.get('name', product_id)}")
+                conn.execute("""
+                    INSERT INTO stock_reservations (product_id, reserved) VALUES (?, ?)
+                    ON CONFLICT(product_id) DO UPDATE SET reserved = reserved + excluded.reserved
+                """, (product_id, qty))
+            cursor = conn.execute(
+                "INSERT INTO queued_sales (idempotency_key, payload, created_at) VALUES (?, ?, ?)",
+                (key, payload, time.time())
+            )
+            local_id = cursor.lastrowid
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+        return local_id, key
+
+    def receipt_number(self, local_id):
+        """Receipt reference for a queued sale, unique across tills"""
+        return f"{LOCAL_CLIENT}-{local_id:06d}"
+
+    # ---------------------------------------------------
+    # Redeemed-points discounts
+    # ---------------------------------------------------
+    def claim_pending_discount(self, customer_id, amount):
+        """
+        Clear the customer's pending discount centrally, provided it is still
+        `amount`; returns (success, message). Needs the central DB: a discount
+        cannot be spent offline, since nothing else could stop a second use.
+        """
+        try:
+            conn = self.db.get_connection()
+        except mysql.connector.Error:
+            return False, "The points discount needs the central database, which is unreachable."
+        try:
+            cursor = conn.cursor()
+            cursor.execute("""
+                UPDATE customers SET pending_discount = 0.00
+                WHERE customer_id = %s AND pending_discount = %s
+            """, (customer_id, amount))
+            conn.commit()
+            if cursor.rowcount != 1:
+                return False, "The points discount has already been used."
+            return True, "Discount claimed"
+        except mysql.connector.Error as e:
+            conn.rollback()
+            return False, f"Could not claim the points discount: {e}"
+        finally:
+            conn.close()
+
+    def release_pending_discount(self, customer_id, amount):
+        """Give back a discount claimed for a sale that was then not queued"""
+        conn = self.db.get_connection()
+        try:
+            conn.cursor().execute("""
+                UPDATE customers SET pending_discount = %s
+                WHERE customer_id = %s AND pending_discount = 0
+            """, (amount, customer_id))
+            conn.commit()
+        finally:
+            conn.close()
+
+    def pending_count(self):
+        conn = self._connect()
+        count = conn.execute("SELECT COUNT(*) FROM queued_sales WHERE status = 'pending'").fetchone()[0]
+        conn.close()
+        return count
+
+    def get_transaction_id(self, local_id):
+        """Central transaction id of a queued sale once it has synced (else None)"""
+        conn = self._connect()
+        row = conn.execute("SELECT transaction_id FROM queued_sales WHERE local_id = ?", (local_id,)).fetchone()
+        conn.close()
+        return row[0] if row else None
+
+    # ---------------------------------------------------
+    # Sync to the central database
+    # ---------------------------------------------------
+    def sync(self, batch_size=50, max_batches=None):
+        """
+        Push pending sales to MySQL, oldest first, one DB transaction per batch.
+        If a batch fails it is retried sale by sale so one bad sale cannot block
+        the queue. Safe to call from a worker thread and to call repeatedly.
+        """
+        result = SyncResult()
+        batches = 0
+        while max_batches is None or batches < max_batches:
+            conn = self._connect()
+            rows = conn.execute("""
+                SELECT local_id, idempotency_key, payload FROM queued_sales
+                WHERE status = 'pending' ORDER BY local_id LIMIT ?
+            """, (batch_size,)).fetchall()
+            conn.close()
+            if not rows:
+                break
+
+            try:
+                db_conn = self.db.get_connection()
+            except mysql.connector.Error as e:
+                result.offline = True
+                result.error = str(e)
+                break
+
+            try:
+                try:
+                    synced = [self._push(db_conn.cursor(), row) for row in rows]
+                    db_conn.commit()
+                except mysql.connector.Error:
+                    db_conn.rollback()
+                    synced = []
+                    for row in rows:
+                        try:
+                            synced.append(self._push(db_conn.cursor(), row))
+                            db_conn.commit()
+                        except mysql.connector.Error as e:
+                            db_conn.rollback()
+                            if not db_conn.is_connected():
+                                raise
+                            self._mark_failed(row, str(e))
+                            result.failed += 1
+            except mysql.connector.Error as e:
+                result.offline = True
+                result.error = str(e)
+                synced = []
+            finally:
+                try:
+                    db_conn.close()
+                except mysql.connector.Error:
+                    pass
+
+            self._mark_synced(synced, result)
+            batches += 1
+            if result.offline or len(rows) < batch_size:
+                break
+        return result
+
+    def _push(self, cursor, row):
+        local_id, key, payload = row
+        sale = json.loads(payload)
+        items = [{"product_id": i["product_id"], "price": Decimal(i["price"]), "quantity": i["quantity"]}
+                 for i in sale["items"]]
+        transaction_id, created, seconds = self.transaction_model.record_sale(
+            cursor, sale["customer_id"], sale["staff_id"], items, sale["payment_method"],
+            Decimal(sale["discount"]), key, sale["clear_pending_discount"]
+        )
+        return local_id, transaction_id, items, (created, seconds)
+
+    def _mark_synced(self, synced, result):
+        if not synced:
+            return
+        conn = self._connect()
+        try:
+            now = time.time()
+            for local_id, transaction_id, items, _ in synced:
+                conn.execute("""
+                    UPDATE queued_sales SET status = 'synced', transaction_id = ?, synced_at = ?,
+                           attempts = attempts + 1
+                    WHERE local_id = ?
+                """, (transaction_id, now, local_id))
+                for item in items:
+                    conn.execute("UPDATE stock_reservations SET reserved = reserved - ? WHERE product_id = ?",
+                                 (item["quantity"], item["product_id"]))
+                    result.product_ids.add(item["product_id"])
+                result.transaction_ids[local_id] = transaction_id
+            conn.execute("DELETE FROM stock_reservations WHERE reserved <= 0")
+            conn.commit()
+        finally:
+            conn.close()
+        result.synced += len(synced)
+        metrics.TILL_SYNCED.inc(len(synced))
+        # Only now: sales pushed in a batch that was rolled back are pushed (and timed) again
+        for _, _, _, (created, seconds) in synced:
+            count_sale("till", created, seconds)
+
+    def _mark_failed(self, row, error):
+        """Park a sale the central DB rejects (e.g. deleted customer) for manual review"""
+        local_id, _, payload = row
+        conn = self._connect()
+        try:
+            conn.execute("""
+                UPDATE queued_sales SET status = 'failed', last_error = ?, attempts = attempts + 1
+                WHERE local_id = ?
+            """, (error, local_id))
+            for item in json.loads(payload)["items"]:
+                conn.execute("UPDATE stock_reservations SET reserved = reserved - ? WHERE product_id = ?",
+                             (item["quantity"], item["product_id"]))
+            conn.execute("DELETE FROM stock_reservations WHERE reserved <= 0")
+            conn.commit()
+        finally:
+            conn.close()
+        metrics.TILL_SYNC_FAILED.inc()
@@ -0,0 +1,271 @@
+import functools
+import inspect
+import json
+import os
+import sys
+import threading
+import time
+from PyQt6.QtWidgets import QDialog, QFileDialog, QLabel, QMainWindow, QMessageBox, QWidget
+from PyQt6.QtCore import QObject, QEvent, QTimer, Qt
+from PyQt6.QtGui import QKeySequence, QShortcut
+
+# =============================================================================
+# UI PROFILER
+# Opt-in instrumentation for the PyQt windows (TECHHAVEN_UI_PROFILE=1 or a
+# trace file path):
+#   * event-loop blocking - a 20 ms heartbeat timer on the main thread; a late
+#     beat is a stall. A watchdog thread samples the main thread's Python stack
+#     while the stall is in progress, so each stall names the code that caused it.
+#   * refresh_* / display_* / generate_* / load_* methods of every window class
+#     are timed.
+#   * widget counts per top-level window, sampled once a second.
+# Results are shown in an overlay (Ctrl+Shift+P toggles it) and written as a
+# Chrome trace (chrome://tracing, Perfetto) when the application quits.
+# =============================================================================
+PROFILE_ENV = "TECHHAVEN_UI_PROFILE"
+DEFAULT_TRACE_PATH = "ui_trace.json"
+STALL_MS = float(os.environ.get("TECHHAVEN_UI_STALL_MS", "100"))
+HEARTBEAT_MS = 20
+SAMPLE_MS = 1000
+MAX_EVENTS = 200000
+PROFILED_PREFIXES = ("refresh_", "display_", "generate_", "load_")
+WINDOW_MODULES = ("admin_window", "staff_window", "customer_window", "comprehensive_reports",
+                  "loyalty_points_widget", "receipt_dialog")
+
+_PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def enabled():
+    return os.environ.get(PROFILE_ENV, "") not in ("", "0")
+
+
+def _project_stack(frame, limit=6):
+    """Innermost frames that belong to this application, as 'file:line func'"""
+    stack = []
+    while frame is not None and len(stack) < limit:
+        filename = os.path.abspath(frame.f_code.co_filename)
+        if filename.startswith(_PROJECT_DIR) and filename != os.path.abspath(__file__):
+            stack.append(f"{os.path.basename(filename)}:{frame.f_lineno} {frame.f_code.co_name}")
+        frame = frame.f_back
+    return stack
+
+
+class MethodStats:
+    def __init__(self):
+        self.calls = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+
+class UiProfiler(QObject):
+    def __init__(self, app, trace_path=DEFAULT_TRACE_PATH, stall_ms=STALL_MS):
+        super().__init__()
+        self.app = app
+        self.trace_path = trace_path
+        self.stall_ms = stall_ms
+        self.started = time.perf_counter()
+        self.pid = os.getpid()
+        self.main_thread = threading.get_ident()
+        self.events = []
+        self.methods = {}
+        self.windows = []
+        self.overlays = {}
+        self.last_stall = None
+        self._lock = threading.Lock()
+
+        # Event-loop heartbeat + watchdog
+        self._last_beat = time.perf_counter()
+        self._stall_stack = None
+        self.heartbeat = QTimer(self)
+        self.heartbeat.timeout.connect(self._beat)
+        self.heartbeat.start(HEARTBEAT_MS)
+        self._watchdog = threading.Thread(target=self._watch, daemon=True)
+        self._watchdog.start()
+
+        # Widget counts + overlay refresh
+        self.sampler = QTimer(self)
+        self.sampler.timeout.connect(self._sample_windows)
+        self.sampler.start(SAMPLE_MS)
+
+        app.installEventFilter(self)
+        app.aboutToQuit.connect(self.write_trace)
+
+    # ---------------------------------------------------
+    # Trace events
+    # ---------------------------------------------------
+    def _ts(self, moment):
+        return (moment - self.started) * 1_000_000
+
+    def _add(self, event):
+        with self._lock:
+            if len(self.events) < MAX_EVENTS:
+                self.events.append(event)
+
+    def span(self, name, category, start, duration, args=None):
+        self._add({"name": name, "cat": category, "ph": "X", "ts": self._ts(start),
+                   "dur": duration * 1_000_000, "pid": self.pid, "tid": threading.get_ident(),
+                   "args": args or {}})
+
+    def counter(self, name, values):
+        self._add({"name": name, "ph": "C", "ts": self._ts(time.perf_counter()),
+                   "pid": self.pid, "args": values})
+
+    # ---------------------------------------------------
+    # Event-loop blocking
+    # ---------------------------------------------------
+    def _beat(self):
+        now = time.perf_counter()
+        blocked_ms = (now - self._last_beat) * 1000 - HEARTBEAT_MS
+        if blocked_ms >= self.stall_ms:
+            stack = self._stall_stack or []
+            self.span("Event loop blocked", "stall", self._last_beat, now - self._last_beat,
+                      {"blocked_ms": round(blocked_ms, 1), "stack": stack})
+            self.last_stall = (blocked_ms, stack[0] if stack else "?")
+        self._stall_stack = None
+        self._last_beat = now
+
+    def _watch(self):
+        interval = max(self.stall_ms / 2000, 0.01)
+        while True:
+            time.sleep(interval)
+            if (time.perf_counter() - self._last_beat) * 1000 < self.stall_ms:
+                continue
+            frame = sys._current_frames().get(self.main_thread)
+            stack = _project_stack(frame)
+            if stack:
+                # Keep the deepest sample seen during this stall
+                self._stall_stack = stack
+
+    # ---------------------------------------------------
+    # Method timing
+    # ---------------------------------------------------
+    def profile_class(self, cls, prefixes=PROFILED_PREFIXES):
+        for name, function in list(vars(cls).items()):
+            if (inspect.isfunction(function) and name.startswith(prefixes)
+                    and not hasattr(function, "__profiled__")):
+                setattr(cls, name, self._wrap(f"{cls.__name__}.{name}", function))
+
+    def _wrap(self, label, function):
+        # Qt passes every signal argument to a *args wrapper (e.g. clicked's
+        # `checked`), so trim to what the real method accepts
+        try:
+            parameters = inspect.signature(function).parameters.values()
+            accepts_varargs = any(p.kind == p.VAR_POSITIONAL for p in parameters)
+            max_args = None if accepts_varargs else sum(
+                p.kind in (p.POSITIONAL_ONLY, p.POSITIONAL_OR_KEYWORD) for p in parameters)
+        except (TypeError, ValueError):
+            max_args = None
+        stats = self.methods.setdefault(label, MethodStats())
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if max_args is not None:
+                args = args[:max_args]
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                duration = time.perf_counter() - start
+                stats.calls += 1
+                stats.total_ms += duration * 1000
+                stats.max_ms = max(stats.max_ms, duration * 1000)
+                self.span(label, "method", start, duration)
+
+        wrapper.__profiled__ = True
+        return wrapper
+
+    # ---------------------------------------------------
+    # Windows: widget counts + overlay
+    # ---------------------------------------------------
+    def eventFilter(self, obj, event):
+        if (event.type() == QEvent.Type.Show and isinstance(obj, (QMainWindow, QDialog))
+                and not isinstance(obj, (QMessageBox, QFileDialog)) and obj not in self.windows):
+            self._track(obj)
+        return False
+
+    def _track(self, window):
+        self.windows.append(window)
+        overlay = QLabel(window)
+        overlay.setAttribute(Qt.WidgetAttribute.WA_TransparentForMouseEvents)
+        overlay.setStyleSheet("background-color: rgba(0, 0, 0, 170); color: #00E676;"
+                              "font-family: 'Courier New'; font-size: 9pt; padding: 6px;")
+        overlay.show()
+        self.overlays[window] = overlay
+        shortcut = QShortcut(QKeySequence("Ctrl+Shift+P"), window)
+        shortcut.activated.connect(lambda: overlay.setVisible(not overlay.isVisible()))
+        window.destroyed.connect(lambda *_: self._untrack(window))
+
+    def _untrack(self, window):
+        if window in self.windows:
+            self.windows.remove(window)
+        self.overlays.pop(window, None)
+
+    def _sample_windows(self):
+        counts = {}
+        for window in list(self.windows):
+            try:
+                title = window.windowTitle() or type(window).__name__
+                counts[title] = len(window.findChildren(QWidget))
+            except RuntimeError:
+                # Underlying C++ window already deleted
+                self._untrack(window)
+                continue
+            self._update_overlay(window, counts[title])
+        if counts:
+            self.counter("widgets", counts)
+
+    def _update_overlay(self, window, widget_count):
+        overlay = self.overlays.get(window)
+        if overlay is None or not overlay.isVisible():
+            return
+        lines = [f"UI profile   widgets: {widget_count}"]
+        if self.last_stall:
+            blocked_ms, where = self.last_stall
+            lines.append(f"last stall: {blocked_ms:.0f} ms  {where}")
+        slowest = sorted(self.methods.items(), key=lambda item: item[1].max_ms, reverse=True)[:3]
+        for label, stats in slowest:
+            if stats.calls:
+                lines.append(f"{label}: max {stats.max_ms:.0f} ms, {stats.calls} calls")
+        overlay.setText("\n".join(lines))
+        overlay.adjustSize()
+        overlay.move(window.width() - overlay.width() - 10, 10)
+        overlay.raise_()
+
+    # ---------------------------------------------------
+    # Output
+    # ---------------------------------------------------
+    def write_trace(self, path=None):
+        path = path or self.trace_path
+        with self._lock:
+            events = list(self.events)
+        events.append({"name": "thread_name", "ph": "M", "pid": self.pid, "tid": self.main_thread,
+                       "args": {"name": "Qt main thread"}})
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+        print(f"UI trace written to {path} ({len(events)} events)")
+        return path
+
+
+_profiler = None
+
+
+def install(app):
+    """Start profiling and instrument every window class in WINDOW_MODULES"""
+    global _profiler
+    if _profiler is not None:
+        return _profiler
+    setting = os.environ.get(PROFILE_ENV, "")
+    trace_path = setting if setting not in ("", "0", "1") else DEFAULT_TRACE_PATH
+    _profiler = UiProfiler(app, trace_path)
+
+    for module_name in WINDOW_MODULES:
+        module = __import__(module_name)
+        for value in vars(module).values():
+            if (isinstance(value, type) and issubclass(value, QWidget)
+                    and value.__module__ == module_name):
+                _profiler.profile_class(value)
+    return _profiler
+
+
+def get_profiler():
+    return _profiler